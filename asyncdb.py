@@ -0,0 +1,202 @@
+import asyncio
+from itertools import cycle, islice
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional, TypeVar
+
+from config import config
+from federation import Shard
+from note import Note
+from notesdb import NotesDB
+
+T = TypeVar("T")
+
+
+class AsyncNotesDB:
+    """NotesDB for asyncio code, running the blocking SQLite calls on threads
+
+    Writes go through one read-write connection and reads are spread over a
+    pool of read-only connections, each owned by a thread of its own (see
+    `federation.Shard`), so concurrent queries never block the event loop or
+    each other. Results are the same as NotesDB's.
+
+    Headline-only notes fetch their content with a short blocking call when
+    `text` is first accessed; use `load_content` to fetch it asynchronously.
+
+    Attributes:
+        db_file (str): The path to the SQLite file
+        readers (int): The number of read-only connections
+    """
+
+    def __init__(self, db_file: Optional[str] = None, readers: int = 4) -> None:
+        """Start opening the DB, without waiting for it
+
+        The read-only connections are opened on first read, after the
+        read-write connection has created or migrated the DB.
+
+        Args:
+            db_file (Optional[str]): The path to the SQLite file. Defaults to the configured `db_file`
+            readers (int): The number of read-only connections
+        """
+
+        self.db_file = db_file or config.get("db_file")
+        # every connection to :memory: is a separate DB, so share the writer
+        self.readers = 0 if self.db_file == ":memory:" else max(readers, 1)
+        self._writer = Shard(None, self.db_file, readonly=False)
+        self._readers: Optional[Iterator[Shard]] = None
+        self._shards = [self._writer]
+
+    async def __aenter__(self) -> "AsyncNotesDB":
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self.close()
+
+    async def _reader(self) -> Shard:
+        """The next connection to read from, round robin over the pool"""
+
+        if self._readers is None:
+            await asyncio.wrap_future(self._writer.opened)
+            if self._readers is None:
+                shards = [Shard(None, self.db_file) for _ in range(self.readers)]
+                self._shards += shards
+                self._readers = cycle(shards or [self._writer])
+        return next(self._readers)
+
+    async def _read(self, fn: Callable[[NotesDB], T]) -> T:
+        """Call fn with a read-only NotesDB on its thread"""
+
+        return await asyncio.wrap_future((await self._reader()).submit(fn))
+
+    async def _stream(
+        self, query: Callable[[NotesDB], Iterable[Note]]
+    ) -> AsyncIterator[Note]:
+        """Stream the notes of a query, fetched `FETCH_SIZE` at a time on its thread
+
+        Args:
+            query (Callable[[NotesDB], Iterable[Note]]): Called with the NotesDB,
+                returns the notes as NotesDB's `iter_*` methods do
+
+        Yields:
+            Note: The notes, as they are fetched
+        """
+
+        shard = await self._reader()
+        notes = iter(await asyncio.wrap_future(shard.submit(query)))
+        try:
+            while chunk := await asyncio.wrap_future(
+                shard.submit(lambda db: list(islice(notes, NotesDB.FETCH_SIZE)))
+            ):
+                for note in chunk:
+                    yield note
+        finally:
+            if hasattr(notes, "close"):
+                await asyncio.wrap_future(shard.submit(lambda db: notes.close()))
+
+    async def add(self, notes: Iterable[Note], batch_size: int = 1000) -> int:
+        """Save notes to the DB, see `NotesDB.add`"""
+
+        notes = list(notes)
+        return await asyncio.wrap_future(
+            self._writer.submit(lambda db: db.add(notes, batch_size))
+        )
+
+    async def load_content(self, id: int) -> str:
+        """Fetch the content of a single note, see `NotesDB.load_content`"""
+
+        return await self._read(lambda db: db.load_content(id))
+
+    def iter_notes(
+        self,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+    ) -> AsyncIterator[Note]:
+        """Stream all or the n most recent notes, see `NotesDB.iter_notes`"""
+
+        return self._stream(lambda db: db.iter_notes(n, before_id, after_id, brief))
+
+    async def get(
+        self,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+    ) -> Optional[list[Note]]:
+        """Get all or the n most recent notes, see `NotesDB.get`"""
+
+        return await self._read(lambda db: db.get(n, before_id, after_id, brief))
+
+    def iter_search(
+        self,
+        q: str,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+        lang: Optional[str] = None,
+    ) -> AsyncIterator[Note]:
+        """Stream the notes matching q, see `NotesDB.iter_search`
+
+        Raises:
+            ValueError: If both q and lang are empty, when iteration starts
+        """
+
+        return self._stream(
+            lambda db: db.iter_search(q, n, before_id, after_id, brief, lang)
+        )
+
+    async def search(
+        self,
+        q: str,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+        lang: Optional[str] = None,
+    ) -> Optional[list[Note]]:
+        """Get the notes matching q, see `NotesDB.search`"""
+
+        return await self._read(
+            lambda db: db.search(q, n, before_id, after_id, brief, lang)
+        )
+
+    async def code_blocks(
+        self, note: Note, lang: Optional[str] = None
+    ) -> list[tuple[str, str]]:
+        """Get the code blocks of a note, see `NotesDB.code_blocks`"""
+
+        return await self._read(lambda db: db.code_blocks(note, lang))
+
+    def iter_tagged(
+        self, tags: list[str], match_all: bool = True, brief: bool = False
+    ) -> AsyncIterator[Note]:
+        """Stream the notes carrying the given tags, see `NotesDB.iter_tagged`"""
+
+        return self._stream(lambda db: db.iter_tagged(tags, match_all, brief))
+
+    async def tagged(
+        self, tags: list[str], match_all: bool = True, brief: bool = False
+    ) -> Optional[list[Note]]:
+        """Get the notes carrying the given tags, see `NotesDB.tagged`"""
+
+        return await self._read(lambda db: db.tagged(tags, match_all, brief))
+
+    def iter_fuzzy(
+        self, q: str, n: int = 0, brief: bool = False
+    ) -> AsyncIterator[Note]:
+        """Stream the notes resembling q, see `NotesDB.iter_fuzzy`"""
+
+        return self._stream(lambda db: db.iter_fuzzy(q, n, brief))
+
+    async def fuzzy(
+        self, q: str, n: int = 0, brief: bool = False
+    ) -> Optional[list[Note]]:
+        """Get the notes resembling q, see `NotesDB.fuzzy`"""
+
+        return await self._read(lambda db: db.fuzzy(q, n, brief))
+
+    async def close(self) -> None:
+        """Close every connection and stop their threads"""
+
+        shards, self._shards = self._shards, []
+        await asyncio.gather(*(asyncio.to_thread(shard.close) for shard in shards))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from itertools import accumulate
+from typing import Callable, Iterator, Optional
+
+from config import config
+from note import Note
+from notesdb import NotesDB
+
+WORDS = (
+    "the a to of and in is for on with that this it as be by from at use when "
+    "how why file list string dict loop error test query index cache config "
+    "async await thread process socket request response parse format build "
+    "deploy docker git branch merge rebase commit shell path env variable "
+    "function class method module package import install version python bash "
+    "sql regex json yaml http server client timeout retry log debug trace"
+).split()
+
+TAGS = [f"tag{i}" for i in range(500)]
+
+CODE = {
+    "python": [
+        "import {w}\n\n\ndef {w}_{i}(items):\n    return [x for x in items if x]",
+        "with open('{w}.txt') as f:\n    for line in f:\n        print(line.strip())",
+        "async def {w}():\n    await asyncio.sleep({i})",
+    ],
+    "bash": [
+        'for f in *.{w}; do\n  echo "$f"\ndone',
+        "find . -name '*.{w}' -mtime -{i} | xargs grep -n TODO",
+    ],
+    "sql": [
+        "SELECT {w}, count(*) FROM t{i} GROUP BY {w} ORDER BY 2 DESC;",
+    ],
+}
+
+QUERIES = ["python", "async", "error handling", "docker build", "tag1", "zzzz"]
+FUZZY_QUERIES = ["asnyc", "pyhton", "dokcer"]
+
+
+def generate_corpus(n: int, seed: int = 0) -> Iterator[Note]:
+    """Generate a realistic synthetic corpus of notes
+
+    Notes mix prose paragraphs with fenced code blocks, and tags follow a
+    Zipf distribution, so a few tags are on most notes and most are rare.
+
+    Args:
+        n (int): The number of notes
+        seed (int): The random seed, so corpora are reproducible
+
+    Yields:
+        Note: The generated notes
+    """
+
+    rng = random.Random(seed)
+    tag_weights = list(accumulate(1 / rank**1.1 for rank in range(1, len(TAGS) + 1)))
+
+    for i in range(n):
+        name = " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).capitalize()
+        tags = set(rng.choices(TAGS, cum_weights=tag_weights, k=rng.randint(1, 4)))
+
+        lines = []
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.5:
+                lang = rng.choice(list(CODE))
+                snippet = rng.choice(CODE[lang])
+                lines.append(f"```{lang}")
+                lines.extend(snippet.format(w=rng.choice(WORDS), i=i).split("\n"))
+                lines.append("```")
+            else:
+                words = rng.choices(WORDS, k=rng.randint(10, 80))
+                lines.append(" ".join(words).capitalize() + ".")
+            lines.append("")
+
+        yield Note(name, sorted(tags), lines)
+
+
+def timed(fn: Callable[[], int]) -> dict:
+    """Time a benchmark function returning the number of items it processed
+
+    Args:
+        fn (Callable[[], int]): The benchmark
+
+    Returns:
+        dict: The item count, wall time and throughput
+    """
+
+    start = time.perf_counter()
+    items = fn()
+    seconds = time.perf_counter() - start
+    return {
+        "items": items,
+        "seconds": round(seconds, 6),
+        "per_second": round(items / seconds, 1) if seconds else None,
+    }
+
+
+def render(notes: list[Note]) -> int:
+    """Render notes through rich, as `sc list` would, into a throwaway console"""
+
+    from rich.console import Console
+
+    console = Console(file=io.StringIO(), width=100, force_terminal=True)
+    for note in notes:
+        console.print(note)
+    return len(notes)
+
+
+def run(n: int, db_file: str, batch_size: int = 1000, render_n: int = 200) -> dict:
+    """Run every benchmark against a fresh DB of n generated notes
+
+    Args:
+        n (int): The corpus size
+        db_file (str): The DB to create, or `:memory:`
+        batch_size (int): The `NotesDB.add` batch size
+        render_n (int): The number of notes to render
+
+    Returns:
+        dict: The results of each benchmark, by name
+    """
+
+    db = NotesDB(db_file=db_file)
+    results = {}
+    try:
+        results["insert"] = timed(
+            lambda: db.add(generate_corpus(n), batch_size=batch_size)
+        )
+        results["list"] = timed(lambda: sum(1 for _ in db.iter_notes()))
+        results["list_brief"] = timed(lambda: sum(1 for _ in db.iter_notes(brief=True)))
+        results["list_page"] = timed(
+            lambda: sum(1 for _ in db.iter_notes(50, before_id=n // 2))
+        )
+        results["search"] = timed(
+            lambda: sum(sum(1 for _ in db.iter_search(q)) for q in QUERIES)
+        )
+        results["search_top10"] = timed(
+            lambda: sum(sum(1 for _ in db.iter_search(q, 10)) for q in QUERIES)
+        )
+        results["fuzzy"] = timed(
+            lambda: sum(sum(1 for _ in db.iter_fuzzy(q, 10)) for q in FUZZY_QUERIES)
+        )
+
+        # Note construction alone, over rows fetched up front
+        rows = db.conn.execute(f"SELECT {db.COLUMNS} FROM notes").fetchall()
+        results["from_sql"] = timed(
+            lambda: sum(1 for row in rows if Note.from_sql(row) is not None)
+        )
+        del rows
+
+        notes = list(db.iter_notes(render_n))
+        with render_cache_in(None):
+            results["render"] = timed(lambda: render(notes))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with render_cache_in(cache_dir):
+                render(notes)
+                results["render_cached"] = timed(lambda: render(notes))
+    finally:
+        db.close()
+    return results
+
+
+@contextmanager
+def render_cache_in(cache_dir: Optional[str]) -> Iterator[None]:
+    """Point the render cache at a scratch directory, or disable it, for a benchmark
+
+    Args:
+        cache_dir (Optional[str]): The directory for the cache, or None to disable it
+    """
+
+    from note import render_cache
+
+    settings = config.settings
+    saved = dict(settings)
+    if cache_dir:
+        settings["db_file"] = os.path.join(cache_dir, "notesdb.sqlite3")
+        settings["render_cache_mb"] = "64"
+    else:
+        settings["render_cache_mb"] = "0"
+    render_cache.cache_clear()
+    try:
+        yield
+    finally:
+        if render_cache() is not None:
+            render_cache().close()
+        render_cache.cache_clear()
+        settings.update(saved)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run the benchmarks and write machine-readable results"""
+
+    parser = argparse.ArgumentParser(description="snipcache benchmarks")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000], help="corpus sizes"
+    )
+    parser.add_argument(
+        "--db",
+        choices=["disk", "memory", "both"],
+        default="both",
+        help="where the DB lives",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--render", type=int, default=200, help="notes to render")
+    parser.add_argument("--out", default=None, help="JSON file, default stdout")
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "runs": [],
+    }
+    targets = ["disk", "memory"] if args.db == "both" else [args.db]
+    for n in args.sizes:
+        for target in targets:
+            with tempfile.TemporaryDirectory() as tmp:
+                if target == "disk":
+                    db_file = os.path.join(tmp, "notesdb.sqlite3")
+                else:
+                    db_file = ":memory:"
+                results = run(n, db_file, args.batch_size, args.render)
+            report["runs"].append({"notes": n, "db": target, "results": results})
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
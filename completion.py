@@ -0,0 +1,364 @@
+"""Shell tab-completion of tags, note titles and ids, answered from a prefix index
+
+Every tab press imports this module in a fresh interpreter (see `script`),
+so it only imports modules that are built into the interpreter: no typing,
+config, SQLite or rich.
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import sys
+
+# set by type checkers only, importing typing would slow every tab press down
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable, Optional
+
+    from note import Note
+
+MAIN_FILE = "main"
+TAIL_FILE = "tail"
+
+# the kinds of entries, as the first character of their lines
+TAG = "#"
+TITLE = "="
+ID = "@"
+# what each completion context offers
+CONTEXTS = {"search": (TAG, TITLE), "tag": (TAG,), "id": (ID,)}
+
+COMMANDS = (
+    "new list search tag import sync export similar dedupe compact serve complete"
+)
+
+
+class CompletionIndex:
+    """A prefix index of the tags, titles and ids of a DB's notes
+
+    The main part is a text file of sorted lines
+    `<kind><key>\\t<value>\\t<description>`, where key is the casefolded
+    value, so a lookup is a binary search over the file, without reading it.
+    Entries of notes added or updated since the main part was built are
+    appended to a small tail that is scanned in full, along with `-<id>`
+    lines hiding the ids of deleted notes, and `NotesDB` rebuilds the main
+    part from the DB once the tail reaches `MERGE_BYTES`. Until then, titles
+    and tags no note uses any more are still offered.
+
+    Attributes:
+        path (str): The directory the index is kept in
+    """
+
+    MERGE_BYTES = 1 << 16
+
+    def __init__(self, path: str) -> None:
+        """Use the index in a directory, without reading it
+
+        Args:
+            path (str): The directory the index is kept in
+        """
+
+        self.path = path
+
+    @property
+    def full(self) -> bool:
+        """Whether the tail is large enough to rebuild the main part"""
+
+        try:
+            return os.path.getsize(os.path.join(self.path, TAIL_FILE)) >= (
+                self.MERGE_BYTES
+            )
+        except OSError:
+            return False
+
+    def add(self, notes: Iterable[Note]) -> None:
+        """Append the entries of new or updated notes to the tail
+
+        Args:
+            notes (Iterable[Note]): The notes, with their ids set
+        """
+
+        lines = [
+            line
+            for note in notes
+            for line in entries(str(note.id), note.name, note.tags)
+        ]
+        self._append(lines)
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Hide the ids of deleted notes until the main part is rebuilt
+
+        Args:
+            ids (Iterable[int]): The ids of the notes
+        """
+
+        self._append([f"-{id}\n" for id in ids])
+
+    def _append(self, lines: list[str]) -> None:
+        if lines:
+            with open(os.path.join(self.path, TAIL_FILE), "a", encoding="utf-8") as f:
+                f.writelines(lines)
+
+    def build(self, titles: Iterable[tuple[int, str]], tags: Iterable[str]) -> int:
+        """Write the main part from every note, and empty the tail
+
+        Args:
+            titles (Iterable[tuple[int, str]]): The id and title of each note
+            tags (Iterable[str]): The tags in use
+
+        Returns:
+            int: The number of entries written
+        """
+
+        lines = {line for id, title in titles for line in entries(str(id), title, ())}
+        lines.update(line for tag in tags for line in entries("", "", (tag,)))
+        # code point order is the byte order of UTF-8, which `lookup` searches in
+        data = sorted(lines)
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, MAIN_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.writelines(data)
+        os.replace(tmp, os.path.join(self.path, MAIN_FILE))
+        try:
+            os.remove(os.path.join(self.path, TAIL_FILE))
+        except FileNotFoundError:
+            pass
+        return len(data)
+
+    def lookup(self, context: str, prefix: str, n: int = 100) -> list[tuple[str, str]]:
+        """The entries starting with a prefix, ignoring case
+
+        Args:
+            context (str): What is being completed, a key of `CONTEXTS`
+            prefix (str): The start of the word being completed
+            n (int): The maximum number of entries
+
+        Returns:
+            list[tuple[str, str]]: The value and description of each entry,
+                ordered by kind, then key
+
+        Raises:
+            KeyError: If the context is unknown
+        """
+
+        key = clean(prefix).casefold()
+        tail = self._read_tail()
+        removed = {line[1:].rstrip(b"\n") for line in tail if line[:1] == b"-"}
+        found = {}
+        for kind in CONTEXTS[context]:
+            target = (kind + key).encode()
+            # tail lines come last, so an updated note shows its new title
+            matches = {}
+            for line in [*self._search_main(target, n), *tail]:
+                if line.startswith(target):
+                    first, value, description = line.rstrip(b"\n").split(b"\t")
+                    matches[value] = (first, description)
+            if kind == ID:
+                matches = {k: v for k, v in matches.items() if k not in removed}
+            for value, (_, description) in sorted(
+                matches.items(), key=lambda match: match[1][0]
+            )[:n]:
+                found.setdefault(value.decode(), description.decode())
+        return list(found.items())[:n]
+
+    def _search_main(self, target: bytes, n: int) -> list[bytes]:
+        """Binary search the sorted main part for up to n lines starting with target"""
+
+        try:
+            f = open(os.path.join(self.path, MAIN_FILE), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            if not os.fstat(f.fileno()).st_size:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # lo is the start of the first line not before target
+                lo, hi = 0, len(data)
+                while lo < hi:
+                    start = data.rfind(b"\n", 0, (lo + hi) // 2) + 1
+                    end = data.find(b"\n", start) + 1 or len(data)
+                    if data[start:end] < target:
+                        lo = end
+                    else:
+                        hi = start
+                lines = []
+                while lo < len(data) and len(lines) < n:
+                    end = data.find(b"\n", lo) + 1 or len(data)
+                    line = data[lo:end]
+                    if not line.startswith(target):
+                        break
+                    lines.append(line)
+                    lo = end
+                return lines
+
+    def _read_tail(self) -> list[bytes]:
+        """The lines of the tail, oldest first"""
+
+        try:
+            with open(os.path.join(self.path, TAIL_FILE), "rb") as f:
+                return f.readlines()
+        except FileNotFoundError:
+            return []
+
+
+def clean(s: str) -> str:
+    """A value with the characters the index uses as separators replaced by spaces"""
+
+    return s.replace("\t", " ").replace("\n", " ").replace("\r", " ")
+
+
+def entries(id: str, title: str, tags: Iterable[str]) -> list[str]:
+    """The index lines of a note
+
+    Args:
+        id (str): The id of the note, or "" to leave it out
+        title (str): The title of the note, or "" to leave it out
+        tags (Iterable[str]): The tags of the note
+
+    Returns:
+        list[str]: The lines, see `CompletionIndex`
+    """
+
+    title = clean(title)
+    lines = [f"{TAG}{tag.casefold()}\t{tag}\t\n" for tag in map(clean, tags) if tag]
+    if title:
+        lines.append(f"{TITLE}{title.casefold()}\t{title}\t\n")
+    if id:
+        lines.append(f"{ID}{id}\t{id}\t{title}\n")
+    return lines
+
+
+BASH = """\
+_sc() {
+    local cur=${COMP_WORDS[COMP_CWORD]} prev=${COMP_WORDS[COMP_CWORD-1]}
+    local cmd= context= i word IFS=$' \\t\\n'
+    for ((i = 1; i < COMP_CWORD; i++)); do
+        word=${COMP_WORDS[i]}
+        if [[ $word == --db ]]; then
+            ((i++))
+        elif [[ $word != -* ]]; then
+            cmd=$word
+            break
+        fi
+    done
+    COMPREPLY=()
+    if [[ -z $cmd && $cur != -* ]]; then
+        COMPREPLY=($(compgen -W "{commands}" -- "$cur"))
+        return
+    fi
+    case $prev in
+        --before-id|--after-id) context=id ;;
+        *) case $cmd in
+               search|s) context=search ;;
+               tag|t) context=tag ;;
+           esac ;;
+    esac
+    [[ -z $context || $cur == -* ]] && return
+    IFS=$'\\n'
+    for word in $({complete} "$context" "${cur//\\\\ / }"); do
+        COMPREPLY+=("$(printf '%q' "${word%%$'\\t'*}")")
+    done
+}
+complete -F _sc sc
+"""
+
+ZSH = """\
+#compdef sc
+_sc() {
+    local cmd context i
+    local -a lines values descriptions
+    for ((i = 2; i < CURRENT; i++)); do
+        if [[ ${words[i]} == --db ]]; then
+            ((i++))
+        elif [[ ${words[i]} != -* ]]; then
+            cmd=${words[i]}
+            break
+        fi
+    done
+    if [[ -z $cmd && $PREFIX != -* ]]; then
+        compadd -- {commands}
+        return
+    fi
+    case ${words[CURRENT-1]} in
+        --before-id|--after-id) context=id ;;
+        *) case $cmd in
+               search|s) context=search ;;
+               tag|t) context=tag ;;
+           esac ;;
+    esac
+    [[ -z $context || $PREFIX == -* ]] && return 1
+    lines=(${(f)"$({complete} $context "${(Q)PREFIX}")"})
+    values=(${lines%%$'\\t'*})
+    descriptions=(${lines//$'\\t'/  })
+    compadd -U -l -d descriptions -- $values
+}
+compdef _sc sc
+"""
+
+FISH = """\
+function __sc_complete
+    {complete} $argv
+end
+complete -c sc -f
+complete -c sc -n __fish_use_subcommand -a '{commands}'
+complete -c sc -n '__fish_seen_subcommand_from search s' \\
+    -a '(__sc_complete search (commandline -ct))'
+complete -c sc -n '__fish_seen_subcommand_from tag t' \\
+    -a '(__sc_complete tag (commandline -ct))'
+complete -c sc -n '__fish_seen_subcommand_from list l' -l before-id -l after-id -x \\
+    -a '(__sc_complete id (commandline -ct))'
+"""
+
+SCRIPTS = {"bash": BASH, "zsh": ZSH, "fish": FISH}
+
+
+def script(shell: str, path: str) -> str:
+    """The completion script for a shell, reading the index at path
+
+    The script imports this module with `python -S` on every tab press,
+    which skips `site`, uses the compiled module rather than compiling a
+    script, and reads the index without loading the rest of sc.
+
+    Args:
+        shell (str): bash, zsh or fish
+        path (str): The directory of the index
+
+    Returns:
+        str: The script, to source from the shell's startup file
+
+    Raises:
+        KeyError: If the shell is not supported
+    """
+
+    import shlex
+
+    code = (
+        f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+        "import completion; completion.main(sys.argv[1:])"
+    )
+    command = [sys.executable, "-S", "-c", code, path]
+    return (
+        SCRIPTS[shell]
+        .replace("{complete}", " ".join(map(shlex.quote, command)))
+        .replace("{commands}", COMMANDS)
+    )
+
+
+def main(argv: list[str]) -> None:
+    """Print the completions for a word, one `value\\tdescription` per line
+
+    Args:
+        argv (list[str]): The index directory, the context (see `CONTEXTS`)
+            and the start of the word
+    """
+
+    path, context, prefix = (argv + ["", "", ""])[:3]
+    try:
+        found = CompletionIndex(path).lookup(context, prefix)
+    except (KeyError, OSError, ValueError):
+        return
+    sys.stdout.write("".join(f"{value}\t{desc}\n" for value, desc in found))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,43 @@
+import zlib
+from typing import Union
+
+# zlib level: 6 is zlib's own default, most of the ratio for a fraction of 9's time
+LEVEL = 6
+
+
+def deflate(text: str, min_bytes: int) -> Union[str, bytes]:
+    """Compress note content for storage if it is large enough to be worth it
+
+    Compressed content is stored as a BLOB and plain content as TEXT, so the
+    SQLite type of the value is what tells them apart.
+
+    Args:
+        text (str): The content
+        min_bytes (int): The smallest encoded size to compress, 0 to never compress
+
+    Returns:
+        Union[str, bytes]: The compressed bytes, or text itself if not compressed
+    """
+
+    if min_bytes <= 0:
+        return text
+    data = text.encode()
+    if len(data) < min_bytes:
+        return text
+    compressed = zlib.compress(data, LEVEL)
+    return compressed if len(compressed) < len(data) else text
+
+
+def inflate(value: Union[str, bytes, None]) -> str:
+    """Decompress stored note content, passing plain content through
+
+    Args:
+        value (Union[str, bytes, None]): The stored content
+
+    Returns:
+        str: The content as text
+    """
+
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value or ""
@@ -1,9 +1,10 @@
 import configparser
 import os
-import platform
 import sys
 from typing import Optional
 
+import tracing
+
 
 class Config:
     _instance = None
@@ -11,24 +12,34 @@ class Config:
     def __new__(cls, f: Optional[str] = None) -> "Config":
         """
         Create a new instance of the Config class if it does not already exist.
+        Settings are not read until they are first needed.
         """
         if cls._instance is None:
             cls._instance = super(Config, cls).__new__(cls)
-            cls._instance._load_settings(f)
+            cls._instance._f = f
+            cls._instance._settings = None
         return cls._instance
 
+    @property
+    def settings(self) -> dict:
+        if self._settings is None:
+            with tracing.span("config"):
+                self._load_settings(self._f)
+        return self._settings
+
     def _load_settings(self, f: Optional[str]) -> None:
         """
-        Load settings from the configuration file. If no configuration file is found,
-        initialize a new configuration file with default settings.
+        Load settings from the configuration file. Loading never writes: if no
+        configuration file is found, or it lacks an option, the defaults are
+        used and `save` can write them out later.
 
         :param f: Optional path to a specific configuration file.
         """
         settings_paths = []
         db_paths = []
 
-        match platform.system():
-            case "Linux" | "Darwin":
+        match sys.platform:
+            case "linux" | "darwin":
                 settings_paths = [
                     os.path.expanduser("~/.config/sc/settings.ini"),
                     os.path.expanduser("~/.config/sc.ini"),
@@ -39,7 +50,7 @@ class Config:
                     os.path.expanduser("~/.local/share/scdb.sqlite3"),
                     os.path.expanduser("~/.scdb.sqlite3"),
                 ]
-            case "Windows":
+            case "win32":
                 settings_paths = [
                     os.path.expandvars("%APPDATA%\\sc\\settings.ini"),
                     os.path.expandvars("%APPDATA%\\sc.ini"),
@@ -49,47 +60,114 @@ class Config:
                     os.path.expandvars("%APPDATA%\\scdb.sqlite3"),
                 ]
             case _:
-                sys.exit(f"Unsupported platform: {platform.system()}")
+                sys.exit(f"Unsupported platform: {sys.platform}")
 
         if f:
             settings_paths = [f] + settings_paths
 
         configur = configparser.ConfigParser()
-        settings_found = False
+        self.path = settings_paths[0]
+        self.found = False
         for path in settings_paths:
             if os.path.exists(path):
                 configur.read(path)
-                settings_found = True
+                self.path = path
+                self.found = True
                 break
 
-        if not settings_found:
-            if not os.path.exists(os.path.dirname(settings_paths[0])):
-                os.makedirs(os.path.dirname(settings_paths[0]))
-            with open(settings_paths[0], "w") as configfile:
-                configur.add_section("settings")
-                configur.set("settings", "code_theme", "default")
-                configur.set("settings", "db_file", db_paths[0])
-                configur.write(configfile)
-            configur.read(settings_paths[0])
-
-        self.settings = {}
-        self.settings["code_theme"] = configur.get(
+        self._configur = configur
+        self._settings = {}
+        self._settings["code_theme"] = configur.get(
             "settings", "code_theme", fallback="default"
         )
 
-        if not configur.has_option("settings", "code_theme"):
-            configur.set("settings", "code_theme", "default")
-            with open(settings_paths[0], "w") as configfile:
-                configur.write(configfile)
-
-        self.settings["db_file"] = configur.get(
+        self._settings["db_file"] = configur.get(
             "settings", "db_file", fallback=db_paths[0]
         )
 
-        if not configur.has_option("settings", "db_file"):
-            configur.set("settings", "db_file", db_paths[0])
-            with open(settings_paths[0], "w") as configfile:
-                configur.write(configfile)
+        # the `sc serve` socket, next to the DB unless configured
+        self._settings["socket_file"] = configur.get(
+            "settings",
+            "socket_file",
+            fallback=os.path.join(
+                os.path.dirname(self._settings["db_file"]), "sc.sock"
+            ),
+        )
+
+        # SQLite connection tuning, see NotesDB._connect. WAL lets readers run
+        # alongside a writer, and synchronous=normal is still crash-safe in WAL
+        # mode while only syncing on checkpoints. Negative cache sizes are KiB.
+        for key, default in (
+            ("journal_mode", "wal"),
+            ("busy_timeout_ms", "5000"),
+            ("synchronous", "normal"),
+            ("cache_size", "-16384"),
+            ("mmap_size", "268435456"),
+            ("temp_store", "memory"),
+        ):
+            self._settings[key] = configur.get("settings", key, fallback=default)
+
+        # note content at least this many bytes is stored zlib-compressed, 0 to
+        # store everything as plain text; `sc compact` applies it to old notes
+        self._settings["compress_min_bytes"] = configur.get(
+            "settings", "compress_min_bytes", fallback="1024"
+        )
+
+        # query results cached in memory (entries) and, without a running
+        # `sc serve`, on disk next to the DB (MiB); 0 to disable either
+        self._settings["query_cache_size"] = configur.get(
+            "settings", "query_cache_size", fallback="256"
+        )
+        self._settings["query_cache_mb"] = configur.get(
+            "settings", "query_cache_mb", fallback="16"
+        )
+
+        # size of the rendered markdown cache kept next to the DB, 0 to disable
+        self._settings["render_cache_mb"] = configur.get(
+            "settings", "render_cache_mb", fallback="32"
+        )
+
+    def save(self) -> None:
+        """
+        Write the configuration file with default settings if it does not exist,
+        or add the required options it is missing. Called from commands that
+        write notes, so read-only commands never touch the file.
+        """
+        if self._settings is None:
+            self._load_settings(self._f)
+        configur = self._configur
+        if (
+            self.found
+            and configur.has_option("settings", "code_theme")
+            and configur.has_option("settings", "db_file")
+        ):
+            return
+
+        if not configur.has_section("settings"):
+            configur.add_section("settings")
+        for key in ("code_theme", "db_file"):
+            if not configur.has_option("settings", key):
+                configur.set("settings", key, self._settings[key])
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as configfile:
+            configur.write(configfile)
+        self.found = True
+
+    def databases(self) -> dict[str, str]:
+        """
+        The note databases by name: "default" for `db_file`, then the entries
+        of the optional [databases] section, e.g. `team = ~/team/notes.sqlite3`.
+
+        :return: The paths of the databases, keyed by name.
+        """
+        settings = self.settings
+        databases = {"default": settings["db_file"]}
+        if self._configur.has_section("databases"):
+            for name, path in self._configur.items("databases"):
+                databases[name] = os.path.expanduser(path)
+        return databases
 
     def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
         """
@@ -0,0 +1,521 @@
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import tempfile
+import threading
+from collections import deque
+from typing import Iterable, Iterator, Optional
+
+from config import config
+from note import Note
+from notesdb import NotesDB
+
+
+def socket_path() -> str:
+    """The path of the daemon socket, from the `socket_file` setting
+
+    Returns:
+        str: The path to the Unix domain socket
+    """
+
+    return config.get("socket_file")
+
+
+class ReplyBuffer:
+    """Carries an answer from the serving thread to the thread sending it
+
+    Chunks are queued in memory up to `limit` bytes. Once a client reads
+    slower than the DB produces, the rest spills to a temporary file until
+    the sender catches up, so the serving thread never waits on a client and
+    memory stays bounded whatever the size of the answer.
+    """
+
+    # bytes small writes are merged into before they are queued separately
+    CHUNK_BYTES = 1 << 16
+
+    def __init__(self, limit: int) -> None:
+        """Create an empty buffer
+
+        Args:
+            limit (int): The bytes queued in memory before spilling to disk
+        """
+
+        self.limit = limit
+        self._chunks: deque[bytearray] = deque()
+        self._size = 0
+        self._spill = None
+        self._read_pos = 0
+        self._closed = False
+        self._abandoned = False
+        self._cond = threading.Condition()
+
+    def write(self, data: bytes) -> None:
+        """Queue data to send
+
+        Raises:
+            ConnectionResetError: If the client went away
+        """
+
+        with self._cond:
+            if self._abandoned:
+                raise ConnectionResetError("The client closed the connection")
+            if self._spill is None and self._size + len(data) <= self.limit:
+                if self._chunks and len(self._chunks[-1]) < self.CHUNK_BYTES:
+                    self._chunks[-1] += data
+                else:
+                    self._chunks.append(bytearray(data))
+                self._size += len(data)
+            else:
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile()
+                self._spill.seek(0, os.SEEK_END)
+                self._spill.write(data)
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Mark the answer complete"""
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def abandon(self) -> None:
+        """Drop what is left, and have further writes raise"""
+
+        with self._cond:
+            self._abandoned = True
+            self._chunks.clear()
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def read(self) -> bytes:
+        """The next chunk in order, waiting for one if need be
+
+        Returns:
+            bytes: The chunk, or b"" once the answer is complete
+        """
+
+        with self._cond:
+            while True:
+                if self._chunks:
+                    chunk = self._chunks.popleft()
+                    self._size -= len(chunk)
+                    return bytes(chunk)
+                if self._spill is not None:
+                    self._spill.seek(self._read_pos)
+                    chunk = self._spill.read(self.CHUNK_BYTES)
+                    if chunk:
+                        self._read_pos += len(chunk)
+                        return chunk
+                    # caught up, so queue in memory again
+                    self._spill.close()
+                    self._spill, self._read_pos = None, 0
+                    continue
+                if self._closed:
+                    return b""
+                self._cond.wait()
+
+
+class NotesRequestHandler(socketserver.BaseRequestHandler):
+    """Answers one request per connection from `DaemonClient`
+
+    A request is a single JSON line, {"op": ..., "args": {...}}. Notes are
+    sent back one JSON line each, {"note": {...}}, followed by
+    {"done": true} or, if the request failed, a single {"error": ...} line.
+
+    The answer is written to a `ReplyBuffer` as it is read from the DB, and
+    `NotesServer` sends it on a thread of its own.
+    """
+
+    def __init__(
+        self,
+        request: socket.socket,
+        client_address: object,
+        server: "NotesServer",
+        reply: ReplyBuffer,
+    ) -> None:
+        self.wfile = reply
+        super().__init__(request, client_address, server)
+
+    def setup(self) -> None:
+        self.request.settimeout(self.server.READ_TIMEOUT)
+        self.rfile = self.request.makefile("rb")
+
+    def finish(self) -> None:
+        self.rfile.close()
+        self.wfile.close()
+
+    def handle(self) -> None:
+        try:
+            try:
+                request = json.loads(self.rfile.readline())
+                op, args = request["op"], request.get("args", {})
+                for line in self.server.dispatch(op, args):
+                    self.wfile.write(json.dumps(line).encode() + b"\n")
+                self.wfile.write(b'{"done": true}\n')
+            except (ValueError, KeyError, TypeError, sqlite3.Error) as e:
+                self.wfile.write(json.dumps({"error": str(e)}).encode() + b"\n")
+        except (ConnectionError, TimeoutError):
+            # the client went away, or never sent its request
+            pass
+
+
+class NotesServer(socketserver.UnixStreamServer):
+    """A Unix socket server owning a warm NotesDB connection
+
+    Requests are answered one at a time on the serving thread, which is the
+    only thread that ever touches the SQLite connection. Each answer is
+    streamed to a thread of its own that sends it, so a client that stops
+    reading (`sc list` piped into a pager, say) never holds up the others.
+
+    Attributes:
+        db (NotesDB): The database the requests are answered from
+    """
+
+    # seconds a client has to send its request once connected
+    READ_TIMEOUT = 1.0
+    # bytes of an answer held in memory while its client catches up
+    REPLY_BYTES = 1 << 20
+
+    def __init__(self, db: NotesDB, path: str) -> None:
+        """Bind the server to a socket path, replacing a stale socket file
+
+        Args:
+            db (NotesDB): The database to serve
+            path (str): The path to the Unix domain socket
+
+        Raises:
+            OSError: If another daemon is already listening on path
+        """
+
+        self.db = db
+        if os.path.exists(path):
+            if ping(path):
+                raise OSError(f"A daemon is already listening on {path}")
+            os.unlink(path)
+        super().__init__(path, NotesRequestHandler)
+
+    def dispatch(self, op: str, args: dict) -> Iterator[dict]:
+        """Run a request against the DB
+
+        Args:
+            op (str): The operation: list, search, fuzzy, tag, add, content, code or ping
+            args (dict): The keyword arguments of the operation
+
+        Yields:
+            dict: The response lines
+
+        Raises:
+            ValueError: If the operation is unknown or its arguments are invalid
+        """
+
+        brief = bool(args.get("brief"))
+        match op:
+            case "list":
+                notes = self.db.iter_notes(
+                    args.get("n", 0), args.get("before_id"), args.get("after_id"), brief
+                )
+            case "search":
+                notes = self.db.iter_search(
+                    args.get("q"),
+                    args.get("n", 0),
+                    args.get("before_id"),
+                    args.get("after_id"),
+                    brief,
+                    args.get("lang"),
+                )
+            case "fuzzy":
+                notes = self.db.iter_fuzzy(args.get("q") or "", args.get("n", 0), brief)
+            case "tag":
+                notes = self.db.iter_tagged(
+                    args.get("tags", []), args.get("match_all", True), brief
+                )
+            case "add":
+                notes = [note_from_request(d) for d in args.get("notes", [])]
+                self.db.add(notes)
+                yield {"ids": [note.id for note in notes]}
+                return
+            case "content":
+                yield {"content": self.db.load_content(int(args["id"]))}
+                return
+            case "code":
+                note = next(self.db.iter_ids([int(args["id"])]), None)
+                blocks = (
+                    [] if note is None else self.db.code_blocks(note, args.get("lang"))
+                )
+                yield {"blocks": blocks}
+                return
+            case "ping":
+                return
+            case _:
+                raise ValueError(f"Unknown operation: {op}")
+
+        for note in notes:
+            yield {"note": note.to_dict(brief)}
+
+    def process_request(self, request: socket.socket, client_address: object) -> None:
+        """Answer a request on this thread, sending the answer on another"""
+
+        reply = ReplyBuffer(self.REPLY_BYTES)
+        threading.Thread(target=self._send, args=(request, reply), daemon=True).start()
+        try:
+            self.RequestHandlerClass(request, client_address, self, reply)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            reply.close()
+
+    def _send(self, request: socket.socket, reply: ReplyBuffer) -> None:
+        """Send an answer as it is written, waiting on the client as long as it takes"""
+
+        try:
+            chunk = reply.read()
+            # the request has been read by now, so its timeout can go
+            request.settimeout(None)
+            while chunk:
+                request.sendall(chunk)
+                chunk = reply.read()
+        except OSError:
+            # the client went away
+            reply.abandon()
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def note_from_request(d: object) -> Note:
+    """Build a note sent to the daemon, validating it like one typed in
+
+    Args:
+        d (object): The note fields, as made by `Note.to_dict`
+
+    Returns:
+        Note: A new Note, without an id
+
+    Raises:
+        ValueError: If d is not a valid note
+    """
+
+    try:
+        name, tags, content = d["name"], d["tags"], d["content"]
+        if not isinstance(name, str) or not isinstance(tags, list):
+            raise TypeError
+        if not all(isinstance(tag, str) for tag in tags):
+            raise TypeError
+        return Note(name, tags, content.split("\n"))
+    except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+        raise ValueError("Invalid note") from None
+
+
+def serve(db: NotesDB, path: Optional[str] = None) -> None:
+    """Serve a NotesDB on a Unix domain socket until interrupted
+
+    Args:
+        db (NotesDB): The database to serve
+        path (Optional[str]): The socket path. Defaults to `socket_path()`
+    """
+
+    with NotesServer(db, path or socket_path()) as server:
+        server.serve_forever()
+
+
+def ping(path: str) -> bool:
+    """Check whether a daemon is answering on a socket path
+
+    Args:
+        path (str): The path to the Unix domain socket
+
+    Returns:
+        bool: True if a daemon answered
+    """
+
+    try:
+        DaemonClient(path)._request("ping", {}).close()
+    except OSError:
+        return False
+    return True
+
+
+class DaemonClient:
+    """Client for a running `sc serve` daemon, with the read/add API of NotesDB
+
+    Attributes:
+        path (str): The path to the daemon socket
+        timeout (float): Seconds to wait on the daemon before giving up
+    """
+
+    def __init__(self, path: Optional[str] = None, timeout: float = 5.0) -> None:
+        """Create a client for the daemon listening on path
+
+        Args:
+            path (Optional[str]): The socket path. Defaults to `socket_path()`
+            timeout (float): Seconds to wait on the daemon before giving up
+        """
+
+        self.path = path or socket_path()
+        self.timeout = timeout
+
+    @classmethod
+    def connect(cls, path: Optional[str] = None) -> "DaemonClient":
+        """Return a client if a daemon is running, for falling back to NotesDB
+
+        Args:
+            path (Optional[str]): The socket path. Defaults to `socket_path()`
+
+        Returns:
+            DaemonClient: A client for the running daemon
+
+        Raises:
+            OSError: If no daemon is running
+        """
+
+        client = cls(path)
+        if not hasattr(socket, "AF_UNIX") or not os.path.exists(client.path):
+            raise ConnectionRefusedError(f"No daemon on {client.path}")
+        client._request("ping", {}).close()
+        return client
+
+    def _request(self, op: str, args: dict) -> Iterator[dict]:
+        """Send a request and read the first response line before returning
+
+        Reading eagerly means errors (an empty search, say) are raised by the
+        call itself, like NotesDB does, and the rest is streamed lazily.
+
+        Args:
+            op (str): The operation
+            args (dict): The keyword arguments of the operation
+
+        Returns:
+            Iterator[dict]: The response lines, excluding the final done line
+
+        Raises:
+            ValueError: If the daemon rejected the request
+            OSError: If the daemon could not be reached
+        """
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+            sock.sendall(json.dumps({"op": op, "args": args}).encode() + b"\n")
+            lines = sock.makefile("rb")
+            first = json.loads(lines.readline() or b"null")
+        except BaseException:
+            sock.close()
+            raise
+        if first is None:
+            sock.close()
+            raise ConnectionResetError("The daemon closed the connection")
+        if "error" in first:
+            sock.close()
+            raise ValueError(first["error"])
+        return self._stream(sock, lines, first)
+
+    @staticmethod
+    def _stream(
+        sock: socket.socket, lines: Iterable[bytes], first: dict
+    ) -> Iterator[dict]:
+        """Yield response lines until the done line, closing the socket after"""
+
+        try:
+            line = first
+            while "done" not in line:
+                if "error" in line:
+                    raise ValueError(line["error"])
+                yield line
+                line = json.loads(next(iter(lines), b'{"done": true}'))
+        finally:
+            sock.close()
+
+    def _notes(self, op: str, args: dict) -> Iterator[Note]:
+        """Request notes and build them as they arrive"""
+
+        lines = self._request(op, args)
+        load_content = self.load_content if args.get("brief") else None
+        return (
+            note
+            for line in lines
+            if (note := Note.from_dict(line["note"], load_content)) is not None
+        )
+
+    def load_content(self, id: int) -> str:
+        """Fetch the content of a single note, for headline-only Notes"""
+
+        lines = self._request("content", {"id": id})
+        try:
+            return next(lines)["content"]
+        finally:
+            lines.close()
+
+    def code_blocks(
+        self, note: Note, lang: Optional[str] = None
+    ) -> list[tuple[str, str]]:
+        """Fetch the code blocks of a note, see `NotesDB.code_blocks`"""
+
+        lines = self._request("code", {"id": note.id, "lang": lang})
+        try:
+            return [tuple(block) for block in next(lines)["blocks"]]
+        finally:
+            lines.close()
+
+    def iter_notes(
+        self,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+    ) -> Iterator[Note]:
+        """Stream notes from the daemon, see `NotesDB.iter_notes`"""
+
+        args = {"n": int(n), "before_id": before_id, "after_id": after_id}
+        return self._notes("list", {**args, "brief": brief})
+
+    def iter_search(
+        self,
+        q: str,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+        lang: Optional[str] = None,
+    ) -> Iterator[Note]:
+        """Stream matches from the daemon, see `NotesDB.iter_search`"""
+
+        args = {"q": q, "n": int(n), "before_id": before_id, "after_id": after_id}
+        return self._notes("search", {**args, "brief": brief, "lang": lang})
+
+    def iter_fuzzy(self, q: str, n: int = 0, brief: bool = False) -> Iterator[Note]:
+        """Stream fuzzy matches from the daemon, see `NotesDB.iter_fuzzy`"""
+
+        return self._notes("fuzzy", {"q": q, "n": int(n), "brief": brief})
+
+    def iter_tagged(
+        self, tags: list[str], match_all: bool = True, brief: bool = False
+    ) -> Iterator[Note]:
+        """Stream tagged notes from the daemon, see `NotesDB.iter_tagged`"""
+
+        args = {"tags": tags, "match_all": match_all, "brief": brief}
+        return self._notes("tag", args)
+
+    def add(self, notes: Iterable[Note], batch_size: int = 1000) -> int:
+        """Save notes through the daemon, see `NotesDB.add`"""
+
+        notes = list(notes)
+        lines = self._request("add", {"notes": [note.to_dict() for note in notes]})
+        try:
+            ids = next(lines)["ids"]
+        finally:
+            lines.close()
+        for id, note in zip(ids, notes):
+            note.id = id
+        return len(ids)
+
+    def close(self) -> None:
+        """Nothing to close: every request uses its own connection"""
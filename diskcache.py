@@ -0,0 +1,104 @@
+import sqlite3
+import time
+from typing import Optional
+
+
+class DiskCache:
+    """A small persistent key/value cache in its own SQLite file, evicted LRU by size
+
+    Everything in the cache can be rebuilt, so it trades durability for speed
+    and treats any SQLite error (say, another process holding the lock) as a
+    cache miss rather than a failure.
+
+    Attributes:
+        path (str): The path to the cache file
+        max_bytes (int): The total size of cached values to keep
+        conn (sqlite3.Connection): The connection to the cache file
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        """Open (creating if needed) a cache file
+
+        Args:
+            path (str): The path to the cache file
+            max_bytes (int): The total size of cached values to keep
+        """
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, timeout=0.1, isolation_level=None)
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            used INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS cache_used ON cache (used);
+            """
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Look up a value and mark it as recently used
+
+        Args:
+            key (str): The cache key
+
+        Returns:
+            Optional[bytes]: The cached value, or None on a miss
+        """
+
+        try:
+            row = self.conn.execute(
+                "UPDATE cache SET used = ? WHERE key = ? RETURNING value",
+                (time.time_ns(), key),
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes) -> None:
+        """Store a value, evicting the least recently used ones over `max_bytes`
+
+        Args:
+            key (str): The cache key
+            value (bytes): The value to cache
+        """
+
+        if len(value) > self.max_bytes:
+            return
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, used) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time_ns()),
+            )
+            self._evict()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self) -> None:
+        """Drop the least recently used values until the cache fits in `max_bytes`"""
+
+        total = self.conn.execute(
+            "SELECT coalesce(sum(size), 0) FROM cache"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self.conn.execute(
+            """
+            DELETE FROM cache WHERE key IN (
+            SELECT key FROM (
+            SELECT key, sum(size) OVER (ORDER BY used DESC) AS kept FROM cache
+            ) WHERE kept > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+
+    def close(self) -> None:
+        """Close the cache file"""
+
+        self.conn.close()
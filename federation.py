@@ -0,0 +1,271 @@
+import heapq
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+from note import Note
+from notesdb import NotesDB, fuzzy_score
+
+T = TypeVar("T")
+
+
+class Shard(NotesDB):
+    """A NotesDB living on a thread of its own
+
+    SQLite connections belong to the thread that opened them, so every query,
+    including the content loads of headline-only notes, runs on the shard's
+    thread.
+
+    Attributes:
+        source (Optional[str]): The name of the database, used to label its notes
+        opened (Future): Done once the DB is open on the shard's thread
+    """
+
+    def __init__(
+        self, source: Optional[str], db_file: str, readonly: bool = True
+    ) -> None:
+        """Start the shard's thread and open the DB on it, without waiting
+
+        Args:
+            source (Optional[str]): The name of the database, or None to leave
+                notes unlabelled
+            db_file (str): The path to the SQLite file
+            readonly (bool): Open a read-only connection, see `NotesDB`
+        """
+
+        self.source = source
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f"sc-{source or 'db'}")
+        self._thread_id = None
+        self.opened = self.executor.submit(self._open, db_file, readonly)
+
+    def _open(self, db_file: str, readonly: bool) -> None:
+        self._thread_id = threading.get_ident()
+        super().__init__(db_file, readonly=readonly)
+
+    def submit(self, fn: Callable[[NotesDB], T]) -> "Future[T]":
+        """Call fn with the shard on the shard's thread, once the DB is open
+
+        Args:
+            fn (Callable[[NotesDB], T]): The function to call
+
+        Returns:
+            Future[T]: The result of fn
+        """
+
+        def call() -> T:
+            self.opened.result()
+            return fn(self)
+
+        return self.executor.submit(call)
+
+    def run(self, query: Callable[[NotesDB], Iterable]) -> Future:
+        """Run a query on the shard's thread
+
+        Args:
+            query (Callable[[NotesDB], Iterable]): Called with the shard, returns
+                notes or (key, note) pairs
+
+        Returns:
+            Future: The results as a list, labelled with the shard's source
+        """
+
+        def run(db: NotesDB) -> list:
+            results = list(query(db))
+            for result in results:
+                note = result[1] if isinstance(result, tuple) else result
+                note.source = self.source
+            return results
+
+        return self.submit(run)
+
+    def load_content(self, id: int) -> str:
+        """Fetch the content of a single note on the shard's thread"""
+
+        if threading.get_ident() == self._thread_id:
+            return super().load_content(id)
+        return self.executor.submit(super().load_content, id).result()
+
+    def close(self) -> None:
+        """Close the DB on the shard's thread and stop the thread"""
+
+        try:
+            if self.opened.exception() is None:
+                self.executor.submit(super().close).result()
+        finally:
+            self.executor.shutdown()
+
+
+class FederatedDB:
+    """Several note databases searched as one, with the read API of NotesDB
+
+    Each database is queried concurrently on its own thread, so a query
+    takes about as long as it takes on the slowest database. Matches are
+    merged by rank, similarity or recency, and labelled with the name of
+    the database they came from through `Note.source`.
+
+    Attributes:
+        shards (list[Shard]): The databases, in the order they were given
+    """
+
+    def __init__(self, databases: dict[str, str]) -> None:
+        """Open several databases at once
+
+        Args:
+            databases (dict[str, str]): The paths of the databases by name
+        """
+
+        self.shards = [Shard(source, path) for source, path in databases.items()]
+
+    def _gather(self, query: Callable[[NotesDB], Iterable]) -> list[list]:
+        """Run a query on every shard concurrently and wait for all of them"""
+
+        futures = [shard.run(query) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def iter_notes(
+        self,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+    ) -> Iterator[Note]:
+        """Stream all or the n most recent notes of every database, oldest first
+
+        Args:
+            n (int): The number of most recent notes to retrieve. Defaults to 0, where 0 returns all notes.
+            before_id (Optional[int]): Not supported, ids are per database
+            after_id (Optional[int]): Not supported, ids are per database
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The notes, ordered by when they were saved
+
+        Raises:
+            ValueError: If a page is requested
+        """
+
+        if before_id is not None or after_id is not None:
+            raise ValueError("Paging is not supported across databases")
+        notes = by_recency(self._gather(lambda db: db.iter_notes(n, brief=brief)))
+        if int(n):
+            notes = notes[-int(n) :]
+        return iter(notes)
+
+    def iter_search(
+        self,
+        q: str,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+        lang: Optional[str] = None,
+    ) -> Iterator[Note]:
+        """Stream the notes of every database matching q, best matches first
+
+        Args:
+            q (str): The term to search for
+            n (int): The maximum number of matches. Defaults to 0, where 0 returns all matches.
+            before_id (Optional[int]): Not supported, ids are per database
+            after_id (Optional[int]): Not supported, ids are per database
+            brief (bool): Only load headlines; content is fetched on first access
+            lang (Optional[str]): Only notes with a code block in this language
+
+        Returns:
+            Iterator[Note]: The matches, merged by BM25 rank, or by recency
+                when only lang is given
+
+        Raises:
+            ValueError: If both q and lang are empty, or a page is requested
+        """
+
+        if before_id is not None or after_id is not None:
+            raise ValueError("Paging is not supported across databases")
+        if not q or not q.strip():
+            if not lang:
+                raise ValueError("Search cannot be empty")
+            notes = by_recency(
+                self._gather(lambda db: db.iter_search("", n, brief=brief, lang=lang))
+            )
+            return iter(notes[-int(n) :] if int(n) else notes)
+        ranked = self._gather(lambda db: db.iter_ranked(q, n, brief, lang))
+        merged = (note for _, note in heapq.merge(*ranked, key=lambda r: r[0]))
+        return islice(merged, int(n) or None)
+
+    def iter_fuzzy(self, q: str, n: int = 0, brief: bool = False) -> Iterator[Note]:
+        """Stream the notes of every database resembling q, best first
+
+        Args:
+            q (str): The term to search for, at least 3 characters
+            n (int): The maximum number of matches. Defaults to 0, where 0 returns all matches.
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The matches, merged by similarity
+
+        Raises:
+            ValueError: If q has fewer than 3 characters
+        """
+
+        results = self._gather(lambda db: db.iter_fuzzy(q, n, brief))
+        merged = heapq.merge(*results, key=lambda note: -fuzzy_score(q, note))
+        return islice(merged, int(n) or None)
+
+    def iter_tagged(
+        self, tags: list[str], match_all: bool = True, brief: bool = False
+    ) -> Iterator[Note]:
+        """Stream the notes of every database carrying the given tags, oldest first
+
+        Args:
+            tags (List[str]): The tags to look up
+            match_all (bool): Require every tag (all-of) rather than any of them (any-of)
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The matched notes, ordered by when they were saved
+
+        Raises:
+            ValueError: If no tags are given
+        """
+
+        if not any(tags):
+            raise ValueError("At least one tag is required")
+        return iter(
+            by_recency(self._gather(lambda db: db.iter_tagged(tags, match_all, brief)))
+        )
+
+    def code_blocks(
+        self, note: Note, lang: Optional[str] = None
+    ) -> list[tuple[str, str]]:
+        """The code blocks of a note, from the database it came from
+
+        Args:
+            note (Note): A note labelled with its database through `Note.source`
+            lang (Optional[str]): Only blocks in this language
+
+        Returns:
+            list[tuple[str, str]]: The language and code of each block, see
+                `NotesDB.code_blocks`
+        """
+
+        [shard] = [shard for shard in self.shards if shard.source == note.source]
+        return shard.submit(lambda db: db.code_blocks(note, lang)).result()
+
+    def close(self) -> None:
+        """Close every database"""
+
+        for shard in self.shards:
+            shard.close()
+
+
+def by_recency(results: list[list[Note]]) -> list[Note]:
+    """Merge the notes of several databases by when they were saved
+
+    Args:
+        results (list[list[Note]]): The notes of each database, oldest first
+
+    Returns:
+        list[Note]: All the notes, oldest first
+    """
+
+    return list(heapq.merge(*results, key=lambda note: note.created_at or ""))
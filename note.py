@@ -1,16 +1,23 @@
-import string
-import random
-from datetime import datetime
-from typing import Generator, List, Optional, Tuple, TYPE_CHECKING
-
-from rich.console import Console, ConsoleOptions, RenderableType
-from rich.markdown import Markdown
-from rich.panel import Panel
-from rich.prompt import Confirm, Prompt
-from rich.rule import Rule
+import os
+import re
+import sqlite3
+from functools import lru_cache
+from typing import Callable, Generator, List, Optional, Tuple, Union, TYPE_CHECKING
 
+from compression import inflate
 from config import config
 
+# rich is only imported when a note is actually rendered or prompted for,
+# which keeps `sc` startup fast for brief listings and completion
+if TYPE_CHECKING:
+    from rich.console import Console, ConsoleOptions, RenderableType
+
+    from diskcache import DiskCache
+
+# bump to invalidate cached renders when the rendering changes
+RENDER_CACHE_VERSION = 1
+RENDER_CACHE_FILE = "render_cache.sqlite3"
+
 
 class Note:
     """
@@ -21,18 +28,39 @@ class Note:
         name (str): The name/title of the note
         tags (List[str]): A list of tags associated with the note
         content (List[str]): The content of the note, one line per string
+        created_at (Optional[str]): When the note was saved to the DB, if it was
+        source (Optional[str]): The database the note came from, when searching several
     """
 
+    # notes are decoded by the thousand when listing, so keep them compact
+    __slots__ = (
+        "_id",
+        "_name",
+        "_tags",
+        "_content",
+        "_text",
+        "_load_content",
+        "created_at",
+        "source",
+    )
+
     def __init__(
-        self, name: str, tags: list[str], content: list[str], id: int = 0
+        self,
+        name: str,
+        tags: list[str],
+        content: list[str],
+        id: int = 0,
+        created_at: Optional[str] = None,
     ) -> None:
         self.id = id
         self.name = name
         self.tags = tags
         self.content = content
+        self.created_at = created_at
+        self.source = None
 
     def __rich_console__(
-        self, console: Console, options: ConsoleOptions
+        self, console: "Console", options: "ConsoleOptions"
     ) -> Generator["RenderableType", None, None]:
         """
         Print function to display the note using rich
@@ -41,18 +69,52 @@ class Note:
             RenderableType: Rich renderable objects
         """
 
-        header = f"[b]NOTE #{self.id}[/b]"
-        footer = f"[b]END NOTE #{self.id}[/b]"
+        from rich.panel import Panel
+        from rich.rule import Rule
+
+        header = f"[b]NOTE {self.source or ''}#{self.id}[/b]"
+        footer = f"[b]END NOTE {self.source or ''}#{self.id}[/b]"
         tagline = " ".join(f"[b]#[/b]{tag}" for tag in self.tags)
-        content = "\n".join(self.content)
+        content = self.text
 
         panel = Panel(self.name, title=header, subtitle=tagline)
         yield panel
-        md_content = Markdown(content, code_theme=config.get("code_theme"))
+        md_content = render_markdown(content, console, options)
         yield md_content
         rule = Rule(title=footer)
         yield rule
 
+    def headline(self) -> str:
+        """One line summary of the note: source and id, date, name and tags
+
+        Returns:
+            str: The plain text summary line
+        """
+
+        date = f"{self.created_at[:10]}  " if self.created_at else ""
+        tagline = " ".join(f"#{tag}" for tag in self.tags)
+        return f"{self.source or ''}#{self.id}  {date}{self.name}  {tagline}"
+
+    def to_dict(self, brief: bool = False) -> dict:
+        """The note as a JSON-serializable dict, the inverse of `from_dict`
+
+        Args:
+            brief (bool): Leave out the content
+
+        Returns:
+            dict: The id, name, tags, created_at and (unless brief) content
+        """
+
+        d = {
+            "id": self.id,
+            "name": self.name,
+            "tags": self.tags,
+            "created_at": self.created_at,
+        }
+        if not brief:
+            d["content"] = self.text
+        return d
+
     def confirm(self) -> bool:
         """
         Asks for confirmation to save the note.
@@ -61,6 +123,8 @@ class Note:
             bool: True to save the note, false otherwise
         """
 
+        from rich.prompt import Confirm
+
         return Confirm.ask("Save note?")
 
     @property
@@ -122,6 +186,10 @@ class Note:
 
     @property
     def content(self) -> List[str]:
+        if self._content is None:
+            # note from the DB: split (or first load) the body on first access
+            self._content = self.text.split("\n")
+            self._text = None
         return self._content
 
     @content.setter
@@ -136,6 +204,25 @@ class Note:
         if all(not line.strip() for line in content):
             raise ValueError("Content cannot be empty")
         self._content = content
+        self._text = None
+        self._load_content = None
+
+    @property
+    def text(self) -> str:
+        """
+        The content as a single string, without splitting it into lines when
+        the note was read from the DB.
+        """
+
+        if self._content is not None:
+            return "\n".join(self._content)
+        if self._text is None:
+            # headline-only note from the DB: load the body on first access
+            self._text = self._load_content(self.id)
+        elif isinstance(self._text, bytes):
+            # compressed in the DB: inflate on first access
+            self._text = inflate(self._text)
+        return self._text
 
     @classmethod
     def new(cls, name: Optional[str] = None) -> "Note":
@@ -149,7 +236,13 @@ class Note:
             Note: A new instance of the note class
         """
 
-        from project import eof_input, parse_tags
+        import random
+        import string
+        from datetime import datetime
+
+        from rich.prompt import Prompt
+
+        from project import eof_input
 
         if not name:
             name = datetime.now().strftime("%Y%m%d-") + "".join(
@@ -170,15 +263,206 @@ class Note:
     def from_sql(cls, row: Tuple[int, str, str, str]) -> Optional["Note"]:
         """Returns a Note object from a given row from SQLite
 
+        Rows were validated when they were added, so this skips the property
+        setters (tag sorting, line-by-line emptiness checks) and keeps the
+        content as one string until `content` is first accessed. Compressed
+        content (bytes) is only inflated when the text is first accessed.
+
         Args:
             row (tuple): the SQL row
 
+        Returns:
+            Note: A new instance of the note class, or None if the row is not a valid note
+        """
+
+        name, tags, text = row[1], row[2], row[3]
+        if not name or not tags or tags[0] == "," or not text:
+            return None
+        if isinstance(text, str) and text.isspace():
+            return None
+        return cls._trusted(row[0], name, tags.split(","), text, _created_at(row, 4))
+
+    @classmethod
+    def from_dict(
+        cls, d: dict, load_content: Optional[Callable[[int], str]] = None
+    ) -> Optional["Note"]:
+        """Returns a Note from a dict made by `to_dict`
+
+        Args:
+            d (dict): The note fields
+            load_content (Optional[Callable[[int], str]]): fetches the content of a
+                brief dict (one without content) on first access
+
+        Returns:
+            Note: A new instance of the note class, or None if d is not a valid note
+        """
+
+        row = (d.get("id"), d.get("name"), ",".join(d.get("tags") or []))
+        if "content" not in d and load_content is not None:
+            return cls.from_summary(row + (d.get("created_at"),), load_content)
+        return cls.from_sql(row + (d.get("content") or "", d.get("created_at")))
+
+    @classmethod
+    def from_summary(
+        cls, row: Tuple[int, str, str, str], load_content: Callable[[int], str]
+    ) -> Optional["Note"]:
+        """Returns a headline-only Note from an (id, title, tags, created_at) row
+
+        The content is not read until it is first accessed, when it is fetched
+        with `load_content(id)`.
+
+        Args:
+            row (tuple): the SQL row, without the content column
+            load_content (Callable[[int], str]): fetches the content of a note by id
+
         Returns:
             Note: A new instance of the note class
         """
-        tags = row[2].split(",")
-        lines = row[3].split("\n")
-        try:
-            return cls(row[1], tags, lines, id=row[0])
-        except ValueError:
+
+        name, tags = row[1], row[2]
+        if not name or not tags or tags[0] == ",":
             return None
+        return cls._trusted(
+            row[0], name, tags.split(","), None, _created_at(row, 3), load_content
+        )
+
+    @classmethod
+    def _trusted(
+        cls,
+        id: int,
+        name: str,
+        tags: List[str],
+        text: Optional[Union[str, bytes]],
+        created_at: Optional[str],
+        load_content: Optional[Callable[[int], str]] = None,
+    ) -> "Note":
+        """Builds a Note from already validated fields, bypassing the setters
+
+        Args:
+            id (int): The id of the note
+            name (str): The name of the note
+            tags (List[str]): The tags, already sorted
+            text (Optional[Union[str, bytes]]): The content as one string, compressed
+                bytes to inflate on first access, or None to load it later
+            created_at (Optional[str]): When the note was saved
+            load_content (Optional[Callable[[int], str]]): fetches the content by id
+
+        Returns:
+            Note: A new instance of the note class
+        """
+
+        note = cls.__new__(cls)
+        note._id = int(id or 0)
+        note._name = name
+        note._tags = tags
+        note._content = None
+        note._text = text
+        note._load_content = load_content
+        note.created_at = created_at
+        note.source = None
+        return note
+
+
+def parse_tags(s: str) -> list[str]:
+    """Split a given list of tags by any " #," characters
+
+    Args:
+        s (str): The string containing tags
+
+    Returns:
+        list[str]: A list of parsed tags
+    """
+
+    s = s.strip(" #,")
+    return re.split(r"[ #,]+", s)
+
+
+def _created_at(row: tuple, i: int) -> Optional[str]:
+    """Read the optional created_at column of a row"""
+
+    return str(row[i]) if len(row) > i and row[i] is not None else None
+
+
+@lru_cache(maxsize=None)
+def render_cache() -> Optional["DiskCache"]:
+    """Open the rendered markdown cache next to the DB on first use
+
+    Returns:
+        Optional[DiskCache]: The cache, or None if it is disabled or unavailable
+    """
+
+    from diskcache import DiskCache
+
+    try:
+        max_bytes = int(float(config.get("render_cache_mb", "0")) * 1024 * 1024)
+        db_file = config.get("db_file")
+        if max_bytes <= 0 or not db_file or db_file == ":memory:":
+            return None
+        return DiskCache(
+            os.path.join(os.path.dirname(db_file), RENDER_CACHE_FILE), max_bytes
+        )
+    except (ValueError, sqlite3.Error):
+        return None
+
+
+def render_markdown(
+    content: str, console: "Console", options: Optional["ConsoleOptions"]
+) -> "RenderableType":
+    """Render markdown content, replaying the cached ANSI output when possible
+
+    Markdown parsing and syntax highlighting dominate the cost of printing a
+    note, so the highlighted output is cached on disk keyed by content, code
+    theme, width and color system.
+
+    Args:
+        content (str): The markdown content
+        console (Console): The console being printed to
+        options (Optional[ConsoleOptions]): The render options, if any
+
+    Returns:
+        RenderableType: The markdown, as a renderable
+    """
+
+    from rich.markdown import Markdown
+
+    code_theme = config.get("code_theme")
+    cache = render_cache()
+    if cache is None:
+        return Markdown(content, code_theme=code_theme)
+
+    import hashlib
+    import io
+
+    from rich.console import Console
+    from rich.text import Text
+
+    width = options.max_width if options else console.width
+    key = hashlib.sha256(
+        "\0".join(
+            map(
+                str,
+                (
+                    RENDER_CACHE_VERSION,
+                    code_theme,
+                    width,
+                    console.color_system,
+                    content,
+                ),
+            )
+        ).encode()
+    ).hexdigest()
+
+    ansi = cache.get(key)
+    if ansi is None:
+        buffer = io.StringIO()
+        Console(
+            file=buffer,
+            width=width,
+            color_system=console.color_system,
+            force_terminal=console.is_terminal,
+            legacy_windows=False,
+        ).print(Markdown(content, code_theme=code_theme))
+        ansi = buffer.getvalue().encode()
+        cache.put(key, ansi)
+
+    return Text.from_ansi(ansi.decode().removesuffix("\n"), no_wrap=True)
@@ -1,31 +1,183 @@
+import hashlib
 import os
+import re
 import sqlite3
-from typing import Optional
+import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+from itertools import groupby, islice
+from typing import Callable, Hashable, Iterable, Iterator, Optional, TYPE_CHECKING
 
+import tracing
+from compression import deflate, inflate
 from config import config
 from note import Note
 
+if TYPE_CHECKING:
+    from completion import CompletionIndex
+    from diskcache import DiskCache
+    from similarity import SimilarityIndex
+
+
+def cached_query(
+    method: Callable[..., Iterator[Note]]
+) -> Callable[..., Iterator[Note]]:
+    """Serve a NotesDB query method from the result cache, see `NotesDB._cached`
+
+    The cache key is the method name and its arguments with defaults filled
+    in, whitespace in strings collapsed and lists (of tags) sorted, so calls
+    that only differ in spelling share an entry.
+    """
+
+    # bind arguments by hand: importing inspect would slow down `sc` startup
+    code = method.__code__
+    names = code.co_varnames[1 : code.co_argcount]
+    defaults = dict(zip(reversed(names), reversed(method.__defaults__ or ())))
+
+    @wraps(method)
+    def wrapper(self: "NotesDB", *args: object, **kwargs: object) -> Iterator[Note]:
+        arguments = {**defaults, **dict(zip(names, args)), **kwargs}
+        if arguments.keys() != set(names) or len(args) > len(names):
+            # missing or unknown arguments: let the method raise the TypeError
+            return method(self, *args, **kwargs)
+        key = (method.__name__, *(_key_part(arguments[name]) for name in names))
+        return self._cached(
+            key,
+            lambda: method(self, *args, **kwargs),
+            bool(arguments.get("brief")),
+        )
+
+    return wrapper
+
+
+def _key_part(value: object) -> Hashable:
+    """Normalize an argument of a cached query for the cache key"""
+
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, list):
+        return tuple(sorted({_key_part(item) for item in value}))
+    return value
+
 
 class NotesDB:
     """Class representing a SQLite DB for a collection of Notes
 
     Attributes:
         db_file (str): The path to the SQLite file
+        readonly (bool): Whether the connection is read-only
+        compress_min_bytes (int): Content at least this large is stored compressed, 0 for never
+        disk_cache (bool): Whether query results are also cached on disk, see `_cached`
         conn (sqlite3.Connection): The connection to the SQLite DB
         cursor (sqlite3.Cursor): The cursor for the SQLite DB
     """
 
-    def __init__(self, db_file: str = config.get("db_file")) -> None:
+    # rows pulled from SQLite per round trip when streaming results
+    FETCH_SIZE = 256
+
+    # fuzzy search ranks at most this many trigram index hits by similarity,
+    # and drops those below the threshold
+    FUZZY_CANDIDATES = 500
+    FUZZY_THRESHOLD = 0.3
+
+    # `sync_files` tags the notes of removed files with this when archiving
+    ARCHIVE_TAG = "archived"
+
+    # query results with more notes than this are streamed but not cached
+    CACHE_ROWS = 200
+    # queries worth caching on disk: listing by id costs less than opening the cache
+    DISK_CACHED = {"iter_search", "iter_tagged", "iter_fuzzy"}
+
+    # per-connection pragmas, each set from the config setting of the same name
+    INT_PRAGMAS = {"cache_size": -16384, "mmap_size": 268435456}
+    KEYWORD_PRAGMAS = {
+        "synchronous": ("normal", ("off", "normal", "full", "extra")),
+        "temp_store": ("memory", ("default", "file", "memory")),
+    }
+    JOURNAL_MODES = ("delete", "truncate", "persist", "memory", "wal", "off")
+
+    # note bodies are stored once per distinct content, see `_migrate_bodies`
+    CONTENT = "(SELECT content FROM bodies WHERE hash = notes.body_hash) AS content"
+    COLUMNS = f"notes.id, notes.title, notes.tags, {CONTENT}, notes.created_at"
+    # headline-only rows for brief listings; content is loaded on demand
+    SUMMARY_COLUMNS = "notes.id, notes.title, notes.tags, notes.created_at"
+    # notes with a code block in a language, see `_migrate_code_blocks`
+    LANG_FILTER = (
+        "notes.body_hash IN (SELECT body_hash FROM code_blocks WHERE lang = ?)"
+    )
+
+    def __init__(
+        self,
+        db_file: Optional[str] = None,
+        readonly: bool = False,
+        disk_cache: bool = False,
+    ) -> None:
         """Initialize the NoteDB instance with a SQLite file
 
         Args:
-            db_file (str): The path to the SQLite file. Defaults to in-memory database
+            db_file (Optional[str]): The path to the SQLite file. Defaults to the configured `db_file`
+            readonly (bool): Open a read-only connection, which never takes a write
+                lock. Falls back to read-write when the DB does not exist yet or
+                still needs migrating.
+            disk_cache (bool): Also cache query results on disk, for short-lived
+                processes that would never hit the in-process cache
+        """
+
+        self.db_file = db_file or config.get("db_file")
+        self.readonly = readonly and os.path.exists(self.db_file)
+        self.compress_min_bytes = _int_setting("compress_min_bytes", 1024)
+        self.disk_cache = disk_cache and self.db_file != ":memory:"
+        self._results: OrderedDict[tuple, tuple[int, list[Note]]] = OrderedDict()
+        self._results_size = _int_setting("query_cache_size", 256)
+        self._disk: Optional["DiskCache"] = None
+        self._seen: Optional[tuple[int, int]] = None
+        self._generation = 0
+        with tracing.span("db.connect"):
+            self._connect()
+        with tracing.span("db.migrate"):
+            if self.readonly and not self._is_current():
+                self.close()
+                self.readonly = False
+                self._connect()
+            if not self.readonly:
+                self._create_table()
+
+    def _connect(self) -> None:
+        """Open the SQLite connection and apply the configured pragmas
+
+        WAL journaling lets readers run alongside a writer, and the busy
+        timeout makes concurrent writers queue up instead of failing with
+        "database is locked".
         """
 
-        self.db_file = db_file
-        self.conn = sqlite3.connect(self.db_file)
+        timeout = _int_setting("busy_timeout_ms", 5000) / 1000
+        if self.readonly:
+            uri = (
+                "file:" + urllib.parse.quote(os.path.abspath(self.db_file)) + "?mode=ro"
+            )
+            self.conn = sqlite3.connect(uri, uri=True, timeout=timeout)
+        else:
+            self.conn = sqlite3.connect(self.db_file, timeout=timeout)
         self.cursor = self.conn.cursor()
-        self._create_table()
+        # the FTS triggers index compressed content through this
+        self.conn.create_function("sc_inflate", 1, inflate, deterministic=True)
+
+        if not self.readonly and self.db_file != ":memory:":
+            journal_mode = _keyword_setting("journal_mode", "wal", self.JOURNAL_MODES)
+            self.cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+        for pragma, default in self.INT_PRAGMAS.items():
+            value = _int_setting(pragma, default)
+            self.cursor.execute(f"PRAGMA {pragma} = {value}")
+        for pragma, (default, choices) in self.KEYWORD_PRAGMAS.items():
+            value = _keyword_setting(pragma, default, choices)
+            self.cursor.execute(f"PRAGMA {pragma} = {value}")
+
+    def _is_current(self) -> bool:
+        """Whether the schema needs no migrations"""
+
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        return version >= len(self._MIGRATIONS)
 
     def _create_table(self):
         """Initialize NotesDB SQLite table"""
@@ -42,85 +194,1513 @@ class NotesDB:
         """
         self.cursor.execute(query)
         self.conn.commit()
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Bring the schema up to date, tracked through `PRAGMA user_version`
+
+        Each migration runs in one transaction along with its version bump,
+        so an interrupted migration leaves the DB as it was before it.
+        """
+
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        for i, migration in enumerate(self._MIGRATIONS[version:], start=version + 1):
+            with self._transaction():
+                migration(self)
+                self.cursor.execute(f"PRAGMA user_version = {i}")
+
+    def _script(self, sql: str) -> None:
+        """Run several statements within the current transaction
+
+        Unlike `executescript`, which commits any open transaction first.
+
+        Args:
+            sql (str): The statements, separated by semicolons
+        """
+
+        statement = ""
+        for part in sql.split(";"):
+            statement += part + ";"
+            # a trigger body holds semicolons of its own
+            if sqlite3.complete_statement(statement):
+                if statement.strip(" \n;"):
+                    self.cursor.execute(statement)
+                statement = ""
+
+    def _migrate_fts(self) -> None:
+        """Create the FTS5 index over title, tags and content and backfill it
+
+        The index is contentless; the triggers hand it the old values on
+        update/delete so it never has to read them back from `notes`.
+        """
+
+        self._script(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            title, tags, content, content='', prefix='2 3'
+            );
+            CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, title, tags, content)
+                VALUES (new.id, new.title, new.tags, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, tags, content)
+                VALUES ('delete', old.id, old.title, old.tags, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, tags, content)
+                VALUES ('delete', old.id, old.title, old.tags, old.content);
+                INSERT INTO notes_fts (rowid, title, tags, content)
+                VALUES (new.id, new.title, new.tags, new.content);
+            END;
+            INSERT INTO notes_fts (rowid, title, tags, content)
+            SELECT id, title, tags, content FROM notes;
+            """
+        )
+
+    def _migrate_tags(self) -> None:
+        """Create the normalized tags/note_tags tables and backfill them from `notes.tags`"""
+
+        self._script(
+            """
+            CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS note_tags (
+            tag_id INTEGER NOT NULL REFERENCES tags (id),
+            note_id INTEGER NOT NULL REFERENCES notes (id),
+            PRIMARY KEY (tag_id, note_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS note_tags_note_id ON note_tags (note_id);
+            """
+        )
+        rows = self.conn.execute("SELECT id, tags FROM notes").fetchall()
+        self._add_tags(
+            (id, tag) for id, tags in rows for tag in (tags or "").split(",")
+        )
+
+    def _migrate_trigram(self) -> None:
+        """Create the trigram index over title and tags used by fuzzy search"""
+
+        self._script(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_trigram USING fts5(
+            title, tags, content='', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS notes_trigram_ai AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_trigram (rowid, title, tags)
+                VALUES (new.id, new.title, new.tags);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_trigram_ad AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_trigram (notes_trigram, rowid, title, tags)
+                VALUES ('delete', old.id, old.title, old.tags);
+            END;
+            CREATE TRIGGER IF NOT EXISTS notes_trigram_au
+            AFTER UPDATE OF title, tags ON notes BEGIN
+                INSERT INTO notes_trigram (notes_trigram, rowid, title, tags)
+                VALUES ('delete', old.id, old.title, old.tags);
+                INSERT INTO notes_trigram (rowid, title, tags)
+                VALUES (new.id, new.title, new.tags);
+            END;
+            INSERT INTO notes_trigram (rowid, title, tags)
+            SELECT id, title, tags FROM notes;
+            """
+        )
+
+    def _migrate_compression(self) -> None:
+        """Have the FTS triggers index compressed content as its inflated text
+
+        Content stored as a BLOB is zlib-compressed, see `compression.deflate`.
+        The update trigger also skips reindexing when the text did not change,
+        which is the case when `compact` compresses a row in place.
+        """
+
+        self._script(
+            """
+            DROP TRIGGER IF EXISTS notes_fts_ai;
+            DROP TRIGGER IF EXISTS notes_fts_ad;
+            DROP TRIGGER IF EXISTS notes_fts_au;
+            CREATE TRIGGER notes_fts_ai AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, title, tags, content)
+                VALUES (new.id, new.title, new.tags, sc_inflate(new.content));
+            END;
+            CREATE TRIGGER notes_fts_ad AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, tags, content)
+                VALUES ('delete', old.id, old.title, old.tags, sc_inflate(old.content));
+            END;
+            CREATE TRIGGER notes_fts_au AFTER UPDATE ON notes
+            WHEN old.title IS NOT new.title OR old.tags IS NOT new.tags
+            OR sc_inflate(old.content) IS NOT sc_inflate(new.content) BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, tags, content)
+                VALUES ('delete', old.id, old.title, old.tags, sc_inflate(old.content));
+                INSERT INTO notes_fts (rowid, title, tags, content)
+                VALUES (new.id, new.title, new.tags, sc_inflate(new.content));
+            END;
+            """
+        )
+
+    def _migrate_bodies(self) -> None:
+        """Move note content into a `bodies` table keyed by its SHA-256 hash
+
+        Notes with the same content share one body, referenced through
+        `notes.body_hash`. The FTS triggers read the content from `bodies`,
+        which is why bodies are written before the notes using them, and the
+        delete/update triggers drop bodies no note references any more.
+        """
+
+        self._script(
+            """
+            DROP TRIGGER IF EXISTS notes_fts_ai;
+            DROP TRIGGER IF EXISTS notes_fts_ad;
+            DROP TRIGGER IF EXISTS notes_fts_au;
+            CREATE TABLE IF NOT EXISTS bodies (
+            hash BLOB PRIMARY KEY,
+            content
+            );
+            ALTER TABLE notes ADD COLUMN body_hash BLOB REFERENCES bodies (hash);
+            """
+        )
+        last_id = 0
+        while rows := self.cursor.execute(
+            "SELECT id, content FROM notes WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, self.FETCH_SIZE),
+        ).fetchall():
+            hashes = [(body_hash(inflate(content)), id) for id, content in rows]
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO bodies (hash, content) VALUES (?, ?)",
+                ((hash, content) for (hash, _), (_, content) in zip(hashes, rows)),
+            )
+            self.cursor.executemany(
+                "UPDATE notes SET body_hash = ? WHERE id = ?", hashes
+            )
+            last_id = rows[-1][0]
+
+        self._script(
+            """
+            ALTER TABLE notes DROP COLUMN content;
+            CREATE INDEX IF NOT EXISTS notes_body_hash ON notes (body_hash);
+            CREATE TRIGGER notes_fts_ai AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, title, tags, content)
+                VALUES (new.id, new.title, new.tags, sc_inflate(
+                    (SELECT content FROM bodies WHERE hash = new.body_hash)
+                ));
+            END;
+            CREATE TRIGGER notes_fts_ad AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, tags, content)
+                VALUES ('delete', old.id, old.title, old.tags, sc_inflate(
+                    (SELECT content FROM bodies WHERE hash = old.body_hash)
+                ));
+                DELETE FROM bodies WHERE hash = old.body_hash AND NOT EXISTS (
+                    SELECT 1 FROM notes WHERE body_hash = old.body_hash
+                );
+            END;
+            CREATE TRIGGER notes_fts_au AFTER UPDATE ON notes
+            WHEN old.title IS NOT new.title OR old.tags IS NOT new.tags
+            OR old.body_hash IS NOT new.body_hash BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, tags, content)
+                VALUES ('delete', old.id, old.title, old.tags, sc_inflate(
+                    (SELECT content FROM bodies WHERE hash = old.body_hash)
+                ));
+                INSERT INTO notes_fts (rowid, title, tags, content)
+                VALUES (new.id, new.title, new.tags, sc_inflate(
+                    (SELECT content FROM bodies WHERE hash = new.body_hash)
+                ));
+                DELETE FROM bodies WHERE hash = old.body_hash AND NOT EXISTS (
+                    SELECT 1 FROM notes WHERE body_hash = old.body_hash
+                );
+            END;
+            """
+        )
+
+    def _migrate_code_blocks(self) -> None:
+        """Index the fenced code blocks of every body by language
+
+        A block is stored as its language and the line span of its code in
+        the body, so the code itself is not stored twice. Blocks belong to a
+        body rather than a note: each distinct content is parsed once, and
+        its blocks are dropped along with it.
+        """
+
+        self._script(
+            """
+            CREATE TABLE IF NOT EXISTS code_blocks (
+            body_hash BLOB NOT NULL REFERENCES bodies (hash),
+            position INTEGER NOT NULL,
+            lang TEXT NOT NULL,
+            start_line INTEGER NOT NULL,
+            end_line INTEGER NOT NULL,
+            PRIMARY KEY (body_hash, position)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS code_blocks_lang ON code_blocks (lang, body_hash);
+            CREATE TRIGGER IF NOT EXISTS code_blocks_bd AFTER DELETE ON bodies BEGIN
+                DELETE FROM code_blocks WHERE body_hash = old.hash;
+            END;
+            """
+        )
+        last_rowid = 0
+        while rows := self.cursor.execute(
+            "SELECT rowid, hash, content FROM bodies WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, self.FETCH_SIZE),
+        ).fetchall():
+            self._add_code_blocks((hash, inflate(content)) for _, hash, content in rows)
+            last_rowid = rows[-1][0]
+
+    def _migrate_generation(self) -> None:
+        """Add the change counter that keys the query result cache
+
+        Triggers bump it on every change to a note, whoever makes it. It
+        starts at a random value, so a DB deleted and created again does not
+        reuse the cache keys of the old one.
+        """
+
+        self._script(
+            """
+            CREATE TABLE IF NOT EXISTS generation (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO generation (id, value)
+            VALUES (0, random() % 1000000000000);
+            CREATE TRIGGER IF NOT EXISTS generation_ai AFTER INSERT ON notes BEGIN
+                UPDATE generation SET value = value + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS generation_ad AFTER DELETE ON notes BEGIN
+                UPDATE generation SET value = value + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS generation_au AFTER UPDATE ON notes BEGIN
+                UPDATE generation SET value = value + 1;
+            END;
+            """
+        )
+
+    def _migrate_sync(self) -> None:
+        """Add the manifest of the files synced into notes, see `sync_files`
+
+        Deleting a note now also drops its tag links, which deletes used to
+        leave behind, and its manifest entry, so a synced file whose note was
+        deleted is added again on the next sync.
+        """
+
+        self._script(
+            """
+            CREATE TABLE IF NOT EXISTS sync_files (
+            root TEXT NOT NULL,
+            path TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            hash BLOB NOT NULL,
+            note_id INTEGER NOT NULL REFERENCES notes (id),
+            PRIMARY KEY (root, path)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS sync_files_note_id ON sync_files (note_id);
+            CREATE TRIGGER IF NOT EXISTS notes_links_ad AFTER DELETE ON notes BEGIN
+                DELETE FROM note_tags WHERE note_id = old.id;
+                DELETE FROM sync_files WHERE note_id = old.id;
+            END;
+            DELETE FROM note_tags WHERE note_id NOT IN (SELECT id FROM notes);
+            """
+        )
+
+    _MIGRATIONS = [
+        _migrate_fts,
+        _migrate_tags,
+        _migrate_trigram,
+        _migrate_compression,
+        _migrate_bodies,
+        _migrate_code_blocks,
+        _migrate_generation,
+        _migrate_sync,
+    ]
+
+    def _add_tags(self, pairs: Iterable[tuple[int, str]]) -> None:
+        """Link notes to their tags in the normalized tag tables
+
+        Args:
+            pairs (Iterable[tuple[int, str]]): (note id, tag) pairs
+        """
+
+        pairs = [(note_id, tag) for note_id, tag in pairs if tag]
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO tags (name) VALUES (?)", {(tag,) for _, tag in pairs}
+        )
+        self.cursor.executemany(
+            """
+            INSERT OR IGNORE INTO note_tags (tag_id, note_id)
+            SELECT id, ? FROM tags WHERE name = ?
+            """,
+            pairs,
+        )
+
+    def _add_code_blocks(self, bodies: Iterable[tuple[bytes, str]]) -> None:
+        """Index the fenced code blocks of new bodies, see `parse_code_blocks`
+
+        Args:
+            bodies (Iterable[tuple[bytes, str]]): (body hash, text) pairs
+        """
+
+        self.cursor.executemany(
+            """
+            INSERT OR IGNORE INTO code_blocks
+            (body_hash, position, lang, start_line, end_line) VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                (hash, position, *block)
+                for hash, text in bodies
+                for position, block in enumerate(parse_code_blocks(text))
+            ),
+        )
 
     def close(self) -> None:
         """Close the SQLite connection and cursor"""
 
         self.cursor.close()
         self.conn.close()
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
 
-    def add(self, notes: list[Note]) -> None:
-        """Save a list of one or more notes to the DB
+    def generation(self) -> int:
+        """The change counter of the DB, which every change to a note bumps
+
+        The counter is only read again when it may have moved: `PRAGMA
+        data_version` changes when another connection commits, and
+        `total_changes` when this one writes.
+
+        Returns:
+            int: The current generation
+        """
+
+        [version] = self.conn.execute("PRAGMA data_version").fetchone()
+        seen = (version, self.conn.total_changes)
+        if seen != self._seen:
+            [self._generation] = self.conn.execute(
+                "SELECT value FROM generation"
+            ).fetchone()
+            self._seen = seen
+        return self._generation
+
+    def _cached(
+        self, key: tuple, query: Callable[[], Iterable[Note]], brief: bool = False
+    ) -> Iterator[Note]:
+        """Serve a query from the result cache, or run it and cache its results
+
+        Results are kept in an LRU of `query_cache_size` entries, and with
+        `disk_cache` the `DISK_CACHED` queries are kept on disk too; either
+        can be disabled on its own. Entries are tagged with the `generation`
+        they were read at, so any write makes them stale, and checking that
+        costs a single pragma read. Notes from the cache are shared between
+        calls.
 
         Args:
-            notes (List[Note]): the list of notes to be added
+            key (tuple): The normalized query
+            query (Callable[[], Iterable[Note]]): Runs the query
+            brief (bool): The query only loads headlines
+
+        Returns:
+            Iterator[Note]: The results, streamed as they are read on a miss
         """
 
-        query = """
-        INSERT INTO notes (title, tags, content) VALUES (?, ?, ?)
+        if self._results_size <= 0 and not (
+            self.disk_cache and key[0] in self.DISK_CACHED
+        ):
+            return iter(query())
+
+        generation = self.generation()
+        hit = self._results.get(key)
+        if hit is not None and hit[0] == generation:
+            self._results.move_to_end(key)
+            with tracing.span("cache.hit") as span:
+                span.rows = len(hit[1])
+            return iter(hit[1])
+
+        notes = self._disk_get(key, generation, brief)
+        if notes is not None:
+            self._remember(key, generation, notes)
+            return iter(notes)
+        # run the query now, so argument errors are still raised by the call
+        return self._collect(key, generation, query(), brief)
+
+    def _collect(
+        self, key: tuple, generation: int, notes: Iterable[Note], brief: bool
+    ) -> Iterator[Note]:
+        """Stream query results, caching them if they are all read and few enough"""
+
+        kept: Optional[list[Note]] = []
+        for note in notes:
+            if kept is not None:
+                kept.append(note)
+                if len(kept) > self.CACHE_ROWS:
+                    kept = None
+            yield note
+        if kept is not None:
+            self._remember(key, generation, kept)
+            self._disk_put(key, generation, kept, brief)
+
+    def _remember(self, key: tuple, generation: int, notes: list[Note]) -> None:
+        """Add results to the in-process cache, evicting the least recently used"""
+
+        if self._results_size <= 0:
+            return
+        self._results[key] = (generation, notes)
+        self._results.move_to_end(key)
+        while len(self._results) > self._results_size:
+            self._results.popitem(last=False)
+
+    def _disk_cache(self) -> Optional["DiskCache"]:
+        """Open the on-disk result cache next to the DB on first use
+
+        Returns:
+            Optional[DiskCache]: The cache, or None if it is disabled or unavailable
         """
+
+        if self._disk is None and self.disk_cache:
+            from diskcache import DiskCache
+
+            try:
+                max_bytes = int(float(config.get("query_cache_mb")) * 1024 * 1024)
+                if max_bytes > 0:
+                    self._disk = DiskCache(query_cache_path(self.db_file), max_bytes)
+            except (ValueError, sqlite3.Error):
+                pass
+            self.disk_cache = self._disk is not None
+        return self._disk
+
+    def _disk_key(self, key: tuple, generation: int) -> str:
+        return hashlib.sha256(repr((generation, key)).encode()).hexdigest()
+
+    def _disk_get(
+        self, key: tuple, generation: int, brief: bool
+    ) -> Optional[list[Note]]:
+        """Look up results in the on-disk cache"""
+
+        cache = self._disk_cache() if key[0] in self.DISK_CACHED else None
+        if cache is None:
+            return None
+        value = cache.get(self._disk_key(key, generation))
+        if value is None:
+            return None
+        import json
+
+        with tracing.span("cache.disk") as span:
+            load_content = self.load_content if brief else None
+            notes = [Note.from_dict(d, load_content) for d in json.loads(value)]
+            span.rows = len(notes)
+        return notes
+
+    def _disk_put(
+        self, key: tuple, generation: int, notes: list[Note], brief: bool
+    ) -> None:
+        """Store results in the on-disk cache"""
+
+        cache = self._disk_cache() if key[0] in self.DISK_CACHED else None
+        if cache is not None:
+            import json
+
+            value = json.dumps([note.to_dict(brief) for note in notes])
+            cache.put(self._disk_key(key, generation), value.encode())
+
+    def add(self, notes: Iterable[Note], batch_size: int = 1000) -> int:
+        """Save one or more notes to the DB, one transaction per batch
+
+        Notes are consumed lazily, so `notes` can be a generator over a large
+        import. Each saved note has its id set to the id it was stored under.
+
+        Args:
+            notes (Iterable[Note]): the notes to be added
+            batch_size (int): The number of notes written per transaction
+
+        Returns:
+            int: The number of notes added
+        """
+
+        count = 0
+        index = self._similar_index()
+        completions = self._completion_index()
+        notes = iter(notes)
+        # the index is locked before the DB, and only ever waited on outside
+        # of DB transactions, so writers cannot deadlock
+        with nullcontext() if index is None else index.locked():
+            while batch := list(islice(notes, max(batch_size, 1))):
+                with tracing.span("db.add") as span:
+                    self._add_batch(batch)
+                    span.rows = len(batch)
+                # a full tail is rebuilt from the DB after the last batch anyway
+                if completions is not None and not completions.full:
+                    with tracing.span("complete.add") as span:
+                        completions.add(batch)
+                        span.rows = len(batch)
+                if index is not None:
+                    with tracing.span("similar.add") as span:
+                        index.add(batch)
+                        span.rows = len(batch)
+                count += len(batch)
+            if index is not None and count:
+                index.save()
+        if completions is not None and completions.full:
+            self.rebuild_completions()
+        return count
+
+    @property
+    def similar_index_path(self) -> Optional[str]:
+        """The directory of the `sc similar` index, see `similar_index_path`"""
+
+        return similar_index_path(self.db_file)
+
+    def _similar_index(self) -> Optional["SimilarityIndex"]:
+        """The `sc similar` index to keep up to date, if one was built"""
+
+        path = self.similar_index_path
+        if path is None or not os.path.isdir(path):
+            return None
+        try:
+            from similarity import SimilarityIndex
+        except ImportError:
+            # NumPy was uninstalled since; `sc similar` rebuilds a stale index
+            return None
+        return SimilarityIndex(path)
+
+    @property
+    def completion_index_path(self) -> Optional[str]:
+        """The directory of the tab-completion index, see `completion_index_path`"""
+
+        return completion_index_path(self.db_file)
+
+    def _completion_index(self) -> Optional["CompletionIndex"]:
+        """The tab-completion index to keep up to date, if one was built"""
+
+        path = self.completion_index_path
+        if path is None or not os.path.isdir(path):
+            return None
+        from completion import CompletionIndex
+
+        return CompletionIndex(path)
+
+    def rebuild_completions(self) -> int:
+        """Build the tab-completion index from every note, see `CompletionIndex`
+
+        Once the index exists, `add`, `update`, `delete` and `sync_files` keep
+        it up to date.
+
+        Returns:
+            int: The number of entries indexed
+
+        Raises:
+            ValueError: If the DB is in memory
+        """
+
+        path = self.completion_index_path
+        if path is None:
+            raise ValueError("Completion needs a DB file")
+        from completion import CompletionIndex
+
+        with tracing.span("complete.build") as span:
+            titles = self.conn.execute("SELECT id, title FROM notes")
+            tags = self.conn.execute(
+                """
+                SELECT name FROM tags
+                WHERE EXISTS (SELECT 1 FROM note_tags WHERE tag_id = tags.id)
+                """
+            )
+            count = span.rows = CompletionIndex(path).build(
+                titles, (name for name, in tags)
+            )
+        return count
+
+    def _update_completions(self, notes: list[Note], deleted: list[int]) -> None:
+        """Index changed notes for tab-completion, rebuilding once the tail is full"""
+
+        index = self._completion_index() if notes or deleted else None
+        if index is None:
+            return
+        if index.full:
+            self.rebuild_completions()
+            return
+        with tracing.span("complete.add") as span:
+            index.remove(deleted)
+            index.add(notes)
+            span.rows = len(notes) + len(deleted)
+
+    def _add_batch(self, notes: list[Note]) -> None:
+        """Insert a batch of notes in a single transaction, see `_insert`
+
+        Args:
+            notes (List[Note]): the notes to be added
+        """
+
+        with self._transaction():
+            self._insert(notes)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Run writes in one transaction, taking the write lock up front"""
+
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _insert(self, notes: list[Note]) -> None:
+        """Insert notes within the current transaction
+
+        Ids are assigned up front under the write lock, which lets the notes
+        and their tags go in with `executemany` instead of a round trip per row.
+        Only bodies not already in the DB are compressed and written. The
+        notes are staged in a temp table and moved over with one INSERT, so
+        the FTS triggers run within a single statement rather than one per row.
+
+        Args:
+            notes (List[Note]): the notes to be added
+        """
+
+        self.cursor.execute(
+            """
+            SELECT max(
+            coalesce((SELECT seq FROM sqlite_sequence WHERE name = 'notes'), 0),
+            coalesce((SELECT max(id) FROM notes), 0)
+            )
+            """
+        )
+        next_id = self.cursor.fetchone()[0] + 1
+        # convert tags[] to a string and content[] to its body hash for SQL
+        rows, texts = [], {}
+        for id, note in enumerate(notes, start=next_id):
+            note.id = id
+            text = note.text
+            hash = body_hash(text)
+            texts.setdefault(hash, text)
+            rows.append((id, note.name, ",".join(note.tags), hash))
+
+        self.cursor.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS notes_staging (
+            id INTEGER PRIMARY KEY, title TEXT, tags TEXT, body_hash BLOB
+            )
+            """
+        )
+        self.cursor.executemany("INSERT INTO notes_staging VALUES (?, ?, ?, ?)", rows)
+        new_hashes = self.cursor.execute(
+            """
+            SELECT DISTINCT body_hash FROM notes_staging WHERE NOT EXISTS (
+            SELECT 1 FROM bodies WHERE hash = notes_staging.body_hash
+            )
+            """
+        ).fetchall()
+        self._add_bodies(texts, [hash for hash, in new_hashes])
+        self.cursor.execute(
+            """
+            INSERT INTO notes (id, title, tags, body_hash)
+            SELECT id, title, tags, body_hash FROM notes_staging ORDER BY id
+            """
+        )
+        self.cursor.execute("DELETE FROM notes_staging")
+        self._add_tags((note.id, tag) for note in notes for tag in note.tags)
+
+    def _add_bodies(self, texts: dict[bytes, str], new: list[bytes]) -> None:
+        """Write the bodies not in the DB yet, compressed, and index their code
+
+        Args:
+            texts (dict[bytes, str]): The texts of the bodies by hash
+            new (list[bytes]): The hashes of the bodies to write
+        """
+
+        self.cursor.executemany(
+            "INSERT INTO bodies (hash, content) VALUES (?, ?)",
+            ((hash, deflate(texts[hash], self.compress_min_bytes)) for hash in new),
+        )
+        self._add_code_blocks((hash, texts[hash]) for hash in new)
+
+    def _update(self, notes: list[Note]) -> int:
+        """Overwrite the name, tags and content of notes within the current transaction
+
+        Notes are updated one at a time, each after checking its body is
+        stored: the update trigger drops a body once no note uses it, even
+        if a later note in the same batch is moving onto it, as when two
+        notes swap contents.
+
+        Args:
+            notes (List[Note]): The notes, with the ids of the notes to overwrite
+
+        Returns:
+            int: The number of notes found and updated
+        """
+
+        count = 0
         for note in notes:
-            # convert tags[] and content[] to strings for SQL
-            tags_str = ",".join(note.tags)
-            content_str = "\n".join(note.content)
+            text = note.text
+            hash = body_hash(text)
+            if (
+                self.cursor.execute(
+                    "SELECT 1 FROM bodies WHERE hash = ?", (hash,)
+                ).fetchone()
+                is None
+            ):
+                self._add_bodies({hash: text}, [hash])
+            # the update trigger reindexes the note and drops orphaned bodies
+            self.cursor.execute(
+                "UPDATE notes SET title = ?, tags = ?, body_hash = ? WHERE id = ?",
+                (note.name, ",".join(note.tags), hash, note.id),
+            )
+            count += self.cursor.rowcount
+        self.cursor.executemany(
+            "DELETE FROM note_tags WHERE note_id = ?", ((note.id,) for note in notes)
+        )
+        self._add_tags((note.id, tag) for note in notes for tag in note.tags)
+        return count
+
+    def _delete(self, ids: list[int]) -> int:
+        """Delete notes within the current transaction
+
+        The delete triggers unindex them, and drop their tag links, sync
+        manifest entries and orphaned bodies.
+
+        Args:
+            ids (List[int]): The ids of the notes
+
+        Returns:
+            int: The number of notes found and deleted
+        """
+
+        self.cursor.executemany(
+            "DELETE FROM notes WHERE id = ?", ((int(id),) for id in ids)
+        )
+        return self.cursor.rowcount
+
+    def update(self, notes: Iterable[Note]) -> int:
+        """Overwrite the name, tags and content of saved notes, in one transaction
+
+        Args:
+            notes (Iterable[Note]): The notes, with the ids of the notes to overwrite
+
+        Returns:
+            int: The number of notes found and updated
+        """
+
+        notes = list(notes)
+        with tracing.span("db.update") as span:
+            with self._transaction():
+                count = span.rows = self._update(notes)
+        self._update_similar(notes, [])
+        self._update_completions(notes, [])
+        return count
+
+    def delete(self, ids: Iterable[int]) -> int:
+        """Delete notes by id, in one transaction
+
+        Args:
+            ids (Iterable[int]): The ids of the notes; missing ids are skipped
+
+        Returns:
+            int: The number of notes deleted
+        """
+
+        ids = [int(id) for id in ids]
+        with tracing.span("db.delete") as span:
+            with self._transaction():
+                count = span.rows = self._delete(ids)
+        self._update_similar([], ids)
+        self._update_completions([], ids)
+        return count
+
+    def _update_similar(self, notes: list[Note], deleted: list[int]) -> None:
+        """Reindex updated notes and drop deleted ones from the `sc similar` index"""
+
+        index = self._similar_index() if notes or deleted else None
+        if index is None:
+            return
+        with tracing.span("similar.update") as span, index.locked():
+            index.remove(deleted)
+            index.add(notes)
+            index.save()
+            span.rows = len(notes) + len(deleted)
+
+    def manifest(self, root: str) -> dict[str, tuple[int, int]]:
+        """The files last synced from a directory, see `sync_files`
+
+        Args:
+            root (str): The absolute path of the directory
+
+        Returns:
+            dict[str, tuple[int, int]]: The mtime (ns) and size of each file, by
+                path relative to root
+        """
+
+        rows = self.cursor.execute(
+            "SELECT path, mtime_ns, size FROM sync_files WHERE root = ?", (root,)
+        )
+        return {path: (mtime_ns, size) for path, mtime_ns, size in rows}
+
+    def manifest_entry(self, root: str, path: str) -> Optional[tuple[bytes, int]]:
+        """The content hash and note id of a synced file
+
+        Args:
+            root (str): The absolute path of the directory
+            path (str): The path of the file relative to root
+
+        Returns:
+            Optional[tuple[bytes, int]]: The hash and note id, None if the file
+                was not synced
+        """
+
+        return self.cursor.execute(
+            "SELECT hash, note_id FROM sync_files WHERE root = ? AND path = ?",
+            (root, path),
+        ).fetchone()
+
+    def sync_files(
+        self,
+        root: str,
+        files: list[tuple[str, int, int, bytes, Optional[Note]]],
+        removed: list[str],
+        archive: bool = False,
+    ) -> tuple[int, int, int]:
+        """Apply the changes found in a synced directory, in one transaction
+
+        Args:
+            root (str): The absolute path of the directory
+            files (list[tuple[str, int, int, bytes, Optional[Note]]]): The path,
+                mtime (ns), size, content hash and note of each new or changed
+                file. The note has id 0 for a new file, the id of its note for a
+                changed one, and is None when only the mtime changed.
+            removed (list[str]): The paths of the files that are gone
+            archive (bool): Tag the notes of removed files `ARCHIVE_TAG` instead
+                of deleting them
+
+        Returns:
+            tuple[int, int, int]: The number of notes added, updated and removed
+        """
+
+        gone = [
+            entry[1]
+            for path in removed
+            if (entry := self.manifest_entry(root, path)) is not None
+        ]
+        added = [note for *_, note in files if note is not None and not note.id]
+        updated = [note for *_, note in files if note is not None and note.id]
+
+        archived = []
+        with tracing.span("db.sync") as span:
+            with self._transaction():
+                if added:
+                    self._insert(added)
+                if updated:
+                    self._update(updated)
+                if archive:
+                    archived = [
+                        Note(
+                            note.name,
+                            [*note.tags, self.ARCHIVE_TAG],
+                            note.content,
+                            note.id,
+                        )
+                        for note in self.iter_ids(gone)
+                        if self.ARCHIVE_TAG not in note.tags
+                    ]
+                    self._update(archived)
+                    self.cursor.executemany(
+                        "DELETE FROM sync_files WHERE root = ? AND path = ?",
+                        ((root, path) for path in removed),
+                    )
+                    gone = []
+                else:
+                    self._delete(gone)
+                self.cursor.executemany(
+                    """
+                    INSERT OR REPLACE INTO sync_files
+                    (root, path, mtime_ns, size, hash, note_id) VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        (root, path, mtime_ns, size, hash, note.id)
+                        for path, mtime_ns, size, hash, note in files
+                        if note is not None
+                    ),
+                )
+                # touched but unchanged files only need their new mtime
+                self.cursor.executemany(
+                    """
+                    UPDATE sync_files SET mtime_ns = ?, size = ?
+                    WHERE root = ? AND path = ?
+                    """,
+                    (
+                        (mtime_ns, size, root, path)
+                        for path, mtime_ns, size, _, note in files
+                        if note is None
+                    ),
+                )
+            span.rows = len(files) + len(removed)
+        self._update_similar(added + updated + archived, gone)
+        self._update_completions(added + updated + archived, gone)
+        return len(added), len(updated), len(archived) + len(gone)
+
+    def _iter_notes(
+        self, query: str, params: Iterable = (), brief: bool = False
+    ) -> Iterator[Note]:
+        """Run a query and stream its rows as Notes, `FETCH_SIZE` rows at a time
+
+        Each call gets its own cursor, so several iterators can be consumed
+        at once. Rows that do not make a valid Note are skipped.
 
-            self.cursor.execute(query, (note.name, tags_str, content_str))
+        Args:
+            query (str): The SQL query, selecting `COLUMNS` or `SUMMARY_COLUMNS`
+            params (Iterable): The query parameters
+            brief (bool): The query selects `SUMMARY_COLUMNS`
+
+        Yields:
+            Note: The notes built from the result rows
+        """
+
+        from_row = self._from_row(brief)
+        for rows in self._iter_rows(query, params):
+            with tracing.span("note.from_sql") as span:
+                notes = [note for note in map(from_row, rows) if note is not None]
+                span.rows = len(notes)
+            yield from notes
+
+    def _iter_rows(self, query: str, params: Iterable = ()) -> Iterator[list[tuple]]:
+        """Run a query on a cursor of its own and stream its rows in chunks
+
+        Args:
+            query (str): The SQL query
+            params (Iterable): The query parameters
+
+        Yields:
+            list[tuple]: Up to `FETCH_SIZE` rows at a time
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            with tracing.span("db.query"):
+                cursor.execute(query, tuple(params))
+            while True:
+                with tracing.span("db.fetch") as span:
+                    rows = cursor.fetchmany(self.FETCH_SIZE)
+                    span.rows = len(rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def _from_row(self, brief: bool) -> Callable[[tuple], Optional[Note]]:
+        """The function building a Note from a row of `COLUMNS` or `SUMMARY_COLUMNS`"""
+
+        if brief:
+            return partial(Note.from_summary, load_content=self.load_content)
+        return Note.from_sql
+
+    def load_content(self, id: int) -> str:
+        """Fetch the content of a single note, for headline-only Notes
+
+        Args:
+            id (int): The id of the note
+
+        Returns:
+            str: The content of the note
+        """
+
+        row = self.conn.execute(
+            f"SELECT {self.CONTENT} FROM notes WHERE id = ?", (id,)
+        ).fetchone()
+        return inflate(row[0]) if row else ""
+
+    def compact(self, batch_size: int = 1000) -> int:
+        """Compress the stored bodies of existing notes, then VACUUM the DB
+
+        Bodies saved before compression was enabled (or under a higher
+        `compress_min_bytes`) are rewritten as they would be stored today,
+        one transaction per batch, and VACUUM hands the freed pages back to
+        the file system.
+
+        Args:
+            batch_size (int): The number of bodies rewritten per transaction
+
+        Returns:
+            int: The number of bodies compressed
+        """
+
+        count = 0
+        if self.compress_min_bytes > 0:
+            ids = [
+                row[0]
+                for row in self.conn.execute(
+                    """
+                    SELECT rowid FROM bodies WHERE typeof(content) = 'text'
+                    AND length(CAST(content AS BLOB)) >= ?
+                    """,
+                    (self.compress_min_bytes,),
+                )
+            ]
+            batch_size = max(batch_size, 1)
+            for i in range(0, len(ids), batch_size):
+                with tracing.span("db.compact") as span:
+                    rows = self._compact_batch(ids[i : i + batch_size])
+                    span.rows = rows
+                count += rows
+        self.conn.commit()
+        self.cursor.execute("VACUUM")
+        # in WAL mode the vacuumed pages are only copied back on a checkpoint
+        self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return count
+
+    def _compact_batch(self, ids: list[int]) -> int:
+        """Compress a batch of bodies in a single transaction
+
+        Args:
+            ids (List[int]): The rowids of the bodies
+
+        Returns:
+            int: The number of bodies that shrank and were rewritten
+        """
+
+        placeholders = ", ".join("?" * len(ids))
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.cursor.execute(
+                f"""
+                SELECT rowid, content FROM bodies
+                WHERE rowid IN ({placeholders}) AND typeof(content) = 'text'
+                """,
+                ids,
+            ).fetchall()
+            updates = []
+            for id, content in rows:
+                compressed = deflate(content, self.compress_min_bytes)
+                if isinstance(compressed, bytes):
+                    updates.append((compressed, id))
+            self.cursor.executemany(
+                "UPDATE bodies SET content = ? WHERE rowid = ?", updates
+            )
             self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return len(updates)
+
+    def _columns(self, brief: bool) -> str:
+        """The columns to select for full or headline-only Notes"""
+
+        return self.SUMMARY_COLUMNS if brief else self.COLUMNS
+
+    @cached_query
+    def iter_notes(
+        self,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+    ) -> Iterator[Note]:
+        """Stream all or the n most recent Notes from the DB, oldest first
 
-    def get(self, n: int = 0) -> Optional[list[Note]]:
+        Pages are keyset-based: `before_id`/`after_id` seek on the primary key,
+        so any page costs the same as the newest one.
+
+        Args:
+            n (int): The number of most recent notes to retrieve. Defaults to 0, where 0 returns all notes.
+            before_id (Optional[int]): Only notes with a lower id; the page ends just before it
+            after_id (Optional[int]): Only notes with a higher id; the page starts just after it
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The retrieved Notes, fetched as they are consumed
+        """
+
+        conditions, params, order = keyset(int(n), before_id, after_id, "id")
+        query = f"SELECT {self._columns(brief)} FROM notes"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return self._iter_notes(*paginate(query, params, order, int(n), "id"), brief)
+
+    def iter_since(
+        self,
+        after_id: Optional[int] = None,
+        since: Optional[str] = None,
+        brief: bool = False,
+    ) -> Iterator[Note]:
+        """Stream the notes saved after an id and/or since a time, oldest first
+
+        For incremental exports: pass the last id of the previous export, or
+        the time it ran.
+
+        Args:
+            after_id (Optional[int]): Only notes with a higher id
+            since (Optional[str]): Only notes saved at or after this UTC time,
+                formatted like `created_at` ("YYYY-MM-DD HH:MM:SS") or a prefix of it
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The notes, fetched as they are consumed
+        """
+
+        conditions, params, _ = keyset(0, None, after_id, "id")
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        query = f"SELECT {self._columns(brief)} FROM notes"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return self._iter_notes(query + " ORDER BY id", params, brief)
+
+    def iter_ids(self, ids: list[int], brief: bool = False) -> Iterator[Note]:
+        """Stream the notes with the given ids, in the order of the ids
+
+        Args:
+            ids (List[int]): The note ids; ids of missing notes are skipped
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The notes
+        """
+
+        ids = [int(id) for id in ids]
+        placeholders = ", ".join("?" * len(ids))
+        query = f"SELECT {self._columns(brief)} FROM notes WHERE id IN ({placeholders})"
+        notes = {note.id: note for note in self._iter_notes(query, ids, brief)}
+        return (notes[id] for id in ids if id in notes)
+
+    def get(
+        self,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+    ) -> Optional[list[Note]]:
         """Get all or the n most recent Notes from the DB
 
         Args:
             n (int): The number of most recent notes to retrieve. Defaults to 0, where 0 returns all notes.
+            before_id (Optional[int]): Only notes with a lower id
+            after_id (Optional[int]): Only notes with a higher id
+            brief (bool): Only load headlines; content is fetched on first access
 
         Returns:
             List[Note]: A list of retrieved Notes
         """
 
-        query = """
-        SELECT * FROM notes ORDER BY id DESC
+        return list(self.iter_notes(n, before_id, after_id, brief)) or None
+
+    @cached_query
+    def iter_search(
+        self,
+        q: str,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+        lang: Optional[str] = None,
+    ) -> Iterator[Note]:
+        """Stream all notes matching q in name, tags or content, best matches first
+
+        Every word in q must prefix-match a word of the note. Results are
+        ordered by BM25 rank from the FTS5 index, and n keeps the top n.
+        When `before_id`/`after_id` are given the matches are paged by id
+        instead, like `iter_notes`, so that pages are stable.
+
+        With `lang`, only notes with a fenced code block in that language
+        match, looked up in the `code_blocks` index. q can then be empty to
+        list all of them, ordered and paged like `iter_notes`.
+
+        Args:
+            q (str): The term to search for
+            n (int): The maximum number of matches. Defaults to 0, where 0 returns all matches.
+            before_id (Optional[int]): Only matches with a lower id
+            after_id (Optional[int]): Only matches with a higher id
+            brief (bool): Only load headlines; content is fetched on first access
+            lang (Optional[str]): Only notes with a code block in this language
+
+        Returns:
+            Iterator[Note]: The matched notes, fetched as they are consumed
+
+        Raises:
+            ValueError: If both q and lang are empty
         """
-        # return last n rows if specified; otherwise all
-        if n != 0:
-            query += "LIMIT ?"
-            self.cursor.execute(query, (n,))
-        else:
-            self.cursor.execute(query)
 
-        rows = self.cursor.fetchall()
+        conditions, params = [], []
+        if lang:
+            conditions.append(self.LANG_FILTER)
+            params.append(code_lang(lang))
+        if not q or not q.strip():
+            if not lang:
+                raise ValueError("Search cannot be empty")
+            page_conditions, page_params, order = keyset(
+                int(n), before_id, after_id, "id"
+            )
+            query = f"SELECT {self._columns(brief)} FROM notes WHERE " + " AND ".join(
+                conditions + page_conditions
+            )
+            return self._iter_notes(
+                *paginate(query, params + page_params, order, int(n), "id"), brief
+            )
 
-        notes = [Note.from_sql(row) for row in rows if Note.from_sql(row) is not None]
-        if notes:
-            notes.reverse()
-            return notes
-        else:
-            return None
+        query = f"""
+        SELECT {self._columns(brief)} FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid
+        WHERE notes_fts MATCH ?
+        """
+        query += "".join(f" AND {condition}" for condition in conditions)
+        params = [fts_query(q)] + params
+        if before_id is None and after_id is None:
+            query += " ORDER BY notes_fts.rank"
+            if int(n):
+                query += " LIMIT ?"
+                params.append(int(n))
+            return self._iter_notes(query, params, brief)
 
-    def search(self, q: str) -> Optional[list[Note]]:
-        """Get all notes searching for q in name and tags
+        conditions, page_params, order = keyset(
+            int(n), before_id, after_id, "notes_fts.rowid"
+        )
+        query += "".join(f" AND {condition}" for condition in conditions)
+        return self._iter_notes(
+            *paginate(query, params + page_params, order, int(n), "notes_fts.rowid"),
+            brief,
+        )
+
+    def iter_ranked(
+        self, q: str, n: int = 0, brief: bool = False, lang: Optional[str] = None
+    ) -> Iterator[tuple[float, Note]]:
+        """Stream the notes matching q with their BM25 rank, best matches first
+
+        Like `iter_search` without paging, for merging the matches of several
+        databases by rank.
 
         Args:
             q (str): The term to search for
+            n (int): The maximum number of matches. Defaults to 0, where 0 returns all matches.
+            brief (bool): Only load headlines; content is fetched on first access
+            lang (Optional[str]): Only notes with a code block in this language
 
         Returns:
-            List[Note]: The list of matched notes
+            Iterator[tuple[float, Note]]: The rank (lower is better) and note of each match
 
         Raises:
             ValueError: If q is empty
         """
 
-        if q:
-            query = "SELECT * FROM notes WHERE title LIKE ? or tags LIKE ?"
-            q = f"%{q}%"
-            self.cursor.execute(query, (q, q))
-            rows = self.cursor.fetchall()
-            if rows:
-                return [Note.from_sql(row) for row in rows]
-            else:
-                return None
-        else:
+        if not q or not q.strip():
             raise ValueError("Search cannot be empty")
 
+        query = f"""
+        SELECT {self._columns(brief)}, notes_fts.rank
+        FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid
+        WHERE notes_fts MATCH ?
+        """
+        params = [fts_query(q)]
+        if lang:
+            query += f" AND {self.LANG_FILTER}"
+            params.append(code_lang(lang))
+        query += " ORDER BY notes_fts.rank"
+        if int(n):
+            query += " LIMIT ?"
+            params.append(int(n))
+
+        from_row = self._from_row(brief)
+        return (
+            (row[-1], note)
+            for rows in self._iter_rows(query, params)
+            for row in rows
+            if (note := from_row(row)) is not None
+        )
+
+    def search(
+        self,
+        q: str,
+        n: int = 0,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        brief: bool = False,
+        lang: Optional[str] = None,
+    ) -> Optional[list[Note]]:
+        """Get all notes matching q in name, tags or content, best matches first
+
+        Args:
+            q (str): The term to search for
+            n (int): The maximum number of matches. Defaults to 0, where 0 returns all matches.
+            before_id (Optional[int]): Only matches with a lower id
+            after_id (Optional[int]): Only matches with a higher id
+            brief (bool): Only load headlines; content is fetched on first access
+            lang (Optional[str]): Only notes with a code block in this language
+
+        Returns:
+            List[Note]: The list of matched notes
+
+        Raises:
+            ValueError: If both q and lang are empty
+        """
+
+        return list(self.iter_search(q, n, before_id, after_id, brief, lang)) or None
+
+    def code_blocks(
+        self, note: Note, lang: Optional[str] = None
+    ) -> list[tuple[str, str]]:
+        """The fenced code blocks of a note, from the `code_blocks` index
+
+        Args:
+            note (Note): A note of this DB
+            lang (Optional[str]): Only blocks in this language
+
+        Returns:
+            list[tuple[str, str]]: The language ("" if none was given) and code
+                of each block, in the order they appear
+        """
+
+        query = """
+        SELECT lang, start_line, end_line FROM code_blocks
+        WHERE body_hash = (SELECT body_hash FROM notes WHERE id = ?)
+        """
+        params = [note.id]
+        if lang:
+            query += " AND lang = ?"
+            params.append(code_lang(lang))
+        spans = self.cursor.execute(query + " ORDER BY position", params).fetchall()
+        if not spans:
+            return []
+        lines = note.content
+        return [(lang, "\n".join(lines[start:end])) for lang, start, end in spans]
+
+    @cached_query
+    def iter_tagged(
+        self, tags: list[str], match_all: bool = True, brief: bool = False
+    ) -> Iterator[Note]:
+        """Stream all notes carrying exactly the given tags, oldest first
+
+        Args:
+            tags (List[str]): The tags to look up
+            match_all (bool): Require every tag (all-of) rather than any of them (any-of)
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The matched notes, fetched as they are consumed
+
+        Raises:
+            ValueError: If no tags are given
+        """
+
+        tags = sorted({tag for tag in tags if tag})
+        if not tags:
+            raise ValueError("At least one tag is required")
+
+        placeholders = ", ".join("?" * len(tags))
+        query = f"""
+        SELECT {self._columns(brief)} FROM notes WHERE id IN (
+        SELECT note_tags.note_id FROM tags JOIN note_tags ON note_tags.tag_id = tags.id
+        WHERE tags.name IN ({placeholders}) GROUP BY note_tags.note_id
+        {"HAVING count(*) = ?" if match_all else ""}
+        ) ORDER BY id
+        """
+        params = tags + [len(tags)] if match_all else tags
+        return self._iter_notes(query, params, brief)
+
+    def tagged(
+        self, tags: list[str], match_all: bool = True, brief: bool = False
+    ) -> Optional[list[Note]]:
+        """Get all notes carrying exactly the given tags
+
+        Args:
+            tags (List[str]): The tags to look up
+            match_all (bool): Require every tag (all-of) rather than any of them (any-of)
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            List[Note]: The list of matched notes, oldest first
+
+        Raises:
+            ValueError: If no tags are given
+        """
+
+        return list(self.iter_tagged(tags, match_all, brief)) or None
+
+    @cached_query
+    def iter_fuzzy(self, q: str, n: int = 0, brief: bool = False) -> Iterator[Note]:
+        """Stream notes whose name or tags resemble q, despite typos, best first
+
+        Candidates come from the trigram index (any shared trigram) in index
+        rank order, and are then ranked by trigram similarity to q.
+
+        Args:
+            q (str): The term to search for, at least 3 characters
+            n (int): The maximum number of matches. Defaults to 0, where 0 returns all matches.
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            Iterator[Note]: The matched notes, fetched as they are consumed
+
+        Raises:
+            ValueError: If q has fewer than 3 characters
+        """
+
+        grams = trigrams(q, pad=False)
+        if not grams:
+            raise ValueError("Fuzzy search needs at least 3 characters")
+
+        match = " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams)
+        query = f"""
+        SELECT {self._columns(brief)} FROM notes WHERE id IN (
+        SELECT rowid FROM notes_trigram WHERE notes_trigram MATCH ?
+        ORDER BY rank LIMIT ?
+        )
+        """
+        notes = self._iter_notes(query, (match, self.FUZZY_CANDIDATES), brief)
+
+        scored = []
+        for note in notes:
+            score = fuzzy_score(q, note)
+            if score >= self.FUZZY_THRESHOLD:
+                scored.append((-score, note.id, note))
+        scored.sort(key=lambda item: item[:2])
+        if int(n):
+            scored = scored[: int(n)]
+        return (note for _, _, note in scored)
+
+    def fuzzy(self, q: str, n: int = 0, brief: bool = False) -> Optional[list[Note]]:
+        """Get notes whose name or tags resemble q, despite typos, best first
+
+        Args:
+            q (str): The term to search for, at least 3 characters
+            n (int): The maximum number of matches. Defaults to 0, where 0 returns all matches.
+            brief (bool): Only load headlines; content is fetched on first access
+
+        Returns:
+            List[Note]: The list of matched notes
+
+        Raises:
+            ValueError: If q has fewer than 3 characters
+        """
+
+        return list(self.iter_fuzzy(q, n, brief)) or None
+
+    def iter_duplicates(self) -> Iterator[tuple[int, list[Note]]]:
+        """Stream the groups of notes that share the same content
+
+        Groups with the most copies come first. The notes are headline-only,
+        and their content is fetched on first access.
+
+        Yields:
+            tuple[int, list[Note]]: The stored size of the shared body in bytes,
+                and the notes sharing it, oldest first
+        """
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                f"""
+                SELECT {self.SUMMARY_COLUMNS}, dup.body_hash,
+                length(CAST(bodies.content AS BLOB)) FROM (
+                SELECT body_hash, count(*) AS copies FROM notes
+                GROUP BY body_hash HAVING copies > 1
+                ) AS dup
+                JOIN notes ON notes.body_hash = dup.body_hash
+                JOIN bodies ON bodies.hash = dup.body_hash
+                ORDER BY dup.copies DESC, dup.body_hash, notes.id
+                """
+            )
+            for _, rows in groupby(cursor, key=lambda row: row[4]):
+                rows = list(rows)
+                notes = [Note.from_summary(row, self.load_content) for row in rows]
+                yield rows[0][5], [note for note in notes if note is not None]
+        finally:
+            cursor.close()
+
     @property
     def db_file(self) -> str:
         return self._db_file
@@ -140,3 +1720,289 @@ class NotesDB:
             if not os.path.exists(dir):
                 os.makedirs(dir)
             self._db_file = f
+
+
+def similar_index_path(db_file: str) -> Optional[str]:
+    """The directory of the `sc similar` index of a DB, kept next to it
+
+    Args:
+        db_file (str): The path to the SQLite file
+
+    Returns:
+        Optional[str]: The directory, or None for an in-memory DB
+    """
+
+    if db_file == ":memory:":
+        return None
+    return os.path.splitext(db_file)[0] + ".similar"
+
+
+def completion_index_path(db_file: str) -> Optional[str]:
+    """The directory of the tab-completion index of a DB, kept next to it
+
+    Args:
+        db_file (str): The path to the SQLite file
+
+    Returns:
+        Optional[str]: The directory, or None for an in-memory DB
+    """
+
+    if db_file == ":memory:":
+        return None
+    return os.path.splitext(db_file)[0] + ".complete"
+
+
+def query_cache_path(db_file: str) -> str:
+    """The file of the on-disk query result cache of a DB, next to it
+
+    Args:
+        db_file (str): The path to the SQLite file
+
+    Returns:
+        str: The path to the cache file
+    """
+
+    return os.path.splitext(db_file)[0] + ".cache.sqlite3"
+
+
+def _int_setting(key: str, default: int) -> int:
+    """A whole number setting, falling back to its default if it is not one
+
+    Args:
+        key (str): The setting
+        default (int): The default of the setting
+
+    Returns:
+        int: The configured value, or the default
+    """
+
+    try:
+        return int(config.get(key))
+    except (TypeError, ValueError):
+        return default
+
+
+def _keyword_setting(key: str, default: str, choices: Iterable[str]) -> str:
+    """A keyword setting, falling back to its default if it is not a choice
+
+    Args:
+        key (str): The setting
+        default (str): The default of the setting
+        choices (Iterable[str]): The keywords allowed, in lower case
+
+    Returns:
+        str: The configured keyword in lower case, or the default
+    """
+
+    value = str(config.get(key)).strip().lower()
+    return value if value in choices else default
+
+
+def body_hash(text: str) -> bytes:
+    """The key a note body is stored under in the `bodies` table
+
+    Args:
+        text (str): The content of the note
+
+    Returns:
+        bytes: The SHA-256 digest of the content
+    """
+
+    return hashlib.sha256(text.encode()).digest()
+
+
+# a code fence line: up to 3 spaces of indent, 3 or more backticks or
+# tildes, then the info string, whose first word is the language
+CODE_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$", re.MULTILINE)
+# common short names of languages, so `--lang py` finds ```python blocks
+LANG_ALIASES = {
+    "py": "python",
+    "python3": "python",
+    "js": "javascript",
+    "ts": "typescript",
+    "sh": "bash",
+    "shell": "bash",
+    "yml": "yaml",
+    "rb": "ruby",
+    "rs": "rust",
+    "golang": "go",
+    "c++": "cpp",
+}
+
+
+def code_lang(lang: str) -> str:
+    """Normalize the language of a code block, e.g. "Py" or "{.python}" to "python"
+
+    Args:
+        lang (str): The language as written after the fence
+
+    Returns:
+        str: The lowercase language, "" if none was given
+    """
+
+    lang = lang.strip("{}.").lower()
+    return LANG_ALIASES.get(lang, lang)
+
+
+def parse_code_blocks(text: str) -> list[tuple[str, int, int]]:
+    """Find the fenced code blocks of a markdown text
+
+    Follows CommonMark: a block closes at a fence of the same character at
+    least as long as the opening one, or at the end of the text.
+
+    Args:
+        text (str): The markdown text
+
+    Returns:
+        list[tuple[str, int, int]]: The language of each block, and the first
+            and past-the-end line numbers of its code (fences excluded)
+    """
+
+    if "```" not in text and "~~~" not in text:
+        return []
+
+    blocks = []
+    fence = None
+    line, pos = 0, 0
+    for match in CODE_FENCE.finditer(text):
+        line += text.count("\n", pos, match.start())
+        pos = match.start()
+        marker, info = match.groups()
+        if fence is None:
+            # backticks in the info string make it inline code, not a fence
+            if marker[0] == "`" and "`" in info:
+                continue
+            fence, start = marker, line + 1
+            words = info.split(maxsplit=1)
+            lang = code_lang(words[0]) if words else ""
+        elif marker[0] == fence[0] and len(marker) >= len(fence) and not info.strip():
+            blocks.append((lang, start, line))
+            fence = None
+    if fence is not None:
+        blocks.append((lang, start, text.count("\n", pos) + line + 1))
+    return blocks
+
+
+def fts_query(q: str) -> str:
+    """Turn user input into an FTS5 query of quoted prefix terms
+
+    Quoting keeps FTS5 operators and punctuation in q from being parsed as
+    query syntax.
+
+    Args:
+        q (str): The raw search input
+
+    Returns:
+        str: The FTS5 MATCH expression
+    """
+
+    terms = ('"' + term.replace('"', '""') + '"*' for term in q.split())
+    return " ".join(terms)
+
+
+def trigrams(s: str, pad: bool = True) -> set[str]:
+    """The set of lowercase trigrams of a string
+
+    Args:
+        s (str): The string
+        pad (bool): Pad each word with spaces first, like pg_trgm, so that
+            word starts and short words carry more weight
+
+    Returns:
+        set[str]: The trigrams of s
+    """
+
+    s = " ".join(s.lower().split())
+    if pad:
+        s = " ".join(f"  {word} " for word in s.split())
+    return {s[i : i + 3] for i in range(len(s) - 2)}
+
+
+def trigram_similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the padded trigrams of two strings
+
+    Args:
+        a (str): The first string
+        b (str): The second string
+
+    Returns:
+        float: The similarity, from 0 (nothing shared) to 1 (same trigrams)
+    """
+
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def fuzzy_score(q: str, note: Note) -> float:
+    """How closely q resembles the name, a word of the name, or a tag of a note
+
+    Args:
+        q (str): The search term
+        note (Note): The note
+
+    Returns:
+        float: The best trigram similarity, from 0 to 1
+    """
+
+    return max(
+        trigram_similarity(q, target)
+        for target in [note.name, *note.name.split(), *note.tags]
+    )
+
+
+def keyset(
+    n: int, before_id: Optional[int], after_id: Optional[int], column: str
+) -> tuple[list[str], list[int], str]:
+    """Build the conditions for a keyset page over an id column
+
+    Args:
+        n (int): The page size, 0 for no limit
+        before_id (Optional[int]): The exclusive upper bound of the page
+        after_id (Optional[int]): The exclusive lower bound of the page
+        column (str): The id column to seek on
+
+    Returns:
+        tuple[list[str], list[int], str]: The SQL conditions, their parameters
+            and the direction to walk the index in
+    """
+
+    conditions, params = [], []
+    if before_id is not None:
+        conditions.append(f"{column} < ?")
+        params.append(int(before_id))
+    if after_id is not None:
+        conditions.append(f"{column} > ?")
+        params.append(int(after_id))
+
+    # a limited page walks back from the newest/before_id, unless it only
+    # has a lower bound, where it walks forward from after_id
+    if n and (after_id is None or before_id is not None):
+        return conditions, params, "DESC"
+    return conditions, params, "ASC"
+
+
+def paginate(
+    query: str, params: list, order: str, n: int, column: str
+) -> tuple[str, list]:
+    """Order and limit a keyset page so it always comes out oldest first
+
+    Args:
+        query (str): The filtered SQL query
+        params (list): The query parameters
+        order (str): The direction returned by `keyset`
+        n (int): The page size, 0 for no limit
+        column (str): The id column to order by
+
+    Returns:
+        tuple[str, list]: The paged query and its parameters
+    """
+
+    query = f"{query} ORDER BY {column} {order}"
+    if n:
+        query += " LIMIT ?"
+        params = params + [n]
+    if order == "DESC":
+        query = f"SELECT * FROM ({query}) ORDER BY id"
+    return query, params
@@ -1,49 +1,192 @@
 #!/home/jeff/Dev/cs50p/project/.venv/bin/python
+# first, so tracing.START is taken before anything else is imported
+import tracing
+
 import argparse
-import re
+import os
 import sys
+import time
+from typing import Iterable, Optional, TYPE_CHECKING
+
+from config import config
+from note import Note, parse_tags
+from notesdb import NotesDB, similar_index_path
 
-from rich import print
-from rich.panel import Panel
+if TYPE_CHECKING:
+    from daemon import DaemonClient
+    from federation import FederatedDB
 
-from note import Note
-from notesdb import NotesDB
+# modes answered by a running `sc serve` daemon instead of opening the DB
+DAEMON_MODES = {"new", "n", "list", "l", "search", "s", "tag", "t"}
+# modes that only read, and so open the DB read-only
+READ_MODES = {
+    "list",
+    "l",
+    "search",
+    "s",
+    "tag",
+    "t",
+    "dedupe",
+    "export",
+    "e",
+    "complete",
+}
+# how similar a saved note must be for `sc new` to point it out
+SIMILAR_WARNING = 0.8
+# queries whose results are cached on disk when no daemon answers them
+CACHED_MODES = {"list", "l", "search", "s", "tag", "t"}
+# notes rendered ahead of what the pager has shown, see `page_notes`
+PAGER_AHEAD = 32
+# modes that can search several databases at once
+FEDERATED_MODES = {"list", "l", "search", "s", "tag", "t"}
 
 
 def main() -> None:
     """Main function call for SC that handles Ctrl-C exits"""
 
+    start = time.perf_counter()
     args = get_args()
-    db = NotesDB()
+    if args.profile:
+        tracing.enable()
+    tracing.record("imports", start - tracing.START)
+    tracing.record("args", time.perf_counter() - start)
+    with tracing.span("open"):
+        db = open_db(args.mode, args.db)
     try:
         match args.mode:
             case "new" | "n":
                 note = Note.new(args.name)
+                warn_similar(db, note)
                 if note.confirm():
+                    config.save()
                     db.add([note])
             case "list" | "l":
-                notes = db.get(args.num)
-                if notes:
-                    for note in notes:
-                        print(note, "\n")
+                try:
+                    notes = db.iter_notes(
+                        args.num, args.before_id, args.after_id, args.brief
+                    )
+                except ValueError as e:
+                    sys.exit(f"{e}.")
                 else:
-                    sys.exit("No notes found.")
+                    print_notes(notes, "No notes found.", args.brief, args.pager)
             case "search" | "s":
+                # code output needs the content, so skip headline-only fetches
+                brief = args.brief and not args.code
+                try:
+                    if args.fuzzy:
+                        if args.lang:
+                            sys.exit("--lang cannot be combined with --fuzzy.")
+                        notes = db.iter_fuzzy(args.query or "", args.num, brief)
+                    else:
+                        notes = db.iter_search(
+                            args.query,
+                            args.num,
+                            args.before_id,
+                            args.after_id,
+                            brief,
+                            args.lang,
+                        )
+                except ValueError as e:
+                    sys.exit(
+                        f"{e}."
+                        if args.fuzzy or args.query
+                        else "Search term or --lang required."
+                    )
+                if args.code:
+                    print_code(db, notes, args.lang)
+                else:
+                    print_notes(notes, "No matches found.", args.brief, args.pager)
+            case "tag" | "t":
                 try:
-                    notes = db.search(args.query)
+                    notes = db.iter_tagged(
+                        parse_tags(" ".join(args.tags)), not args.any, args.brief
+                    )
                 except ValueError:
-                    sys.exit("Search term required.")
+                    sys.exit("Tag required.")
                 else:
-                    if notes:
-                        for note in notes:
-                            print(note, "\n")
+                    print_notes(notes, "No matches found.", args.brief, args.pager)
+            case "import" | "i":
+                from transfer import read_notes
+
+                config.save()
+                try:
+                    count = db.add(read_notes(args.path), batch_size=args.batch_size)
+                except OSError as e:
+                    sys.exit(f"Import failed: {e}")
+                print(f"Imported {count} notes.")
+            case "compact":
+                before = db_size(db.db_file)
+                count = db.compact()
+                print(
+                    f"Compressed {count} note bodies, "
+                    f"{before} -> {db_size(db.db_file)} bytes."
+                )
+            case "sync":
+                from sync import sync_dir
+
+                config.save()
+                while True:
+                    try:
+                        added, updated, removed = sync_dir(db, args.path, args.archive)
+                    except OSError as e:
+                        sys.exit(f"Sync failed: {e}")
+                    if not args.watch or added or updated or removed:
+                        print(
+                            f"Synced {args.path}: {added} added, {updated} updated, "
+                            f"{removed} {'archived' if args.archive else 'removed'}."
+                        )
+                    if not args.watch:
+                        break
+                    time.sleep(args.interval)
+            case "export" | "e":
+                from transfer import write_jsonl, write_markdown_dir
+
+                notes = db.iter_since(args.since_id, args.since)
+                try:
+                    if export_format(args) == "jsonl":
+                        count, last_id = write_jsonl(notes, args.path)
                     else:
-                        sys.exit("No matches found.")
+                        count, last_id = write_markdown_dir(notes, args.path, args.jobs)
+                except OSError as e:
+                    sys.exit(f"Export failed: {e}")
+                print(
+                    f"Exported {count} notes"
+                    + (f", up to id {last_id}." if count else "."),
+                    file=sys.stderr,
+                )
+            case "similar":
+                try:
+                    from similarity import open_index
+                except ImportError:
+                    sys.exit("Similar notes need NumPy: pip install numpy")
+                if args.id is None and not args.rebuild:
+                    sys.exit("Note id required.")
+                index = open_index(db, args.rebuild)
+                if args.id is None:
+                    print(f"Indexed {len(index)} notes.")
+                else:
+                    note = next(db.iter_ids([args.id]), None)
+                    if note is None:
+                        sys.exit(f"No note #{args.id}.")
+                    matches = index.search(note.text, args.num, exclude=note.id)
+                    print_similar(db, matches, args.brief)
+            case "dedupe":
+                print_duplicates(db.iter_duplicates())
+            case "complete":
+                complete(db, args.context, args.prefix, args.shell)
+            case "serve":
+                from daemon import serve
+
+                try:
+                    serve(db, args.socket)
+                except OSError as e:
+                    sys.exit(f"Cannot serve: {e}")
     except KeyboardInterrupt:
         print()
         sys.exit(0)
     finally:
         db.close()
+        tracing.report()
 
 
 def get_args() -> argparse.Namespace:
@@ -56,6 +199,19 @@ def get_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         prog="sc", description="snipcache programming knowledge db"
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print the time spent in each phase (or set SC_TRACE=json)",
+    )
+    parser.add_argument(
+        "--db",
+        action="append",
+        default=[],
+        metavar="NAME",
+        help="use the named database from the [databases] settings, repeat to "
+        "search several at once, or 'all'",
+    )
     subparsers = parser.add_subparsers(dest="mode")
 
     new_parser = subparsers.add_parser("new", aliases=["n"], help="Create a new note")
@@ -65,27 +221,587 @@ def get_args() -> argparse.Namespace:
 
     list_parser = subparsers.add_parser("list", aliases=["l"], help="List notes")
     list_parser.add_argument("num", nargs="?", default=0, help="last [n] notes to show")
+    add_page_args(list_parser)
+    add_brief_arg(list_parser)
+    add_pager_arg(list_parser)
 
     list_parser = subparsers.add_parser(
         "search", aliases=["s"], help="List all notes by tag"
     )
     list_parser.add_argument("query", nargs="?", default=None, help="tag to search by")
+    list_parser.add_argument(
+        "-n", "--num", type=int, default=0, help="show at most [n] matches"
+    )
+    list_parser.add_argument(
+        "-f",
+        "--fuzzy",
+        action="store_true",
+        help="typo-tolerant match on names and tags (ignores paging)",
+    )
+    list_parser.add_argument(
+        "-l",
+        "--lang",
+        default=None,
+        help="only notes with a code block in [lang], e.g. python",
+    )
+    list_parser.add_argument(
+        "-c",
+        "--code",
+        action="store_true",
+        help="only print the code blocks of the matches (in [lang] if given)",
+    )
+    add_page_args(list_parser)
+    add_brief_arg(list_parser)
+    add_pager_arg(list_parser)
+
+    tag_parser = subparsers.add_parser(
+        "tag", aliases=["t"], help="List notes with exact tags"
+    )
+    tag_parser.add_argument("tags", nargs="*", default=[], help="tags to match")
+    tag_parser.add_argument(
+        "-a", "--any", action="store_true", help="match any of the tags instead of all"
+    )
+    add_brief_arg(tag_parser)
+    add_pager_arg(tag_parser)
+
+    import_parser = subparsers.add_parser(
+        "import", aliases=["i"], help="Import notes from markdown files or JSONL"
+    )
+    import_parser.add_argument(
+        "path", help="directory of markdown files, or a JSONL file"
+    )
+    import_parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="notes written per transaction",
+    )
+
+    sync_parser = subparsers.add_parser(
+        "sync", help="Mirror a directory of markdown files into notes"
+    )
+    sync_parser.add_argument("path", help="directory of markdown files")
+    sync_parser.add_argument(
+        "--archive",
+        action="store_true",
+        help=f"tag the notes of removed files #{NotesDB.ARCHIVE_TAG} instead of deleting them",
+    )
+    sync_parser.add_argument(
+        "-w", "--watch", action="store_true", help="keep running and sync changes"
+    )
+    sync_parser.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="seconds between syncs when watching",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", aliases=["e"], help="Export notes to JSONL or markdown files"
+    )
+    export_parser.add_argument(
+        "path",
+        nargs="?",
+        default="-",
+        help="JSONL file or directory for markdown files, default JSONL to stdout",
+    )
+    export_parser.add_argument(
+        "-f",
+        "--format",
+        choices=["jsonl", "markdown"],
+        default=None,
+        help="defaults to jsonl for .jsonl files and stdout, markdown otherwise",
+    )
+    export_parser.add_argument(
+        "--since-id", type=int, default=None, help="only notes with an id above [id]"
+    )
+    export_parser.add_argument(
+        "--since",
+        type=utc_timestamp,
+        default=None,
+        help="only notes saved at or after an ISO date or time, UTC unless given",
+    )
+    export_parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="markdown files written in parallel"
+    )
+
+    similar_parser = subparsers.add_parser(
+        "similar", help="List the notes most similar to a note"
+    )
+    similar_parser.add_argument("id", type=int, nargs="?", help="id of the note")
+    similar_parser.add_argument(
+        "-n", "--num", type=int, default=5, help="show at most [n] notes"
+    )
+    similar_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="index every note again first, e.g. after an interrupted update",
+    )
+    add_brief_arg(similar_parser)
+
+    subparsers.add_parser(
+        "dedupe", help="Report groups of notes that share the same content"
+    )
+
+    subparsers.add_parser(
+        "compact", help="Compress the content of older notes and VACUUM the DB"
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Keep the DB open and answer other sc commands over a socket"
+    )
+    serve_parser.add_argument(
+        "--socket", default=None, help="socket path, defaults to sc.sock next to the DB"
+    )
+
+    complete_parser = subparsers.add_parser(
+        "complete",
+        help="Complete tags, titles and ids, or print a shell completion script",
+    )
+    complete_parser.add_argument(
+        "context",
+        nargs="?",
+        choices=["search", "tag", "id"],
+        help="what to complete: search terms (tags and titles), tags or note ids",
+    )
+    complete_parser.add_argument(
+        "prefix", nargs="?", default="", help="start of the word to complete"
+    )
+    complete_parser.add_argument(
+        "--shell",
+        choices=["bash", "zsh", "fish"],
+        help="print the completion script for [shell], to source from its startup "
+        "file; run again if db_file changes",
+    )
+
+    args = parser.parse_args()
+    if args.mode in ("export", "e") and args.path == "-" and args.format == "markdown":
+        export_parser.error("markdown export needs a directory path")
+    return args
+
+
+def open_db(
+    mode: str, names: Optional[list[str]] = None
+) -> "NotesDB | DaemonClient | FederatedDB":
+    """Use the `sc serve` daemon when it is running, otherwise open the DB directly
+
+    Args:
+        mode (str): The command being run
+        names (Optional[list[str]]): The databases picked with `--db`, if any
+
+    Returns:
+        NotesDB | DaemonClient | FederatedDB: The notes backend for the command
+    """
+
+    if names:
+        databases = config.databases()
+        if "all" not in names:
+            unknown = [name for name in names if name not in databases]
+            if unknown:
+                sys.exit(f"Unknown database: {', '.join(unknown)}.")
+            databases = {name: databases[name] for name in dict.fromkeys(names)}
+        if len(databases) > 1:
+            if mode not in FEDERATED_MODES:
+                sys.exit("Only list, search and tag can use several databases.")
+            from federation import FederatedDB
+
+            return FederatedDB(databases)
+        [db_file] = databases.values()
+        return NotesDB(
+            db_file, readonly=mode in READ_MODES, disk_cache=mode in CACHED_MODES
+        )
+
+    # checking for the socket first spares the socket imports when no daemon runs
+    if mode in DAEMON_MODES and os.path.exists(config.get("socket_file")):
+        from daemon import DaemonClient
+
+        try:
+            return DaemonClient.connect()
+        except OSError:
+            pass
+    return NotesDB(readonly=mode in READ_MODES, disk_cache=mode in CACHED_MODES)
+
+
+def complete(
+    db: "NotesDB | FederatedDB",
+    context: Optional[str],
+    prefix: str,
+    shell: Optional[str],
+) -> None:
+    """Print completions, or a completion script that reads them without sc
+
+    The completion index is built on first use, and rebuilt when a script
+    is printed; `NotesDB` keeps it up to date afterwards.
+
+    Args:
+        db (NotesDB | FederatedDB): The DB
+        context (Optional[str]): What to complete, see `completion.CONTEXTS`
+        prefix (str): The start of the word to complete
+        shell (Optional[str]): The shell to print the completion script for
+    """
+
+    from completion import CompletionIndex, script
+
+    if not isinstance(db, NotesDB):
+        sys.exit("Completion works on one database at a time.")
+    path = db.completion_index_path
+    if path is None:
+        sys.exit("Completion needs a DB file.")
+    if not shell and not context:
+        sys.exit("Give a context to complete, or --shell.")
+    if shell or not os.path.isdir(path):
+        db.rebuild_completions()
+    if shell:
+        sys.stdout.write(script(shell, path))
+        return
+    for value, description in CompletionIndex(path).lookup(context, prefix):
+        print(f"{value}\t{description}")
+
+
+def db_size(db_file: str) -> int:
+    """The size of a SQLite DB on disk, including its WAL file
+
+    Args:
+        db_file (str): The path to the SQLite file
+
+    Returns:
+        int: The size in bytes, 0 for an in-memory DB
+    """
+
+    return sum(
+        os.path.getsize(path)
+        for path in (db_file, db_file + "-wal")
+        if os.path.exists(path)
+    )
+
+
+def utc_timestamp(s: str) -> str:
+    """Parse an ISO date or time into the UTC format of `created_at`
+
+    Args:
+        s (str): The date or time, like "2024-06-01" or "2024-06-01T09:30+02:00"
+
+    Returns:
+        str: The time as "YYYY-MM-DD HH:MM:SS" in UTC
 
-    return parser.parse_args()
+    Raises:
+        argparse.ArgumentTypeError: If s is not an ISO date or time
+    """
+
+    from datetime import datetime, timezone
+
+    try:
+        t = datetime.fromisoformat(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date or time: {s!r}")
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc)
+    return t.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def parse_tags(s: str) -> list[str]:
-    """Split a given list of tags by any " #," characters
+def export_format(args: argparse.Namespace) -> str:
+    """The format of `sc export`, as given or inferred from the path
 
     Args:
-        s (str): The string containing tags
+        args (argparse.Namespace): The parsed arguments
 
     Returns:
-        list[str]: A list of parsed tags
+        str: "jsonl" or "markdown"
+    """
+
+    if args.format:
+        return args.format
+    if args.path == "-" or args.path.lower().endswith((".jsonl", ".json")):
+        return "jsonl"
+    return "markdown"
+
+
+def add_page_args(parser: argparse.ArgumentParser) -> None:
+    """Add the keyset paging options to a subcommand parser
+
+    Args:
+        parser (argparse.ArgumentParser): The subcommand parser
+    """
+
+    parser.add_argument(
+        "--before-id", type=int, default=None, help="page of notes older than [id]"
+    )
+    parser.add_argument(
+        "--after-id", type=int, default=None, help="page of notes newer than [id]"
+    )
+
+
+def add_brief_arg(parser: argparse.ArgumentParser) -> None:
+    """Add the headline-only output option to a subcommand parser
+
+    Args:
+        parser (argparse.ArgumentParser): The subcommand parser
+    """
+
+    parser.add_argument(
+        "-b", "--brief", action="store_true", help="only show note ids, names and tags"
+    )
+
+
+def add_pager_arg(parser: argparse.ArgumentParser) -> None:
+    """Add the pager output option to a subcommand parser
+
+    Args:
+        parser (argparse.ArgumentParser): The subcommand parser
+    """
+
+    parser.add_argument(
+        "-p",
+        "--pager",
+        action="store_true",
+        help="page the output through $PAGER (default less) as it is rendered",
+    )
+
+
+def rich_print(*objects: object) -> None:
+    """Print through rich, importing it on first use
+
+    Args:
+        *objects (object): The objects to print
+    """
+
+    from rich import print
+
+    print(*objects)
+
+
+def print_notes(
+    notes: Iterable[Note], empty: str, brief: bool = False, pager: bool = False
+) -> None:
+    """Print notes as they arrive, or exit with a message if there are none
+
+    Args:
+        notes (Iterable[Note]): The notes to print
+        empty (str): The exit message when there are no notes
+        brief (bool): Print one plain headline per note instead of the full note
+        pager (bool): Page the notes when printing to a terminal, see `page_notes`
+    """
+
+    if pager and sys.stdout.isatty():
+        return page_notes(notes, empty, brief)
+
+    found = False
+    for note in notes:
+        with tracing.span("print" if brief else "render") as span:
+            if brief:
+                sys.stdout.write(note.headline() + "\n")
+            else:
+                rich_print(note, "\n")
+            span.rows = 1
+        found = True
+    if not found:
+        sys.exit(empty)
+
+
+def page_notes(notes: Iterable[Note], empty: str, brief: bool = False) -> None:
+    """Stream notes into a pager, rendering them on a background thread
+
+    This thread keeps reading notes from the DB, which belongs to it, while
+    a renderer thread writes them to the pager, up to `PAGER_AHEAD` notes
+    behind. The first screen shows as soon as its notes are rendered, and
+    once the user quits the pager both threads stop. Falls back to
+    `print_notes` if the pager cannot be run.
+
+    Args:
+        notes (Iterable[Note]): The notes to page
+        empty (str): The exit message when there are no notes
+        brief (bool): Page one plain headline per note instead of the full note
+    """
+
+    import queue
+    import shlex
+    import shutil
+    import subprocess
+    import threading
+    from itertools import chain
+
+    source = iter(notes)
+    first = next(source, None)
+    if first is None:
+        sys.exit(empty)
+    notes = chain([first], source)
+
+    command = shlex.split(os.environ.get("PAGER") or "less")
+    width = shutil.get_terminal_size().columns
+    try:
+        # like git: quit if it fits on one screen, pass colors, keep the screen
+        pager = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            env={"LESS": "FRX", **os.environ},
+        )
+    except OSError:
+        return print_notes(notes, empty, brief)
+
+    pending: "queue.Queue[Optional[Note]]" = queue.Queue(PAGER_AHEAD)
+    stop = threading.Event()
+
+    def render() -> None:
+        from rich.console import Console
+
+        console = Console(file=pager.stdin, force_terminal=True, width=width)
+        try:
+            while not stop.is_set():
+                try:
+                    note = pending.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if note is None:
+                    break
+                with tracing.span("print" if brief else "render") as span:
+                    if brief:
+                        pager.stdin.write(note.headline() + "\n")
+                    else:
+                        console.print(note, "\n")
+                    span.rows = 1
+                # show each note as soon as it is rendered; headlines are
+                # cheap, so batch them until the renderer catches up
+                if not brief or pending.empty():
+                    pager.stdin.flush()
+        except OSError:
+            # the pager was quit
+            pass
+        finally:
+            stop.set()
+
+    def put(note: Optional[Note]) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(note, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    renderer = threading.Thread(target=render, name="sc-render", daemon=True)
+    renderer.start()
+    try:
+        for note in notes:
+            if not brief:
+                # load lazy content here, the DB connection belongs to this thread
+                note.text
+            if not put(note):
+                break
+        else:
+            put(None)
+        renderer.join()
+    finally:
+        stop.set()
+        if hasattr(source, "close"):
+            source.close()
+        try:
+            pager.stdin.close()
+        except OSError:
+            pass
+        pager.wait()
+
+
+def print_code(
+    db: "NotesDB | DaemonClient | FederatedDB",
+    notes: Iterable[Note],
+    lang: Optional[str] = None,
+) -> None:
+    """Print the fenced code blocks of notes, or exit with a message if there are none
+
+    Blocks are printed as plain markdown fences, ready to pipe or paste.
+
+    Args:
+        db (NotesDB | DaemonClient | FederatedDB): The backend the notes came from
+        notes (Iterable[Note]): The notes
+        lang (Optional[str]): Only print blocks in this language
+    """
+
+    found = False
+    for note in notes:
+        for block_lang, code in db.code_blocks(note, lang):
+            sys.stdout.write(f"```{block_lang}\n{code}\n```\n")
+            found = True
+    if not found:
+        sys.exit("No code blocks found.")
+
+
+def print_similar(
+    db: NotesDB, matches: list[tuple[int, float]], brief: bool = False
+) -> None:
+    """Print similar notes, most similar first, or exit if there are none
+
+    Args:
+        db (NotesDB): The DB the notes are in
+        matches (list[tuple[int, float]]): The note ids and their similarity
+        brief (bool): Print one headline per note, after its similarity
     """
 
-    s = s.strip(" #,")
-    return re.split(r"[ #,]+", s)
+    scores = dict(matches)
+    notes = db.iter_ids(list(scores), brief)
+    if not brief:
+        print_notes(notes, "No similar notes found.")
+        return
+    found = False
+    for note in notes:
+        sys.stdout.write(f"{scores[note.id]:.2f}  {note.headline()}\n")
+        found = True
+    if not found:
+        sys.exit("No similar notes found.")
+
+
+def warn_similar(db: "NotesDB | DaemonClient", note: Note) -> None:
+    """Point out saved notes that are near-identical to a new one
+
+    Only done once `sc similar` has built the index, and NumPy is installed.
+
+    Args:
+        db (NotesDB | DaemonClient): The notes backend
+        note (Note): The new note
+    """
+
+    path = similar_index_path(getattr(db, "db_file", config.get("db_file")))
+    if path is None or not os.path.isdir(path):
+        return
+    try:
+        from similarity import SimilarityIndex
+    except ImportError:
+        return
+
+    matches = SimilarityIndex(path).search(note.text, 3)
+    ids = [id for id, score in matches if score >= SIMILAR_WARNING]
+    if not ids:
+        return
+    lookup = db if isinstance(db, NotesDB) else NotesDB(readonly=True)
+    try:
+        headlines = [saved.headline() for saved in lookup.iter_ids(ids, brief=True)]
+    finally:
+        if lookup is not db:
+            lookup.close()
+    print("Similar notes are already saved:\n" + "\n".join(headlines))
+
+
+def print_duplicates(groups: Iterable[tuple[int, list[Note]]]) -> None:
+    """Print each group of notes sharing a body, then the space saved by sharing
+
+    Args:
+        groups (Iterable[tuple[int, list[Note]]]): The stored body size and notes
+            of each group, as returned by `NotesDB.iter_duplicates`
+    """
+
+    count = copies = saved = 0
+    for size, notes in groups:
+        sys.stdout.write(f"{len(notes)} notes share a {size} byte body:\n")
+        for note in notes:
+            sys.stdout.write(f"  {note.headline()}\n")
+        count += 1
+        copies += len(notes) - 1
+        saved += size * (len(notes) - 1)
+    if not count:
+        sys.exit("No duplicate notes found.")
+    print(f"{count} groups, {copies} copies stored once, {saved} bytes saved.")
 
 
 def eof_input() -> list[str]:
@@ -95,6 +811,9 @@ def eof_input() -> list[str]:
         list[str]: A list of lines entered by the user
     """
 
+    from rich import print
+    from rich.panel import Panel
+
     panel = Panel(
         "PLEASE ENTER YOUR NOTE BELOW IN MARKDOWN", subtitle="Ctrl-D to Finish"
     )
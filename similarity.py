@@ -0,0 +1,432 @@
+import errno
+import os
+import re
+import tempfile
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+import tracing
+from note import Note
+from notesdb import NotesDB
+
+# features are hashed words, so the vocabulary never needs to be stored
+DIM = 1 << 18
+TOKEN = re.compile(r"\w+")
+
+MAIN_FILE = "main.npz"
+STATS_FILE = "stats.npz"
+TAIL_FILE = "tail.npz"
+LOCK_FILE = "lock"
+
+
+def features(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """The hashed, sublinear term frequencies of a text
+
+    Args:
+        text (str): The text
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The distinct feature ids and their weights
+    """
+
+    counts = Counter()
+    for token, count in Counter(TOKEN.findall(text.lower())).items():
+        counts[zlib.crc32(token.encode()) & (DIM - 1)] += count
+    feats = np.fromiter(counts.keys(), np.int32, len(counts))
+    tf = np.fromiter(counts.values(), np.float32, len(counts))
+    return feats, 1 + np.log(tf)
+
+
+class SimilarityIndex:
+    """Hashed TF-IDF vectors of note contents, for finding similar notes
+
+    The main part is an inverted index: for each feature, the rows of the
+    notes containing it and their term weights (CSC arrays), so a query only
+    touches the notes sharing a word with it. Notes added since the main
+    part was built go to a small tail that is scanned in full, and that is
+    merged into the main part once it reaches `MERGE_ROWS` notes, so adding
+    a note never rewrites the whole index.
+
+    Weights are scaled by the inverse document frequency at query time, and
+    row norms use the frequencies of when the row was indexed.
+
+    Notes updated or deleted since the main part was built are listed in
+    `removed`, which hides their rows of the main part until the next merge
+    drops them; an updated note is indexed again in the tail.
+
+    Attributes:
+        path (str): The directory the index is kept in
+    """
+
+    MERGE_ROWS = 2000
+
+    def __init__(self, path: str) -> None:
+        """Load an index, or start an empty one, without reading the main part yet
+
+        Args:
+            path (str): The directory the index is kept in
+        """
+
+        self.path = path
+        self._reload()
+
+    def _reload(self) -> None:
+        """Read the stats and the tail, dropping the main part until it is needed"""
+
+        self._main: Optional[dict[str, np.ndarray]] = None
+        # the document frequencies of the main part, enough to add to the tail
+        stats = self._load(STATS_FILE)
+        self.main_df = stats.get("df", np.zeros(DIM, np.int32))
+        self.main_count = int(stats.get("count", 0))
+        self.main_last_id = int(stats.get("last_id", 0))
+        tail = self._load(TAIL_FILE)
+        self.tail_ids = tail.get("ids", np.zeros(0, np.int64))
+        self.tail_rows = tail.get("rows", np.zeros(0, np.int32))
+        self.tail_feats = tail.get("feats", np.zeros(0, np.int32))
+        self.tail_vals = tail.get("vals", np.zeros(0, np.float32))
+        self.tail_norms = tail.get("norms", np.zeros(0, np.float32))
+        self.removed = tail.get("removed", np.zeros(0, np.int64))
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the index's lock, to change the index and save it
+
+        Every change reads, changes and writes whole files, so the index is
+        read again once the lock is held: another process may have saved it
+        since it was loaded.
+        """
+
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_FILE), "a+b") as f:
+            lock_file(f.fileno())
+            try:
+                self._reload()
+                yield
+            finally:
+                unlock_file(f.fileno())
+
+    def clear(self) -> None:
+        """Empty the index, to build it again"""
+
+        for name in (MAIN_FILE, STATS_FILE, TAIL_FILE):
+            file = os.path.join(self.path, name)
+            if os.path.exists(file):
+                os.unlink(file)
+        self._reload()
+
+    def _load(self, name: str) -> dict[str, np.ndarray]:
+        file = os.path.join(self.path, name)
+        if not os.path.exists(file):
+            return {}
+        with np.load(file) as arrays:
+            return dict(arrays)
+
+    def _save(self, name: str, **arrays: np.ndarray) -> None:
+        """Write arrays to a file of the index atomically"""
+
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, os.path.join(self.path, name))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @property
+    def main(self) -> dict[str, np.ndarray]:
+        """The main part: ids, indptr, rows, vals and norms arrays"""
+
+        if self._main is None:
+            self._main = self._load(MAIN_FILE) or {
+                "ids": np.zeros(0, np.int64),
+                "indptr": np.zeros(DIM + 1, np.int64),
+                "rows": np.zeros(0, np.int32),
+                "vals": np.zeros(0, np.float32),
+                "norms": np.zeros(0, np.float32),
+            }
+        return self._main
+
+    def __len__(self) -> int:
+        return self.main_count + len(self.tail_ids)
+
+    @property
+    def last_id(self) -> int:
+        """The highest note id indexed, to catch up from"""
+
+        return max(self.main_last_id, int(self.tail_ids.max(initial=0)))
+
+    def idf(self) -> np.ndarray:
+        """The smoothed inverse document frequency of every feature"""
+
+        df = self.main_df + np.bincount(self.tail_feats, minlength=DIM)
+        return (np.log((1 + len(self)) / (1 + df)) + 1).astype(np.float32)
+
+    def add(self, notes: Iterable[Note]) -> None:
+        """Index the content of notes, in the tail until the next `save`
+
+        Args:
+            notes (Iterable[Note]): The notes, already saved so they have ids
+        """
+
+        notes = list(notes)
+        # notes indexed before are being updated: drop their old rows
+        last_id = self.last_id
+        self.remove([note.id for note in notes if note.id <= last_id])
+
+        ids, rows, feats, vals = [], [], [], []
+        row = len(self.tail_ids)
+        for note in notes:
+            f, v = features(note.text)
+            ids.append(note.id)
+            rows.append(np.full(len(f), row, np.int32))
+            feats.append(f)
+            vals.append(v)
+            row += 1
+        if not ids:
+            return
+
+        self.tail_ids = np.concatenate([self.tail_ids, np.array(ids, np.int64)])
+        self.tail_rows = np.concatenate([self.tail_rows, *rows])
+        self.tail_feats = np.concatenate([self.tail_feats, *feats])
+        self.tail_vals = np.concatenate([self.tail_vals, *vals])
+        new = slice(len(self.tail_norms), None)
+        idf = self.idf()
+        weights = (self.tail_vals * idf[self.tail_feats]) ** 2
+        norms = np.sqrt(np.bincount(self.tail_rows, weights, len(self.tail_ids)))
+        self.tail_norms = np.concatenate(
+            [self.tail_norms, norms[new].astype(np.float32)]
+        )
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Stop finding notes, because they were deleted or are being updated
+
+        Args:
+            ids (Iterable[int]): The ids of the notes
+        """
+
+        ids = np.array(list(ids), np.int64)
+        if not len(ids):
+            return
+        self.removed = np.union1d(self.removed, ids[ids <= self.main_last_id])
+
+        keep = ~np.isin(self.tail_ids, ids)
+        if keep.all():
+            return
+        # renumber the remaining tail rows
+        renumber = np.cumsum(keep) - 1
+        entries = keep[self.tail_rows]
+        self.tail_ids = self.tail_ids[keep]
+        self.tail_norms = self.tail_norms[keep]
+        self.tail_rows = renumber[self.tail_rows[entries]].astype(np.int32)
+        self.tail_feats = self.tail_feats[entries]
+        self.tail_vals = self.tail_vals[entries]
+
+    def save(self) -> None:
+        """Write the tail, merging it into the main part once it is large enough
+
+        A new index has no main part yet, so it is built straight away.
+        """
+
+        if len(self.tail_ids) >= self.MERGE_ROWS or not self.main_count:
+            self.merge()
+        else:
+            self._save(
+                TAIL_FILE,
+                ids=self.tail_ids,
+                rows=self.tail_rows,
+                feats=self.tail_feats,
+                vals=self.tail_vals,
+                norms=self.tail_norms,
+                removed=self.removed,
+            )
+
+    def merge(self) -> None:
+        """Rebuild the main part with the tail in it, and empty the tail
+
+        Rows of removed notes are dropped from the main part.
+        """
+
+        main = self.main
+        main_feats = np.repeat(np.arange(DIM, dtype=np.int32), np.diff(main["indptr"]))
+        main_rows, main_vals, main_ids = main["rows"], main["vals"], main["ids"]
+        if len(self.removed):
+            keep = ~np.isin(main_ids, self.removed)
+            renumber = np.cumsum(keep) - 1
+            entries = keep[main_rows]
+            main_feats, main_vals = main_feats[entries], main_vals[entries]
+            main_rows = renumber[main_rows[entries]].astype(np.int32)
+            main_ids = main_ids[keep]
+
+        offset = len(main_ids)
+        feats = np.concatenate([main_feats, self.tail_feats])
+        rows = np.concatenate([main_rows, self.tail_rows + offset])
+        vals = np.concatenate([main_vals, self.tail_vals])
+        order = np.argsort(feats, kind="stable")
+        df = np.bincount(feats, minlength=DIM).astype(np.int32)
+        ids = np.concatenate([main_ids, self.tail_ids])
+
+        idf = (np.log((1 + len(ids)) / (1 + df)) + 1).astype(np.float32)
+        norms = np.sqrt(np.bincount(rows, (vals * idf[feats]) ** 2, len(ids)))
+        self._main = {
+            "ids": ids,
+            "indptr": np.concatenate([[0], np.cumsum(df, dtype=np.int64)]),
+            "rows": rows[order],
+            "vals": vals[order],
+            "norms": norms.astype(np.float32),
+        }
+        self._save(MAIN_FILE, **self._main)
+        self.main_df, self.main_count = df, len(ids)
+        self.main_last_id = int(ids.max(initial=0))
+        self._save(
+            STATS_FILE,
+            df=df,
+            count=np.array(self.main_count),
+            last_id=np.array(self.main_last_id),
+        )
+
+        self.tail_ids = np.zeros(0, np.int64)
+        self.tail_rows = np.zeros(0, np.int32)
+        self.tail_feats = np.zeros(0, np.int32)
+        self.tail_vals = np.zeros(0, np.float32)
+        self.tail_norms = np.zeros(0, np.float32)
+        self.removed = np.zeros(0, np.int64)
+        tail = os.path.join(self.path, TAIL_FILE)
+        if os.path.exists(tail):
+            os.unlink(tail)
+
+    def search(
+        self, text: str, k: int = 5, exclude: Optional[int] = None
+    ) -> list[tuple[int, float]]:
+        """The notes whose content is most similar to a text
+
+        Args:
+            text (str): The text to compare with
+            k (int): The number of notes to return
+            exclude (Optional[int]): A note id to leave out, e.g. the note itself
+
+        Returns:
+            list[tuple[int, float]]: The ids and cosine similarities of the most
+                similar notes, best first
+        """
+
+        main = self.main
+        if not len(self) or k <= 0:
+            return []
+        idf = self.idf()
+        qfeats, qvals = features(text)
+        qweights = qvals * idf[qfeats]
+        qnorm = float(np.sqrt((qweights**2).sum())) or 1.0
+
+        n_main = len(main["ids"])
+        scores = np.zeros(len(self), np.float32)
+        indptr, rows, vals = main["indptr"], main["rows"], main["vals"]
+        for feat, weight in zip(qfeats.tolist(), (qweights * idf[qfeats]).tolist()):
+            start, end = indptr[feat], indptr[feat + 1]
+            if start != end:
+                scores[rows[start:end]] += vals[start:end] * weight
+
+        if len(self.tail_ids):
+            query = np.zeros(DIM, np.float32)
+            query[qfeats] = qweights
+            scores[n_main:] += np.bincount(
+                self.tail_rows,
+                self.tail_vals * idf[self.tail_feats] * query[self.tail_feats],
+                len(self.tail_ids),
+            ).astype(np.float32)
+
+        norms = np.concatenate([main["norms"], self.tail_norms])
+        scores /= np.maximum(norms, 1e-9) * qnorm
+        if len(self.removed):
+            scores[:n_main][np.isin(main["ids"], self.removed)] = 0
+        ids = np.concatenate([main["ids"], self.tail_ids])
+        if exclude is not None:
+            scores[ids == exclude] = 0
+
+        # a note indexed more than once only counts once
+        m = min(len(scores), max(k * 2, k + 8))
+        top = np.argpartition(-scores, m - 1)[:m]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results, seen = [], set()
+        for i in top.tolist():
+            id = int(ids[i])
+            if scores[i] <= 0 or id in seen:
+                continue
+            seen.add(id)
+            results.append((id, float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+
+def open_index(db: NotesDB, rebuild: bool = False) -> SimilarityIndex:
+    """Open the index of a DB, building it or catching up with new notes first
+
+    Once the index exists `NotesDB.add` keeps it up to date, so this only
+    indexes every note the first time, and afterwards any notes added while
+    NumPy was not installed.
+
+    Args:
+        db (NotesDB): The DB, stored in a file
+        rebuild (bool): Index every note again, from an empty index
+
+    Returns:
+        SimilarityIndex: The up to date index
+
+    Raises:
+        ValueError: If the DB is in memory
+    """
+
+    path = db.similar_index_path
+    if path is None:
+        raise ValueError("Similar notes need a DB file")
+    index = SimilarityIndex(path)
+    built = os.path.isdir(path)
+    with index.locked():
+        if rebuild:
+            index.clear()
+        with tracing.span("similar.add") as span:
+            before = len(index)
+            index.add(db.iter_since(after_id=index.last_id))
+            added = span.rows = len(index) - before
+        if added or rebuild or not built:
+            index.save()
+    return index
+
+
+def lock_file(fd: int) -> None:
+    """Take an exclusive lock on an open file, waiting for it as long as it takes"""
+
+    if os.name == "nt":
+        import msvcrt
+
+        while True:
+            try:
+                # retries for about 10 seconds before giving up
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError as e:
+                if e.errno != errno.EDEADLOCK:
+                    raise
+    import fcntl
+
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def unlock_file(fd: int) -> None:
+    """Release a lock taken with `lock_file`"""
+
+    if os.name == "nt":
+        import msvcrt
+
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        return
+    import fcntl
+
+    fcntl.flock(fd, fcntl.LOCK_UN)
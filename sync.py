@@ -0,0 +1,109 @@
+import hashlib
+import os
+from typing import Iterator, Optional
+
+import tracing
+from note import Note
+from notesdb import NotesDB
+from transfer import MARKDOWN_EXTENSIONS, note_from_markdown
+
+
+def scan(root: str) -> Iterator[tuple[str, tuple[int, int]]]:
+    """Find the markdown files below a directory, skipping hidden files and directories
+
+    Args:
+        root (str): The directory
+
+    Yields:
+        tuple[str, tuple[int, int]]: The path of each file relative to root,
+            with "/" separators, and its mtime (ns) and size
+    """
+
+    stack = [root]
+    prefix = len(os.path.join(root, ""))
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                name = entry.name
+                if name[0] == ".":
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif name.lower().endswith(MARKDOWN_EXTENSIONS):
+                    stat = entry.stat()
+                    path = entry.path[prefix:]
+                    if os.sep != "/":
+                        path = path.replace(os.sep, "/")
+                    yield path, (stat.st_mtime_ns, stat.st_size)
+
+
+def read_file(path: str) -> tuple[bytes, Optional[Note]]:
+    """Read a synced file
+
+    Args:
+        path (str): The path to the markdown file
+
+    Returns:
+        tuple[bytes, Optional[Note]]: The hash of its content, and its note or
+            None if it does not make a valid note
+    """
+
+    with open(path, "rb") as f:
+        data = f.read()
+    hash = hashlib.sha256(data).digest()
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return hash, None
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return hash, note_from_markdown(text, path)
+
+
+def sync_dir(db: NotesDB, path: str, archive: bool = False) -> tuple[int, int, int]:
+    """Bring the notes synced from a directory of markdown files up to date
+
+    The DB keeps a manifest of the files synced, see `NotesDB.sync_files`, so
+    only files whose size or mtime changed are read and hashed, and only
+    those whose content changed are written, all in one transaction. Files
+    that stop making a valid note keep their last note.
+
+    Args:
+        db (NotesDB): The DB
+        path (str): The directory
+        archive (bool): Tag the notes of removed files instead of deleting them
+
+    Returns:
+        tuple[int, int, int]: The number of notes added, updated and removed
+
+    Raises:
+        OSError: If the directory cannot be read
+    """
+
+    root = os.path.abspath(path)
+    with tracing.span("sync.scan") as span:
+        manifest = db.manifest(root)
+        files, seen = [], set()
+        for file, stamp in scan(root):
+            seen.add(file)
+            if manifest.get(file) == stamp:
+                continue
+            try:
+                hash, note = read_file(os.path.join(root, file))
+            except FileNotFoundError:
+                # deleted since the scan
+                seen.discard(file)
+                continue
+            entry = db.manifest_entry(root, file) if file in manifest else None
+            if entry is not None and entry[0] == hash:
+                note = None
+            elif note is None:
+                continue
+            elif entry is not None:
+                note.id = entry[1]
+            files.append((file, *stamp, hash, note))
+        span.rows = len(seen)
+
+    removed = [file for file in manifest if file not in seen]
+    if not files and not removed:
+        return 0, 0, 0
+    return db.sync_files(root, files, removed, archive)
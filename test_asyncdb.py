@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from asyncdb import AsyncNotesDB
+from note import Note
+
+
+@pytest.fixture
+def test_notes():
+    return [
+        Note(name=f"Note{i}", tags=["tag1", f"tag{i}"], content=[f"Note {i}x body."])
+        for i in range(600)
+    ]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.mark.parametrize("file", [True, False])
+def test_add_get_and_search(tmp_path, test_notes, file):
+    async def main():
+        db_file = str(tmp_path / "notes.sqlite3") if file else ":memory:"
+        async with AsyncNotesDB(db_file, readers=2) as db:
+            assert await db.add(test_notes) == 600
+            notes = await db.get(3)
+            assert [note.name for note in notes] == ["Note597", "Note598", "Note599"]
+            assert [note.name for note in await db.search("42x")] == ["Note42"]
+            assert [note.name for note in await db.tagged(["tag7"])] == ["Note7"]
+            assert (await db.fuzzy("Note599", 1))[0].name == "Note599"
+            assert await db.search("zzzz") is None
+
+    run(main())
+
+
+def test_streams_and_concurrent_queries(tmp_path, test_notes):
+    async def main():
+        async with AsyncNotesDB(str(tmp_path / "notes.sqlite3"), readers=3) as db:
+            await db.add(test_notes)
+
+            names = [note.name async for note in db.iter_notes()]
+            assert names == [f"Note{i}" for i in range(600)]
+
+            results = await asyncio.gather(
+                *(db.search(f"{i}x") for i in range(20)),
+                db.get(brief=True),
+            )
+            assert [notes[0].name for notes in results[:20]] == [
+                f"Note{i}" for i in range(20)
+            ]
+            brief = results[-1]
+            assert brief[0]._text is None
+            assert brief[0].text == "Note 0x body."
+            assert await db.load_content(brief[1].id) == "Note 1x body."
+
+            stream = db.iter_tagged(["tag1"])
+            assert (await anext(stream)).name == "Note0"
+            await stream.aclose()
+
+    run(main())
+
+
+def test_errors_match_notesdb():
+    async def main():
+        async with AsyncNotesDB(":memory:") as db:
+            with pytest.raises(ValueError):
+                await db.search(" ")
+            with pytest.raises(ValueError):
+                async for _ in db.iter_fuzzy("ab"):
+                    pass
+
+    run(main())
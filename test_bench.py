@@ -0,0 +1,35 @@
+import json
+
+from bench import *
+
+
+def test_generate_corpus_is_reproducible():
+    first = [note.to_dict() for note in generate_corpus(20, seed=1)]
+    second = [note.to_dict() for note in generate_corpus(20, seed=1)]
+
+    assert first == second
+    assert len(first) == 20
+    assert any("```" in note["content"] for note in first)
+    assert all(note["tags"] for note in first)
+
+
+def test_generate_corpus_tags_are_skewed():
+    counts = {}
+    for note in generate_corpus(500):
+        for tag in note.tags:
+            counts[tag] = counts.get(tag, 0) + 1
+
+    assert counts["tag0"] > 10 * counts.get("tag400", 1)
+
+
+def test_main_writes_results(tmp_path):
+    out = tmp_path / "results.json"
+
+    main(["--sizes", "30", "--db", "memory", "--render", "3", "--out", str(out)])
+
+    report = json.loads(out.read_text())
+    assert report["runs"][0]["notes"] == 30
+    results = report["runs"][0]["results"]
+    assert results["insert"]["items"] == 30
+    assert results["list"]["items"] == 30
+    assert results["render"]["items"] == 3
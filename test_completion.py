@@ -0,0 +1,102 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from completion import *
+from note import Note
+from notesdb import NotesDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    db_instance = NotesDB(db_file=str(tmp_path / "notes.sqlite3"))
+    yield db_instance
+    db_instance.close()
+
+
+def corpus():
+    return [
+        Note("Python packaging", ["python", "packaging"], ["pip"]),
+        Note("Pytest fixtures", ["python", "testing"], ["yield"]),
+        Note("Rust lifetimes", ["rust"], ["'a"]),
+    ]
+
+
+def test_lookup(db):
+    db.add(corpus())
+    db.rebuild_completions()
+    index = CompletionIndex(db.completion_index_path)
+
+    assert index.lookup("search", "py") == [
+        ("python", ""),
+        ("Pytest fixtures", ""),
+        ("Python packaging", ""),
+    ]
+    assert index.lookup("tag", "P") == [("packaging", ""), ("python", "")]
+    assert index.lookup("id", "2") == [("2", "Pytest fixtures")]
+    assert index.lookup("search", "python p", 1) == [("Python packaging", "")]
+    assert index.lookup("search", "go") == []
+
+
+def test_db_keeps_index_up_to_date(db):
+    db.add(corpus()[:1])
+    # not built yet, so not kept
+    assert not os.path.exists(db.completion_index_path)
+    db.rebuild_completions()
+    index = CompletionIndex(db.completion_index_path)
+
+    db.add(corpus()[1:])
+    assert index.lookup("tag", "r") == [("rust", "")]
+
+    db.update([Note("Rust borrowck", ["rust"], ["&mut"], id=3)])
+    assert index.lookup("id", "3") == [("3", "Rust borrowck")]
+
+    db.delete([3])
+    assert index.lookup("id", "3") == []
+
+
+def test_full_tail_is_rebuilt(db, monkeypatch):
+    db.add(corpus())
+    db.rebuild_completions()
+    monkeypatch.setattr(CompletionIndex, "MERGE_BYTES", 1)
+    tail = os.path.join(db.completion_index_path, TAIL_FILE)
+
+    db.delete([1])
+    assert os.path.exists(tail)
+    db.add([Note("Go channels", ["go"], ["chan"])])
+
+    assert not os.path.exists(tail)
+    index = CompletionIndex(db.completion_index_path)
+    assert index.lookup("search", "p") == [("python", ""), ("Pytest fixtures", "")]
+    assert index.lookup("tag", "go") == [("go", "")]
+
+
+def test_main(db, capsys):
+    db.add(corpus())
+    db.rebuild_completions()
+
+    main([db.completion_index_path, "search", "rust"])
+    assert capsys.readouterr().out == "rust\t\nRust lifetimes\t\n"
+
+    main([db.completion_index_path, "nothing", "rust"])
+    main([os.path.dirname(db.completion_index_path), "search"])
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.skipif(shutil.which("bash") is None, reason="needs bash")
+def test_bash_script(db):
+    db.add(corpus())
+    db.rebuild_completions()
+    code = (
+        script("bash", db.completion_index_path)
+        + "COMP_WORDS=(sc --db default search 'python\\ p'); COMP_CWORD=4; _sc\n"
+        + 'printf "%s\\n" "${COMPREPLY[@]}"\n'
+    )
+
+    result = subprocess.run(
+        ["bash", "-c", code], capture_output=True, text=True, timeout=30
+    )
+
+    assert result.stdout == "Python\\ packaging\n"
@@ -0,0 +1,159 @@
+import socket
+import threading
+
+import pytest
+from daemon import *
+from note import Note
+from notesdb import NotesDB
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / "sc.sock")
+    started = threading.Event()
+    servers = []
+
+    # the DB connection has to be created on the thread that serves it
+    def run():
+        with NotesServer(NotesDB(db_file=":memory:"), path) as server:
+            servers.append(server)
+            started.set()
+            server.serve_forever(poll_interval=0.05)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait(5)
+    yield path
+    servers[0].shutdown()
+    thread.join(5)
+
+
+@pytest.fixture
+def test_notes():
+    return [
+        Note(name="Note1", tags=["tag1", "tag2"], content=["This is the first note."]),
+        Note(name="Note2", tags=["tag1"], content=["This is the second note."]),
+    ]
+
+
+def test_add_list_and_search(server, test_notes):
+    client = DaemonClient.connect(server)
+
+    assert client.add(test_notes) == 2
+    assert [note.id for note in test_notes] == [1, 2]
+
+    notes = list(client.iter_notes())
+    assert [note.name for note in notes] == ["Note1", "Note2"]
+    assert notes[0].content == ["This is the first note."]
+    assert [note.name for note in client.iter_search("second")] == ["Note2"]
+    assert [note.name for note in client.iter_tagged(["tag2"])] == ["Note1"]
+
+
+def test_search_by_code_language(server):
+    client = DaemonClient.connect(server)
+    client.add([Note("Code", ["a"], ["```python", "x = 1", "```"])])
+
+    [note] = client.iter_search("", lang="python")
+    assert client.code_blocks(note) == [("python", "x = 1")]
+
+
+def test_brief_loads_content_on_demand(server, test_notes):
+    client = DaemonClient.connect(server)
+    client.add(test_notes)
+
+    note = next(client.iter_notes(1, brief=True))
+    assert note.name == "Note2"
+    assert note._content is None
+    assert note.content == ["This is the second note."]
+
+
+def test_errors_are_raised_by_the_call(server):
+    client = DaemonClient.connect(server)
+
+    with pytest.raises(ValueError):
+        client.iter_search("")
+    with pytest.raises(ValueError):
+        client._request("drop", {})
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"name": 5, "tags": ["a"], "content": "x"},
+        {"name": "A", "tags": "a", "content": "x"},
+        {"name": "A", "tags": [], "content": "x"},
+        {"name": "A", "tags": ["a"], "content": ["x"]},
+        {"name": "A", "tags": ["a"], "content": " "},
+        {"name": "A", "tags": ["a"]},
+        "A",
+    ],
+)
+def test_invalid_notes_are_rejected(server, fields):
+    client = DaemonClient.connect(server)
+
+    with pytest.raises(ValueError, match="Invalid note"):
+        client._request("add", {"notes": [fields]})
+    assert list(client.iter_notes()) == []
+
+
+def test_connect_without_daemon(tmp_path):
+    with pytest.raises(OSError):
+        DaemonClient.connect(str(tmp_path / "missing.sock"))
+
+
+def test_second_daemon_refuses_socket(server):
+    with pytest.raises(OSError):
+        NotesServer(NotesDB(db_file=":memory:"), server)
+
+
+def test_stalled_clients_do_not_block_others(server):
+    client = DaemonClient.connect(server)
+    client.add(Note(f"Note{i}", ["big"], ["x" * 1000]) for i in range(2000))
+
+    # one client never sends its request, another never reads its answer
+    idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    idle.connect(server)
+    stalled = client._request("list", {})
+    next(stalled)
+    # and one resets the connection
+    reset = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    reset.connect(server)
+    reset.close()
+
+    fast = DaemonClient(server, timeout=3.0)
+    assert next(fast.iter_notes(1, brief=True)).name == "Note1999"
+    # the stalled answer was kept for when its client reads on
+    assert sum(1 for _ in stalled) == 1999
+    idle.close()
+
+
+def test_answers_are_streamed(server, monkeypatch):
+    release = threading.Event()
+
+    def dispatch(self, op, args):
+        yield {"note": Note("First", ["a"], ["x"]).to_dict()}
+        release.wait(10)
+        yield {"note": Note("Second", ["a"], ["x"]).to_dict()}
+
+    monkeypatch.setattr(NotesServer, "dispatch", dispatch)
+    notes = DaemonClient(server, timeout=3.0)._notes("list", {})
+
+    # sent before the query is done
+    assert next(notes).name == "First"
+    release.set()
+    assert [note.name for note in notes] == ["Second"]
+
+
+def test_reply_buffer_spills_past_its_limit():
+    reply = ReplyBuffer(10)
+    data = [str(i).encode() * 7 for i in range(100)]
+    for chunk in data[:50]:
+        reply.write(chunk)
+    assert reply._size <= 10
+    assert reply.read() == data[0]
+    for chunk in data[50:]:
+        reply.write(chunk)
+    reply.close()
+
+    assert b"".join(iter(reply.read, b"")) == b"".join(data[1:])
+    assert reply.read() == b""
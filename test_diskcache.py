@@ -0,0 +1,44 @@
+import pytest
+from diskcache import DiskCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache_instance = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    yield cache_instance
+    cache_instance.close()
+
+
+def test_get_and_put(cache):
+    assert cache.get("a") is None
+
+    cache.put("a", b"1234")
+    assert cache.get("a") == b"1234"
+
+
+def test_evicts_least_recently_used(cache):
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    # touch a, so b is now the least recently used
+    assert cache.get("a") == b"1234"
+
+    cache.put("c", b"1234")
+    assert cache.get("a") == b"1234"
+    assert cache.get("b") is None
+    assert cache.get("c") == b"1234"
+
+
+def test_skips_values_larger_than_cache(cache):
+    cache.put("big", b"x" * 11)
+    assert cache.get("big") is None
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = DiskCache(path, max_bytes=10)
+    first.put("a", b"1")
+    first.close()
+
+    second = DiskCache(path, max_bytes=10)
+    assert second.get("a") == b"1"
+    second.close()
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+from federation import FederatedDB
+from note import Note
+from notesdb import NotesDB
+
+
+@pytest.fixture
+def federated(tmp_path):
+    paths = {}
+    for source, notes in {
+        "team": [
+            Note("Async retries", ["python"], ["async retry with backoff"]),
+            Note("Docker build", ["docker"], ["docker build cache"]),
+        ],
+        "personal": [
+            Note("Async async async", ["python"], ["async async async"]),
+            Note("Git rebase", ["git"], ["git rebase onto main"]),
+        ],
+    }.items():
+        paths[source] = str(tmp_path / f"{source}.sqlite3")
+        db = NotesDB(paths[source])
+        db.add(notes)
+        db.conn.execute(
+            "UPDATE notes SET created_at = ?",
+            ("2024-01-01" if source == "team" else "2024-02-01",),
+        )
+        db.conn.commit()
+        db.close()
+    federated = FederatedDB(paths)
+    yield federated
+    federated.close()
+
+
+def test_search_merges_by_rank_with_sources(federated):
+    notes = list(federated.iter_search("async"))
+
+    assert [(note.source, note.name) for note in notes] == [
+        ("personal", "Async async async"),
+        ("team", "Async retries"),
+    ]
+    assert notes[0].headline().startswith("personal#1  2024-02-01")
+    assert [note.name for note in federated.iter_search("async", 1)] == [
+        "Async async async"
+    ]
+
+
+def test_list_merges_by_recency(federated):
+    notes = list(federated.iter_notes())
+    assert [note.source for note in notes] == ["team", "team", "personal", "personal"]
+
+    notes = list(federated.iter_notes(3))
+    assert [note.name for note in notes] == [
+        "Docker build",
+        "Async async async",
+        "Git rebase",
+    ]
+
+
+def test_tagged_and_fuzzy(federated):
+    notes = list(federated.iter_tagged(["python"]))
+    assert [note.source for note in notes] == ["team", "personal"]
+
+    assert [note.name for note in federated.iter_fuzzy("rebse")] == ["Git rebase"]
+    with pytest.raises(ValueError):
+        federated.iter_fuzzy("ab")
+
+
+def test_brief_notes_load_content_on_their_shard(federated):
+    notes = list(federated.iter_search("rebase", brief=True))
+
+    assert notes[0]._text is None
+    assert notes[0].text == "git rebase onto main"
+    assert all(shard._thread_id != threading.get_ident() for shard in federated.shards)
+
+
+def test_paging_is_rejected(federated):
+    with pytest.raises(ValueError):
+        federated.iter_notes(2, before_id=5)
+    with pytest.raises(ValueError):
+        federated.iter_search("async", after_id=1)
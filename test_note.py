@@ -1,3 +1,5 @@
+import zlib
+
 import pytest
 from unittest.mock import patch, MagicMock
 from note import Note
@@ -82,6 +84,35 @@ def test_rich_console(test_note):
     assert "Line 2" in output
 
 
+# test Note rich print replays the cached render
+def test_rich_console_render_cache(test_note, tmp_path, monkeypatch):
+    from rich.console import Console
+    import note as note_module
+
+    monkeypatch.setitem(
+        note_module.config.settings, "db_file", str(tmp_path / "notesdb.sqlite3")
+    )
+    note_module.render_cache.cache_clear()
+
+    def render():
+        console = Console(record=True, width=60)
+        with console.capture() as capture:
+            console.print(test_note)
+        return capture.get()
+
+    first = render()
+    with patch("rich.markdown.Markdown") as mock_markdown:
+        second = render()
+
+    mock_markdown.assert_not_called()
+    assert first == second
+    assert "Line 1" in second
+    assert (tmp_path / note_module.RENDER_CACHE_FILE).exists()
+
+    note_module.render_cache().close()
+    note_module.render_cache.cache_clear()
+
+
 # test Note.confirm() interactive method
 @patch("rich.prompt.Confirm.ask")
 def test_confirm(mock_ask, test_note):
@@ -95,7 +126,7 @@ def test_confirm(mock_ask, test_note):
 # test Note.new() interactive creation
 @patch("rich.prompt.Prompt.ask")
 @patch("project.eof_input")
-@patch("project.parse_tags")
+@patch("note.parse_tags")
 def test_new(mock_parse_tags, mock_eof_input, mock_prompt_ask):
     mock_prompt_ask.side_effect = ["Test Note", "tag1,tag2"]
     mock_parse_tags.return_value = ["tag1", "tag2"]
@@ -131,3 +162,60 @@ def test_from_sql_invalid_db():
     note = Note.from_sql(row)
 
     assert note == None
+
+
+# test Note.from_summary() defers loading content
+def test_from_summary():
+    loads = []
+
+    def load_content(id):
+        loads.append(id)
+        return "Line 1\nLine 2"
+
+    note = Note.from_summary(
+        (7, "Test Note", "tag1,tag2", "2024-06-01 12:00:00"), load_content
+    )
+
+    assert note.name == "Test Note"
+    assert note.tags == ["tag1", "tag2"]
+    assert loads == []
+    assert note.content == ["Line 1", "Line 2"]
+    assert note.content == ["Line 1", "Line 2"]
+    assert loads == [7]
+    assert note.headline() == "#7  2024-06-01  Test Note  #tag1 #tag2"
+
+
+# test Note.from_sql() defers splitting content and keeps Notes compact
+def test_from_sql_is_lazy_and_slotted():
+    note = Note.from_sql((3, "Test Note", "tag1,tag2", "Line 1\nLine 2", "2024-06-01"))
+
+    assert note.text == "Line 1\nLine 2"
+    assert note._content is None
+    assert note.content == ["Line 1", "Line 2"]
+    assert note.text == "Line 1\nLine 2"
+    assert note.created_at == "2024-06-01"
+    assert not hasattr(note, "__dict__")
+
+
+# test Note.from_sql() inflates compressed content on first access
+def test_from_sql_compressed_content():
+    note = Note.from_sql(
+        (1, "Test Note", "tag1,tag2", zlib.compress(b"Line 1\nLine 2"))
+    )
+
+    assert isinstance(note._text, bytes)
+    assert note.content == ["Line 1", "Line 2"]
+
+
+# test Note.from_sql() rejects rows that could not have been added
+@pytest.mark.parametrize(
+    "row",
+    [
+        (1, "Test Note", "", "Line 1"),
+        (1, "Test Note", ",tag1", "Line 1"),
+        (1, "Test Note", "tag1", " \n "),
+        (1, None, "tag1", "Line 1"),
+    ],
+)
+def test_from_sql_invalid_rows(row):
+    assert Note.from_sql(row) is None
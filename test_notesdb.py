@@ -1,5 +1,8 @@
+import sqlite3
+
 import pytest
-from notesdb import NotesDB
+from notesdb import NotesDB, parse_code_blocks
+from config import config
 from note import Note
 
 
@@ -19,6 +22,23 @@ def test_notes():
     ]
 
 
+# a database created before any schema migrations existed
+@pytest.fixture
+def legacy_db_file(tmp_path):
+    db_file = str(tmp_path / "notes.sqlite3")
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "CREATE TABLE notes (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, "
+        "tags TEXT, content TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.execute(
+        "INSERT INTO notes (title, tags, content) VALUES ('Old', 'a,b', 'kept body')"
+    )
+    conn.commit()
+    conn.close()
+    return db_file
+
+
 def test_add_and_get_notes(db, test_notes):
     db.add(test_notes)
 
@@ -52,3 +72,466 @@ def test_search_notes(db, test_notes):
 def test_search_empty_query(db):
     with pytest.raises(ValueError):
         db.search("")
+
+
+def test_search_content_ranked(db):
+    db.add(
+        [
+            Note(name="Misc", tags=["python"], content=["asyncio once"]),
+            Note(name="Asyncio", tags=["asyncio"], content=["asyncio asyncio"]),
+            Note(name="Other", tags=["bash"], content=["nothing here"]),
+        ]
+    )
+
+    search_results = db.search("asyncio")
+    assert [note.name for note in search_results] == ["Asyncio", "Misc"]
+
+    assert db.search("nothing")[0].name == "Other"
+    assert db.search("missing") is None
+
+
+def test_search_query_syntax_is_escaped(db, test_notes):
+    db.add(test_notes)
+
+    assert db.search('"Note1" OR') is None
+    assert len(db.search("first note")) == 1
+
+
+def test_fts_migrates_existing_db(legacy_db_file):
+    db = NotesDB(db_file=legacy_db_file)
+    assert db.search("body")[0].name == "Old"
+    db.close()
+
+
+def test_tagged_exact_all_and_any(db):
+    db.add(
+        [
+            Note(name="Py", tags=["py"], content=["python"]),
+            Note(name="Pytest", tags=["pytest", "py"], content=["tests"]),
+            Note(name="Bash", tags=["bash"], content=["shell"]),
+        ]
+    )
+
+    assert [note.name for note in db.tagged(["pytest"])] == ["Pytest"]
+    assert [note.name for note in db.tagged(["py", "pytest"])] == ["Pytest"]
+    assert [note.name for note in db.tagged(["py"])] == ["Py", "Pytest"]
+    assert [note.name for note in db.tagged(["bash", "pytest"], match_all=False)] == [
+        "Pytest",
+        "Bash",
+    ]
+    assert db.tagged(["pyt"]) is None
+
+
+def test_tagged_empty(db):
+    with pytest.raises(ValueError):
+        db.tagged([""])
+
+
+def test_tags_migrate_existing_db(legacy_db_file):
+    db = NotesDB(db_file=legacy_db_file)
+    assert db.tagged(["a", "b"])[0].name == "Old"
+    db.close()
+
+
+def test_add_sets_ids_across_batches(db, test_notes):
+    assert db.add(test_notes[:1]) == 1
+    assert db.add(test_notes[1:], batch_size=1) == 2
+
+    assert [note.id for note in test_notes] == [1, 2, 3]
+    assert [note.id for note in db.get()] == [1, 2, 3]
+
+
+def test_iter_notes_streams_in_chunks(db, monkeypatch):
+    monkeypatch.setattr(NotesDB, "FETCH_SIZE", 2)
+    db.add(Note(name=f"Note{i}", tags=["t"], content=["x"]) for i in range(5))
+
+    notes = db.iter_notes()
+    assert next(notes).name == "Note0"
+    # a second iterator does not disturb the first one's cursor
+    assert [note.name for note in db.iter_notes(2)] == ["Note3", "Note4"]
+    assert [note.name for note in notes] == ["Note1", "Note2", "Note3", "Note4"]
+
+
+def test_iter_search_validates_eagerly(db):
+    with pytest.raises(ValueError):
+        db.iter_search("  ")
+
+
+@pytest.mark.parametrize(
+    "n, before_id, after_id, expected",
+    [
+        (3, None, None, [8, 9, 10]),
+        (3, 8, None, [5, 6, 7]),
+        (3, 2, None, [1]),
+        (3, None, 4, [5, 6, 7]),
+        (0, None, 7, [8, 9, 10]),
+        (2, 7, 3, [5, 6]),
+        (0, 7, 3, [4, 5, 6]),
+    ],
+)
+def test_get_keyset_pages(db, n, before_id, after_id, expected):
+    db.add(Note(name=f"Note{i}", tags=["t"], content=["x"]) for i in range(1, 11))
+
+    notes = db.get(n, before_id=before_id, after_id=after_id)
+    assert [note.id for note in notes] == expected
+
+
+def test_search_keyset_pages(db):
+    db.add(
+        Note(name=f"Note{i}", tags=["even" if i % 2 else "odd"], content=["x"])
+        for i in range(10)
+    )
+
+    assert len(db.search("even", n=2)) == 2
+    assert [note.id for note in db.search("even", 2, before_id=8)] == [4, 6]
+    assert [note.id for note in db.search("even", 2, after_id=4)] == [6, 8]
+
+
+def test_brief_notes_load_content_lazily(db, test_notes):
+    db.add(test_notes)
+    queries = []
+    db.conn.set_trace_callback(queries.append)
+
+    notes = db.get(brief=True)
+    assert [note.name for note in notes] == ["Note1", "Note2", "Note3"]
+    assert notes[0].created_at is not None
+    assert not any("content" in query for query in queries)
+
+    assert notes[1].content == ["This is the second note."]
+    assert db.search("third", brief=True)[0].content == ["This is the third note."]
+    assert len(db.tagged(["tag1"], brief=True)) == 3
+
+
+def test_fuzzy_search_tolerates_typos(db):
+    db.add(
+        [
+            Note(name="Asyncio basics", tags=["python"], content=["x"]),
+            Note(name="Bash loops", tags=["bash"], content=["y"]),
+            Note(name="Fixtures", tags=["pytest"], content=["z"]),
+        ]
+    )
+
+    assert [note.name for note in db.fuzzy("asyncoi")] == ["Asyncio basics"]
+    assert [note.name for note in db.fuzzy("pytets")] == ["Fixtures"]
+    assert [note.name for note in db.fuzzy("bahs loop", brief=True)] == ["Bash loops"]
+    assert db.fuzzy("zzzzzz") is None
+
+
+def test_fuzzy_search_ranks_by_similarity(db):
+    db.add(
+        [
+            Note(name="Async iterators", tags=["python"], content=["x"]),
+            Note(name="Asyncio", tags=["python"], content=["y"]),
+        ]
+    )
+
+    assert [note.name for note in db.fuzzy("asyncio", n=1)] == ["Asyncio"]
+
+
+def test_fuzzy_search_short_query(db):
+    with pytest.raises(ValueError):
+        db.fuzzy("ab")
+
+
+def test_file_db_uses_wal(tmp_path):
+    db = NotesDB(db_file=str(tmp_path / "notes.sqlite3"))
+
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    db.close()
+
+
+def test_readonly_reads_while_writer_holds_lock(tmp_path, test_notes):
+    db_file = str(tmp_path / "notes.sqlite3")
+    writer = NotesDB(db_file=db_file)
+    writer.add(test_notes)
+    writer.cursor.execute("BEGIN IMMEDIATE")
+    writer.cursor.execute("DELETE FROM notes")
+
+    reader = NotesDB(db_file=db_file, readonly=True)
+    assert reader.readonly
+    assert len(reader.get()) == 3
+    with pytest.raises(sqlite3.OperationalError):
+        reader.add(test_notes)
+
+    writer.conn.rollback()
+    reader.close()
+    writer.close()
+
+
+def test_readonly_falls_back_for_new_and_legacy_dbs(tmp_path, legacy_db_file):
+    db = NotesDB(db_file=str(tmp_path / "new.sqlite3"), readonly=True)
+    assert not db.readonly
+    db.close()
+
+    db = NotesDB(db_file=legacy_db_file, readonly=True)
+    assert not db.readonly
+    assert db.search("body")[0].name == "Old"
+    db.close()
+
+    db = NotesDB(db_file=legacy_db_file, readonly=True)
+    assert db.readonly
+    db.close()
+
+
+STORED_TYPES = """
+SELECT typeof(content) FROM notes JOIN bodies ON hash = body_hash ORDER BY notes.id
+"""
+
+
+def test_large_content_is_stored_compressed(db):
+    log = [f"ERROR worker {i}: connection reset by peer" for i in range(200)]
+    db.add([Note("Big log", ["logs"], log), Note("Small", ["logs"], ["tiny"])])
+
+    types = db.conn.execute(STORED_TYPES).fetchall()
+    assert types == [("blob",), ("text",)]
+
+    assert db.get()[0].content == log
+    assert db.get(brief=True)[0].text == "\n".join(log)
+    assert [note.name for note in db.search("peer")] == ["Big log"]
+
+
+def test_invalid_compress_min_bytes_falls_back_to_default(monkeypatch):
+    monkeypatch.setitem(config.settings, "compress_min_bytes", "1k")
+    db = NotesDB(db_file=":memory:")
+    assert db.compress_min_bytes == 1024
+    db.close()
+
+
+def test_invalid_connection_settings_fall_back_to_defaults(tmp_path, monkeypatch):
+    for key, value in [
+        ("busy_timeout_ms", "5s"),
+        ("cache_size", "16MB"),
+        ("mmap_size", ""),
+        ("journal_mode", "wall"),
+        ("synchronous", "normal; DROP TABLE notes"),
+        ("temp_store", "ram"),
+    ]:
+        monkeypatch.setitem(config.settings, key, value)
+    db = NotesDB(db_file=str(tmp_path / "notes.sqlite3"))
+
+    values = [
+        db.conn.execute(f"PRAGMA {name}").fetchone()[0]
+        for name in ["busy_timeout", "cache_size", "journal_mode", "synchronous"]
+    ]
+    # synchronous=normal is 1
+    assert values == [5000, -16384, "wal", 1]
+    db.close()
+
+
+def test_compact_compresses_existing_rows(db):
+    body = "Traceback (most recent call last):\n" * 100
+    db.compress_min_bytes = 0
+    db.add([Note("Trace", ["py"], body.split("\n")), Note("Small", ["py"], ["tiny"])])
+    assert db.conn.execute(STORED_TYPES).fetchone() == ("text",)
+
+    db.compress_min_bytes = 1024
+    assert db.compact() == 1
+    assert db.compact() == 0
+
+    types = db.conn.execute(STORED_TYPES).fetchall()
+    assert types == [("blob",), ("text",)]
+    assert db.get()[0].text == body
+    assert [note.name for note in db.search("traceback")] == ["Trace"]
+
+
+def test_identical_content_is_stored_once(db):
+    db.add([Note("A", ["x"], ["same body"]), Note("B", ["y"], ["other body"])])
+    db.add([Note("C", ["z"], ["same body"]), Note("D", ["x", "z"], ["same body"])])
+
+    assert db.conn.execute("SELECT count(*) FROM bodies").fetchone() == (2,)
+    assert [note.name for note in db.search("same")] == ["A", "C", "D"]
+    assert db.get()[3].text == "same body"
+
+    [(size, notes)] = db.iter_duplicates()
+    assert size == len("same body")
+    assert [note.name for note in notes] == ["A", "C", "D"]
+    assert notes[1].text == "same body"
+
+    db.conn.execute("DELETE FROM notes WHERE title IN ('A', 'C')")
+    assert list(db.iter_duplicates()) == []
+    db.conn.execute("DELETE FROM notes WHERE title = 'D'")
+    assert db.conn.execute("SELECT count(*) FROM bodies").fetchone() == (1,)
+    assert db.search("same") is None
+
+
+def test_bodies_migrate_existing_db(legacy_db_file):
+    db = NotesDB(db_file=legacy_db_file)
+    db.add([Note("New", ["a"], ["kept body"])])
+
+    assert db.conn.execute("SELECT count(*) FROM bodies").fetchone() == (1,)
+    assert sorted(note.name for note in db.search("kept")) == ["New", "Old"]
+    assert db.get()[0].text == "kept body"
+    db.close()
+
+
+def test_interrupted_migration_is_rolled_back(legacy_db_file, monkeypatch):
+    def interrupt(content):
+        raise KeyboardInterrupt
+
+    # in the middle of the bodies backfill
+    monkeypatch.setattr("notesdb.inflate", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        NotesDB(db_file=legacy_db_file)
+    monkeypatch.undo()
+
+    conn = sqlite3.connect(legacy_db_file)
+    assert conn.execute("PRAGMA user_version").fetchone() == (4,)
+    assert "body_hash" not in [
+        row[1] for row in conn.execute("PRAGMA table_info(notes)")
+    ]
+    conn.close()
+    db = NotesDB(db_file=legacy_db_file)
+    assert db.search("kept")[0].text == "kept body"
+    db.close()
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("no code", []),
+        ("```Py\nx = 1\n```", [("python", 1, 2)]),
+        ("~~~~\n```\ninner\n~~~~\nafter", [("", 1, 3)]),
+        ("``` bash extra\nls", [("bash", 1, 2)]),
+        ("```inline``` only", []),
+    ],
+)
+def test_parse_code_blocks(text, expected):
+    assert parse_code_blocks(text) == expected
+
+
+def test_search_by_code_language(db):
+    db.add(
+        [
+            Note("Py", ["a"], ["Sorting:", "```python", "xs.sort()", "```"]),
+            Note("Sh", ["a"], ["```sh", "sort file", "```", "```py", "print()", "```"]),
+            Note("Text", ["a"], ["sort without code"]),
+        ]
+    )
+
+    assert [note.name for note in db.search("", lang="python")] == ["Py", "Sh"]
+    assert [note.name for note in db.search("", 1, lang="py")] == ["Sh"]
+    assert [note.name for note in db.search("sort", lang="bash")] == ["Sh"]
+    assert db.search("", lang="rust") is None
+
+    [sh] = db.search("file")
+    assert db.code_blocks(sh) == [("bash", "sort file"), ("python", "print()")]
+    assert db.code_blocks(sh, "python") == [("python", "print()")]
+    assert db.code_blocks(db.search("without")[0]) == []
+
+    # blocks go with the last note using the body
+    db.conn.execute("DELETE FROM notes WHERE title = 'Sh'")
+    assert db.conn.execute("SELECT count(*) FROM code_blocks").fetchone() == (1,)
+
+
+def test_code_blocks_migrate_existing_db(legacy_db_file):
+    conn = sqlite3.connect(legacy_db_file)
+    conn.execute(
+        "INSERT INTO notes (title, tags, content) VALUES ('Code', 'a', ?)",
+        ("```python\nimport os\n```",),
+    )
+    conn.commit()
+    conn.close()
+
+    db = NotesDB(db_file=legacy_db_file)
+    [note] = db.search("", lang="python")
+    assert db.code_blocks(note) == [("python", "import os")]
+    db.close()
+
+
+def test_query_results_are_cached_until_a_write(tmp_path, test_notes):
+    db_file = str(tmp_path / "notes.sqlite3")
+    db = NotesDB(db_file)
+    db.add(test_notes)
+    reader = NotesDB(db_file, readonly=True)
+
+    first = reader.search("note", n=2)
+    assert reader.search("  note ", 2) == first
+    assert reader.get() is not None and reader.get()[0] is reader.get()[0]
+
+    db.add([Note("Note4", ["tag3"], ["This is the fourth note."])])
+    assert [note.name for note in reader.search("fourth")] == ["Note4"]
+    assert len(reader.get()) == 4
+
+    # changes made outside NotesDB count too
+    db.conn.execute("DELETE FROM notes WHERE title = 'Note4'")
+    db.conn.commit()
+    assert len(db.get()) == 3
+    assert reader.search("fourth") is None
+    reader.close()
+    db.close()
+
+
+def test_query_results_are_cached_on_disk(tmp_path, test_notes):
+    db_file = str(tmp_path / "notes.sqlite3")
+    db = NotesDB(db_file)
+    db.add(test_notes)
+
+    reader = NotesDB(db_file, readonly=True, disk_cache=True)
+    assert [note.name for note in reader.search("second", brief=True)] == ["Note2"]
+    reader.close()
+    assert (tmp_path / "notes.cache.sqlite3").exists()
+
+    reader = NotesDB(db_file, readonly=True, disk_cache=True)
+    reader._iter_rows = None  # a query would fail now
+    [note] = reader.search("second", brief=True)
+    assert note.name == "Note2"
+    assert note.text == "This is the second note."
+    reader.close()
+
+    db.add([Note("Second", ["tag3"], ["Another second note."])])
+    reader = NotesDB(db_file, readonly=True, disk_cache=True)
+    assert len(reader.search("second")) == 2
+    reader.close()
+    db.close()
+
+
+def test_disk_cache_works_without_the_memory_cache(tmp_path, test_notes, monkeypatch):
+    monkeypatch.setitem(config.settings, "query_cache_size", "0")
+    db_file = str(tmp_path / "notes.sqlite3")
+    db = NotesDB(db_file, disk_cache=True)
+    db.add(test_notes)
+
+    assert [note.name for note in db.search("second", brief=True)] == ["Note2"]
+    assert not db._results
+    db._iter_rows = None  # a query would fail now
+    assert [note.name for note in db.search("second", brief=True)] == ["Note2"]
+    db.close()
+
+
+def test_notes_can_swap_contents(db):
+    db.add([Note("A", ["t"], ["body X"]), Note("B", ["t"], ["body Y"])])
+
+    swapped = [Note("A", ["t"], ["body Y"], id=1), Note("B", ["t"], ["body X"], id=2)]
+    assert db.update(swapped) == 2
+
+    assert [(note.id, note.text) for note in db.get()] == [
+        (1, "body Y"),
+        (2, "body X"),
+    ]
+    assert [note.id for note in db.search("X")] == [2]
+    assert db.conn.execute("SELECT count(*) FROM bodies").fetchone() == (2,)
+
+
+def test_update_and_delete_keep_indexes_consistent(db):
+    db.add(
+        [
+            Note("Keep", ["a"], ["```python", "shared = 1", "```"]),
+            Note("Edit", ["a", "b"], ["old words"]),
+            Note("Drop", ["b"], ["```python", "shared = 1", "```"]),
+        ]
+    )
+
+    edited = Note("Edited", ["c"], ["```sql", "new words", "```"], id=2)
+    assert db.update([edited]) == 1
+    assert db.search("old") is None
+    assert [note.name for note in db.search("new")] == ["Edited"]
+    assert [note.name for note in db.tagged(["c"])] == ["Edited"]
+    assert [note.name for note in db.tagged(["a"])] == ["Keep"]
+    assert [note.name for note in db.search("", lang="sql")] == ["Edited"]
+
+    assert db.delete([3, 42]) == 1
+    assert [note.name for note in db.tagged(["b"]) or []] == []
+    assert [note.name for note in db.search("", lang="python")] == ["Keep"]
+    assert db.conn.execute("SELECT count(*) FROM bodies").fetchone() == (2,)
+    assert db.conn.execute("SELECT count(*) FROM note_tags").fetchone() == (2,)
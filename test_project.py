@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+
 import pytest
 from unittest.mock import patch, MagicMock
 
@@ -55,6 +59,29 @@ def test_list_command_alias(monkeypatch):
     assert args.num == "5"
 
 
+def test_list_command_paging(monkeypatch):
+    test_args = ["sc", "list", "10", "--before-id", "500"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.num == "10"
+    assert args.before_id == 500
+    assert args.after_id is None
+
+
+def test_list_command_brief(monkeypatch):
+    test_args = ["sc", "l", "--brief"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.brief is True
+
+
+def test_list_command_pager(monkeypatch):
+    test_args = ["sc", "l", "-p"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.pager is True
+
+
 def test_search_command_without_query(monkeypatch):
     test_args = ["sc", "search"]
     monkeypatch.setattr("sys.argv", test_args)
@@ -79,6 +106,145 @@ def test_search_command_alias(monkeypatch):
     assert args.query == "tag1"
 
 
+def test_search_command_paging(monkeypatch):
+    test_args = ["sc", "s", "tag1", "-n", "5", "--after-id", "20"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.num == 5
+    assert args.after_id == 20
+    assert args.before_id is None
+
+
+def test_search_command_fuzzy(monkeypatch):
+    test_args = ["sc", "s", "--fuzzy", "asyncoi"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.fuzzy is True
+    assert args.query == "asyncoi"
+
+
+def test_search_command_code(monkeypatch):
+    test_args = ["sc", "s", "--lang", "python", "--code"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.query is None
+    assert args.lang == "python"
+    assert args.code is True
+
+
+def test_tag_command(monkeypatch):
+    test_args = ["sc", "tag", "python", "bash"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.mode == "tag"
+    assert args.tags == ["python", "bash"]
+    assert args.any is False
+
+
+def test_tag_command_any_alias(monkeypatch):
+    test_args = ["sc", "t", "--any", "python"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.mode == "t"
+    assert args.tags == ["python"]
+    assert args.any is True
+
+
+def test_import_command(monkeypatch):
+    test_args = ["sc", "import", "notes.jsonl", "--batch-size", "500"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.mode == "import"
+    assert args.path == "notes.jsonl"
+    assert args.batch_size == 500
+
+
+def test_serve_command(monkeypatch):
+    test_args = ["sc", "serve", "--socket", "/tmp/sc.sock"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.mode == "serve"
+    assert args.socket == "/tmp/sc.sock"
+
+
+def test_profile_flag(monkeypatch):
+    test_args = ["sc", "--profile", "list"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.profile is True
+    assert args.mode == "list"
+
+
+def test_db_option(monkeypatch):
+    test_args = ["sc", "--db", "team", "--db", "default", "search", "async"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.db == ["team", "default"]
+    assert args.mode == "search"
+
+
+def test_compact_and_dedupe_commands(monkeypatch):
+    for mode in ("compact", "dedupe"):
+        monkeypatch.setattr("sys.argv", ["sc", mode])
+        assert get_args().mode == mode
+
+
+def test_sync_command(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["sc", "sync", "notes/", "--watch", "--archive"])
+    args = get_args()
+    assert args.path == "notes/"
+    assert args.watch and args.archive
+    assert args.interval == 2.0
+
+
+def test_complete_command(monkeypatch):
+    test_args = ["sc", "complete", "search", "py"]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.mode == "complete"
+    assert args.context == "search"
+    assert args.prefix == "py"
+    assert args.shell is None
+
+
+def test_export_command(monkeypatch):
+    test_args = [
+        "sc",
+        "export",
+        "backup",
+        "--since",
+        "2024-06-01T02:00+02:00",
+        "-j",
+        "4",
+    ]
+    monkeypatch.setattr("sys.argv", test_args)
+    args = get_args()
+    assert args.mode == "export"
+    assert args.since == "2024-06-01 00:00:00"
+    assert args.jobs == 4
+    assert export_format(args) == "markdown"
+
+    monkeypatch.setattr("sys.argv", ["sc", "e", "--since-id", "9"])
+    args = get_args()
+    assert args.since_id == 9
+    assert export_format(args) == "jsonl"
+
+    monkeypatch.setattr("sys.argv", ["sc", "export", "-f", "markdown"])
+    with pytest.raises(SystemExit):
+        get_args()
+
+
+def test_similar_command(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["sc", "similar", "12", "-n", "3", "-b"])
+    args = get_args()
+    assert (args.mode, args.id, args.num, args.brief) == ("similar", 12, 3, True)
+    assert args.rebuild is False
+
+    monkeypatch.setattr("sys.argv", ["sc", "similar", "--rebuild"])
+    args = get_args()
+    assert (args.id, args.rebuild) == (None, True)
+
+
 # TESTING parse_tags()
 
 
@@ -110,3 +276,70 @@ def test_eof_input():
             result = eof_input()
 
     assert result == user_inputs
+
+
+# TESTING page_notes()
+
+
+def test_page_notes(monkeypatch, capfd):
+    monkeypatch.setenv("PAGER", "cat")
+    notes = [Note(f"note {i}", ["paged"], ["text"], id=i) for i in range(3)]
+
+    page_notes(notes, "No notes found.", brief=True)
+
+    assert capfd.readouterr().out.splitlines() == [
+        f"#{i}  note {i}  #paged" for i in range(3)
+    ]
+
+
+def test_page_notes_stops_when_pager_quits(monkeypatch, capfd):
+    monkeypatch.setenv("PAGER", "head -n 1")
+    read = []
+
+    def notes():
+        for i in range(100_000):
+            read.append(i)
+            yield Note(f"note {i}", ["paged"], ["text"], id=i)
+
+    page_notes(notes(), "No notes found.", brief=True)
+
+    assert capfd.readouterr().out == "#0  note 0  #paged\n"
+    assert len(read) < 100_000
+
+
+def test_page_notes_empty():
+    with pytest.raises(SystemExit, match="No notes found."):
+        page_notes([], "No notes found.")
+
+
+# TESTING startup
+
+
+# brief listings must not pay for importing rich or writing the config file
+def test_startup_is_lazy(tmp_path):
+    code = (
+        "import sys\n"
+        "before = len(sys.modules)\n"
+        "import project\n"
+        "print(len(sys.modules) - before)\n"
+        "sys.argv = ['sc', 'list', '--brief']\n"
+        "try:\n"
+        "    project.main()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(m for m in sys.modules if m.split('.')[0] == 'rich'))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, "HOME": str(tmp_path), "APPDATA": str(tmp_path)},
+        capture_output=True,
+        text=True,
+        timeout=30,
+    )
+
+    lines = result.stdout.strip().splitlines()
+    # about 50 now, an eager import of rich.console makes it over 150
+    assert int(lines[0]) < 120
+    assert lines[-1] == "[]"
+    assert not (tmp_path / ".config").exists()
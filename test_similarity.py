@@ -0,0 +1,117 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from note import Note
+from notesdb import NotesDB
+from similarity import SimilarityIndex, open_index
+
+
+@pytest.fixture
+def db(tmp_path):
+    db_instance = NotesDB(db_file=str(tmp_path / "notes.sqlite3"))
+    yield db_instance
+    db_instance.close()
+
+
+def corpus():
+    return [
+        Note(
+            "Retry", ["py"], ["retry the request with exponential backoff on timeout"]
+        ),
+        Note("Docker", ["ops"], ["docker build cache layers for faster images"]),
+        Note("Git", ["git"], ["git rebase interactive to squash commits"]),
+        Note("Backoff", ["py"], ["exponential backoff retry for a timeout request"]),
+    ]
+
+
+def test_similar_notes(db):
+    db.add(corpus())
+    index = open_index(db)
+
+    [(id, score), *_] = index.search("retry request timeout backoff", 4, exclude=1)
+    assert id == 4 and score > 0.5
+    assert [id for id, _ in index.search("squash commits with git", 1)] == [3]
+    assert index.search("zzzz qqqq") == []
+
+
+def test_add_updates_existing_index(db, monkeypatch):
+    db.add(corpus())
+    open_index(db)
+    db.add([Note("Images", ["ops"], ["smaller docker images with build cache"])])
+
+    index = SimilarityIndex(db.similar_index_path)
+    assert len(index.tail_ids) == 1
+    assert index.last_id == 5
+    assert index.search("docker images build cache", 2)[0][0] in (2, 5)
+
+    # a merge leaves the scores unchanged
+    before = index.search("docker images build cache", 5)
+    monkeypatch.setattr(SimilarityIndex, "MERGE_ROWS", 1)
+    index.save()
+    merged = SimilarityIndex(db.similar_index_path)
+    assert len(merged.tail_ids) == 0 and len(merged) == 5
+    after = merged.search("docker images build cache", 5)
+    assert [id for id, _ in after] == [id for id, _ in before]
+    assert np.allclose([s for _, s in after], [s for _, s in before], atol=0.05)
+
+
+def test_open_index_catches_up(db):
+    db.add(corpus()[:2])
+    assert len(open_index(db)) == 2
+
+    # notes added while the index could not be updated
+    os.rename(db.similar_index_path, db.similar_index_path + ".off")
+    db.add(corpus()[2:])
+    os.rename(db.similar_index_path + ".off", db.similar_index_path)
+
+    assert len(open_index(db)) == 4
+    assert len(SimilarityIndex(db.similar_index_path)) == 4
+
+
+def test_memory_db_has_no_index():
+    db = NotesDB(db_file=":memory:")
+    with pytest.raises(ValueError):
+        open_index(db)
+    db.close()
+
+
+def test_update_and_delete_update_index(db):
+    db.add(corpus())
+    index = open_index(db)
+    assert [id for id, _ in index.search("docker build cache", 1)] == [2]
+
+    db.update([Note("Docker", ["ops"], ["kubernetes pod scheduling"], id=2)])
+    db.delete([3])
+    for merged in (False, True):
+        index = SimilarityIndex(db.similar_index_path)
+        if merged:
+            index.merge()
+        assert [id for id, _ in index.search("kubernetes pod", 1)] == [2]
+        assert index.search("docker build cache") == []
+        assert index.search("git rebase squash") == []
+
+
+def test_writers_reload_the_index_under_its_lock(db):
+    db.add(corpus()[:2])
+    open_index(db)
+
+    # loaded by one writer before another writer saved
+    stale = SimilarityIndex(db.similar_index_path)
+    db.add([corpus()[2]])
+    with stale.locked():
+        stale.add([Note("Later", ["py"], ["saved by the slower writer"], id=4)])
+        stale.save()
+
+    assert sorted(SimilarityIndex(db.similar_index_path).tail_ids) == [3, 4]
+
+
+def test_rebuild_reindexes_lost_notes(db):
+    db.add(corpus())
+    open_index(db)
+    os.unlink(os.path.join(db.similar_index_path, "main.npz"))
+
+    assert open_index(db, rebuild=True).search("git rebase squash", 1)[0][0] == 3
+    assert len(SimilarityIndex(db.similar_index_path)) == 4
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+from notesdb import NotesDB
+from sync import *
+
+
+@pytest.fixture
+def db():
+    db_instance = NotesDB(db_file=":memory:")
+    yield db_instance
+    db_instance.close()
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_scan_skips_hidden_and_other_files(tmp_path):
+    write(tmp_path / "a.md", "a")
+    write(tmp_path / "sub" / "b.markdown", "b")
+    write(tmp_path / "notes.txt", "c")
+    write(tmp_path / ".git" / "d.md", "d")
+
+    assert sorted(path for path, _ in scan(str(tmp_path))) == ["a.md", "sub/b.markdown"]
+
+
+def test_sync_dir_applies_only_changes(db, tmp_path):
+    write(tmp_path / "a.md", "---\nname: Alpha\ntags: x\n---\nfirst")
+    write(tmp_path / "sub" / "b.md", "second")
+    write(tmp_path / "c.md", "third")
+
+    assert sync_dir(db, str(tmp_path)) == (3, 0, 0)
+    assert sync_dir(db, str(tmp_path)) == (0, 0, 0)
+    assert [note.name for note in db.search("first")] == ["Alpha"]
+    [b] = db.search("second")
+
+    write(tmp_path / "sub" / "b.md", "second, edited")
+    os.utime(tmp_path / "c.md", ns=(0, 0))
+    os.unlink(tmp_path / "a.md")
+    write(tmp_path / "d.md", "fourth")
+    write(tmp_path / "empty.md", "\n")
+
+    assert sync_dir(db, str(tmp_path)) == (1, 1, 1)
+    assert sorted(note.name for note in db.get()) == ["b", "c", "d"]
+    assert [note.id for note in db.search("edited")] == [b.id]
+    assert db.search("first") is None
+    assert sync_dir(db, str(tmp_path)) == (0, 0, 0)
+
+
+def test_sync_dir_archives_removed_files(db, tmp_path):
+    write(tmp_path / "a.md", "first")
+    sync_dir(db, str(tmp_path))
+    os.unlink(tmp_path / "a.md")
+
+    assert sync_dir(db, str(tmp_path), archive=True) == (0, 0, 1)
+    [note] = db.get()
+    assert note.tags == ["archived", "imported"]
+    assert db.manifest(str(tmp_path)) == {}
+
+
+def test_deleted_note_is_synced_again(db, tmp_path):
+    write(tmp_path / "a.md", "first")
+    sync_dir(db, str(tmp_path))
+    db.delete([1])
+
+    assert sync_dir(db, str(tmp_path)) == (1, 0, 0)
+    assert [note.text for note in db.get()] == ["first"]
+
+
+def test_files_can_swap_contents(db, tmp_path):
+    write(tmp_path / "a.md", "alpha text")
+    write(tmp_path / "b.md", "beta text")
+    sync_dir(db, str(tmp_path))
+
+    write(tmp_path / "a.md", "beta text")
+    write(tmp_path / "b.md", "alpha text")
+    os.utime(tmp_path / "a.md", ns=(0, 0))
+    os.utime(tmp_path / "b.md", ns=(0, 0))
+
+    assert sync_dir(db, str(tmp_path)) == (0, 2, 0)
+    assert sorted((note.name, note.text) for note in db.get()) == [
+        ("a", "beta text"),
+        ("b", "alpha text"),
+    ]
+    assert [note.name for note in db.search("alpha")] == ["b"]
@@ -0,0 +1,60 @@
+import io
+import json
+
+import pytest
+import tracing
+from notesdb import NotesDB
+from note import Note
+
+
+@pytest.fixture
+def trace(monkeypatch):
+    monkeypatch.setattr(tracing, "mode", None)
+    monkeypatch.setattr(tracing, "phases", {})
+    return tracing
+
+
+def test_disabled_records_nothing(trace):
+    with trace.span("phase") as span:
+        span.rows = 3
+
+    assert span is trace.NULL_SPAN
+    assert trace.phases == {}
+
+
+def test_spans_add_up_by_name(trace):
+    trace.enable()
+    for rows in (2, 3):
+        with trace.span("phase") as span:
+            span.rows = rows
+
+    calls, seconds, rows = trace.phases["phase"]
+    assert (calls, rows) == (2, 5)
+    assert seconds >= 0
+
+    out = io.StringIO()
+    trace.report(out)
+    lines = out.getvalue().splitlines()
+    assert lines[1].split()[:3] == ["phase", "2", "5"]
+    assert lines[-1].startswith("total")
+
+
+def test_json_lines(trace, capsys):
+    trace.enable("json")
+    trace.record("db.query", 0.5, 7)
+
+    line = json.loads(capsys.readouterr().err)
+    assert line == {"phase": "db.query", "ms": 500.0, "rows": 7}
+
+
+def test_notesdb_phases(trace):
+    trace.enable()
+    db = NotesDB(db_file=":memory:")
+    db.add([Note(name="Note1", tags=["tag1"], content=["body"])])
+    assert len(db.get()) == 1
+    db.close()
+
+    assert {"db.connect", "db.migrate", "db.add", "db.query", "db.fetch"} <= set(
+        trace.phases
+    )
+    assert trace.phases["note.from_sql"][2] == 1
@@ -0,0 +1,118 @@
+import json
+import os
+
+import pytest
+from note import Note
+from notesdb import NotesDB
+from transfer import *
+
+
+@pytest.fixture
+def db():
+    db_instance = NotesDB(db_file=":memory:")
+    yield db_instance
+    db_instance.close()
+
+
+@pytest.mark.parametrize(
+    "text, expected_meta, expected_body",
+    [
+        ("---\nname: A\ntags: x, y\n---\nbody", {"name": "A", "tags": "x, y"}, "body"),
+        ("no front matter", {}, "no front matter"),
+        ("---\nname: A\nunterminated", {}, "---\nname: A\nunterminated"),
+    ],
+)
+def test_parse_front_matter(text, expected_meta, expected_body):
+    assert parse_front_matter(text) == (expected_meta, expected_body)
+
+
+def test_read_markdown_dir(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.md").write_text("---\nname: First\ntags: [py, #bash]\n---\n# Hi\n")
+    (tmp_path / "sub" / "b.markdown").write_text("untagged body\n")
+    (tmp_path / "empty.md").write_text("---\nname: Empty\n---\n\n")
+    (tmp_path / "skip.txt").write_text("not markdown")
+    (tmp_path / "latin1.md").write_bytes("caf\xe9\n".encode("latin-1"))
+
+    notes = list(read_notes(str(tmp_path)))
+
+    assert [note.name for note in notes] == ["First", "b"]
+    assert notes[0].tags == ["bash", "py"]
+    assert notes[0].content == ["# Hi"]
+    assert notes[1].tags == [DEFAULT_TAG]
+
+
+def test_read_jsonl(tmp_path):
+    path = tmp_path / "notes.jsonl"
+    lines = [
+        json.dumps({"name": "One", "tags": ["a"], "content": "x\ny"}),
+        "",
+        "not json",
+        json.dumps({"title": "Two", "tags": "b c", "content": ["z"]}),
+        json.dumps({"name": "", "tags": ["a"], "content": "x"}),
+        json.dumps({"name": "Number", "tags": ["a"], "content": 123}),
+        json.dumps({"name": "Lines", "tags": ["a"], "content": ["x", 1]}),
+        json.dumps({"name": "Tags", "tags": 5, "content": "x"}),
+        json.dumps({"name": ["List"], "tags": ["a"], "content": "x"}),
+        json.dumps({"name": "caf\xe9", "tags": ["a"], "content": "x"}),
+    ]
+    data = "\n".join(lines).encode()
+    path.write_bytes(data.replace("caf\\u00e9".encode(), "caf\xe9".encode("latin-1")))
+
+    notes = list(read_notes(str(path)))
+
+    assert [note.name for note in notes] == ["One", "Two"]
+    assert notes[0].content == ["x", "y"]
+    assert notes[1].tags == ["b", "c"]
+
+
+def test_import_batches(db, tmp_path):
+    path = tmp_path / "notes.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps({"name": f"Note{i}", "tags": ["bulk"], "content": f"body {i}"})
+            for i in range(25)
+        )
+    )
+
+    assert db.add(read_notes(str(path)), batch_size=10) == 25
+    notes = db.get()
+    assert [note.id for note in notes] == list(range(1, 26))
+    assert len(db.tagged(["bulk"])) == 25
+
+
+@pytest.mark.parametrize("fmt, jobs", [("jsonl", 1), ("markdown", 1), ("markdown", 3)])
+def test_export_round_trips(db, tmp_path, fmt, jobs):
+    db.add(
+        [
+            Note("Async: retries", ["py", "net"], ["```python", "await x()", "```"]),
+            Note("Find files", ["bash"], ["find . -name '*.py'"]),
+        ]
+    )
+    path = str(tmp_path / ("notes.jsonl" if fmt == "jsonl" else "notes"))
+
+    if fmt == "jsonl":
+        assert write_jsonl(db.iter_since(), path) == (2, 2)
+    else:
+        assert write_markdown_dir(db.iter_since(), path, jobs) == (2, 2)
+        assert sorted(os.listdir(path)) == ["1-async-retries.md", "2-find-files.md"]
+
+    notes = list(read_notes(path))
+    assert [(note.name, note.tags, note.text) for note in notes] == [
+        (note.name, note.tags, note.text) for note in db.get()
+    ]
+
+
+def test_incremental_export(db, tmp_path):
+    db.add([Note(f"Note{i}", ["t"], [f"body {i}"]) for i in range(5)])
+    db.conn.execute("UPDATE notes SET created_at = '2024-01-0' || id || ' 12:00:00'")
+    db.conn.commit()
+
+    assert [note.id for note in db.iter_since(after_id=3)] == [4, 5]
+    assert [note.id for note in db.iter_since(since="2024-01-02 12:00:00")] == [
+        2,
+        3,
+        4,
+        5,
+    ]
+    assert [note.id for note in db.iter_since(2, "2024-01-04")] == [4, 5]
@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+import time
+from typing import Optional, TextIO
+
+# when this module was first imported, which is the first thing `sc` does
+START = time.perf_counter()
+
+# "table" prints a summary when `report` is called, "json" emits one JSON line
+# per finished span as it happens; None (the default) disables tracing
+mode: Optional[str] = None
+phases: dict[str, list] = {}
+
+
+class Span:
+    """Times one phase and counts the rows it handled
+
+    Spans with the same name add up, so a phase run once per fetched chunk
+    is reported as one total.
+
+    Attributes:
+        name (str): The phase name
+        rows (int): The number of rows handled, set by the caller
+    """
+
+    __slots__ = ("name", "rows", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.rows = 0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        record(self.name, time.perf_counter() - self.start, self.rows)
+
+
+class NullSpan:
+    """The span handed out while tracing is off: does nothing, records nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+    @property
+    def rows(self) -> int:
+        return 0
+
+    @rows.setter
+    def rows(self, rows: int) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def enable(fmt: str = "table") -> None:
+    """Turn tracing on
+
+    Args:
+        fmt (str): "table" for a summary at the end, "json" for JSON lines
+    """
+
+    global mode
+    mode = "json" if fmt == "json" else "table"
+
+
+def span(name: str) -> "Span | NullSpan":
+    """Time a phase: `with tracing.span("db.query") as s: ...; s.rows = n`
+
+    Args:
+        name (str): The phase name
+
+    Returns:
+        Span | NullSpan: The span, or a shared no-op span when tracing is off
+    """
+
+    return Span(name) if mode else NULL_SPAN
+
+
+def record(name: str, seconds: float, rows: int = 0) -> None:
+    """Add a measurement to a phase
+
+    Args:
+        name (str): The phase name
+        seconds (float): The wall time spent
+        rows (int): The number of rows handled
+    """
+
+    if not mode:
+        return
+    totals = phases.setdefault(name, [0, 0.0, 0])
+    totals[0] += 1
+    totals[1] += seconds
+    totals[2] += rows
+    if mode == "json":
+        line = {"phase": name, "ms": round(seconds * 1000, 3), "rows": rows}
+        sys.stderr.write(json.dumps(line) + "\n")
+
+
+def report(file: Optional[TextIO] = None) -> None:
+    """Print the per-phase summary table, when tracing in table mode
+
+    Args:
+        file (Optional[TextIO]): Where to print, defaults to stderr
+    """
+
+    if mode != "table" or not phases:
+        return
+    file = file or sys.stderr
+    file.write(f"{'phase':<20} {'calls':>7} {'rows':>9} {'ms':>10}\n")
+    for name, (calls, seconds, rows) in phases.items():
+        file.write(f"{name:<20} {calls:>7} {rows:>9} {seconds * 1000:>10.2f}\n")
+    total = (time.perf_counter() - START) * 1000
+    file.write(f"{'total':<20} {'':>7} {'':>9} {total:>10.2f}\n")
+
+
+if os.environ.get("SC_TRACE", "0") not in ("", "0"):
+    enable(os.environ["SC_TRACE"])
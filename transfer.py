@@ -0,0 +1,292 @@
+import json
+import os
+import re
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, Optional
+
+from note import Note, parse_tags
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+DEFAULT_TAG = "imported"
+
+
+def parse_front_matter(text: str) -> tuple[dict[str, str], str]:
+    """Split a markdown document into its front-matter fields and body
+
+    Only flat `key: value` front-matter is understood, which is all a note
+    needs (name and tags).
+
+    Args:
+        text (str): The markdown document
+
+    Returns:
+        tuple[dict[str, str], str]: The front-matter fields and the remaining body
+    """
+
+    lines = text.split("\n")
+    if not lines or lines[0].strip() != "---":
+        return {}, text
+
+    meta = {}
+    for i, line in enumerate(lines[1:], start=1):
+        if line.strip() == "---":
+            return meta, "\n".join(lines[i + 1 :])
+        key, sep, value = line.partition(":")
+        if sep:
+            meta[key.strip().lower()] = value.strip()
+
+    # no closing fence, so it was never front-matter
+    return {}, text
+
+
+def note_from_fields(
+    name: Optional[str], tags: object, content: object
+) -> Optional[Note]:
+    """Build a Note from loosely typed import fields
+
+    Args:
+        name (Optional[str]): The name of the note
+        tags (object): The tags, as a list or a tag string like "#py, #bash"
+        content (object): The content, as a list of lines or a single string
+
+    Returns:
+        Note: A new Note, or None if the fields do not make a valid note
+    """
+
+    if not isinstance(name, str):
+        return None
+    if isinstance(tags, str):
+        tags = parse_tags(tags.strip("[]"))
+    elif not isinstance(tags, (list, type(None))):
+        return None
+    tags = [str(tag).strip(" #") for tag in tags or []]
+    tags = [tag for tag in tags if tag] or [DEFAULT_TAG]
+    if isinstance(content, str):
+        content = content.split("\n")
+    elif not isinstance(content, (list, type(None))) or not all(
+        isinstance(line, str) for line in content or []
+    ):
+        return None
+
+    try:
+        return Note(name, tags, list(content or []))
+    except (TypeError, ValueError):
+        return None
+
+
+def read_markdown_file(path: str) -> Optional[Note]:
+    """Read a single markdown file as a Note
+
+    The name and tags come from the `name`/`title` and `tags` front-matter
+    fields; the name falls back to the file name.
+
+    Args:
+        path (str): The path to the markdown file
+
+    Returns:
+        Note: The note, or None if the file does not make a valid note
+    """
+
+    with open(path, encoding="utf-8") as f:
+        try:
+            return note_from_markdown(f.read(), path)
+        except UnicodeDecodeError:
+            return None
+
+
+def note_from_markdown(text: str, path: str) -> Optional[Note]:
+    """Build a Note from the text of a markdown file, see `read_markdown_file`
+
+    Args:
+        text (str): The markdown document
+        path (str): The path of the file, for the fallback name
+
+    Returns:
+        Note: The note, or None if the text does not make a valid note
+    """
+
+    meta, body = parse_front_matter(text)
+    name = meta.get("name") or meta.get("title")
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    return note_from_fields(name, meta.get("tags"), body.strip("\n"))
+
+
+def read_markdown_dir(path: str) -> Iterator[Note]:
+    """Stream notes from every markdown file below a directory
+
+    Files are visited in sorted order so repeated imports are deterministic.
+    Files that do not make a valid note are skipped.
+
+    Args:
+        path (str): The directory to read
+
+    Yields:
+        Note: The notes read from the directory
+    """
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.lower().endswith(MARKDOWN_EXTENSIONS):
+                note = read_markdown_file(os.path.join(root, file))
+                if note is not None:
+                    yield note
+
+
+def read_jsonl(path: str) -> Iterator[Note]:
+    """Stream notes from a JSONL file, one JSON object per line
+
+    Each object has a `name` (or `title`), `tags` and `content`. Lines that
+    do not make a valid note are skipped.
+
+    Args:
+        path (str): The JSONL file to read
+
+    Yields:
+        Note: The notes read from the file
+    """
+
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                continue
+            if not isinstance(obj, dict):
+                continue
+            note = note_from_fields(
+                obj.get("name") or obj.get("title"),
+                obj.get("tags"),
+                obj.get("content"),
+            )
+            if note is not None:
+                yield note
+
+
+def read_notes(path: str) -> Iterator[Note]:
+    """Stream notes from a markdown directory or a JSONL file
+
+    Args:
+        path (str): A directory of markdown files, a markdown file, or a JSONL file
+
+    Yields:
+        Note: The notes read from path
+    """
+
+    if os.path.isdir(path):
+        yield from read_markdown_dir(path)
+    elif path.lower().endswith(MARKDOWN_EXTENSIONS):
+        note = read_markdown_file(path)
+        if note is not None:
+            yield note
+    else:
+        yield from read_jsonl(path)
+
+
+def note_to_markdown(note: Note) -> str:
+    """A note as a markdown document with front-matter, as `read_markdown_file` reads
+
+    Args:
+        note (Note): The note
+
+    Returns:
+        str: The markdown document
+    """
+
+    meta = [f"name: {note.name}", f"tags: {', '.join(note.tags)}", f"id: {note.id}"]
+    if note.created_at:
+        meta.append(f"created_at: {note.created_at}")
+    return "---\n" + "\n".join(meta) + "\n---\n" + note.text + "\n"
+
+
+def markdown_file_name(note: Note) -> str:
+    """The file name of an exported note: its id and a slug of its name
+
+    Args:
+        note (Note): The note
+
+    Returns:
+        str: The file name, unique per id
+    """
+
+    slug = re.sub(r"[^\w-]+", "-", note.name.lower()).strip("-")[:60]
+    return f"{note.id}-{slug or 'note'}.md"
+
+
+def write_jsonl(notes: Iterable[Note], path: str) -> tuple[int, int]:
+    """Stream notes to a JSONL file, one object per line, as `read_jsonl` reads
+
+    Args:
+        notes (Iterable[Note]): The notes to write
+        path (str): The file to write, or "-" for stdout
+
+    Returns:
+        tuple[int, int]: The number of notes written and the highest id among them
+    """
+
+    count = last_id = 0
+    f = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+    try:
+        for note in notes:
+            f.write(json.dumps(note.to_dict(), ensure_ascii=False) + "\n")
+            count += 1
+            last_id = max(last_id, note.id)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count, last_id
+
+
+def write_markdown_dir(
+    notes: Iterable[Note], path: str, jobs: int = 1
+) -> tuple[int, int]:
+    """Stream notes to a directory of markdown files, one per note
+
+    Documents are built on the calling thread, which owns the DB cursor, and
+    written by `jobs` threads. At most a few documents per thread are held
+    in memory at once.
+
+    Args:
+        notes (Iterable[Note]): The notes to write
+        path (str): The directory, created if needed
+        jobs (int): The number of files written in parallel
+
+    Returns:
+        tuple[int, int]: The number of notes written and the highest id among them
+    """
+
+    os.makedirs(path, exist_ok=True)
+    count = last_id = 0
+    if jobs <= 1:
+        for note in notes:
+            write_file(
+                os.path.join(path, markdown_file_name(note)), note_to_markdown(note)
+            )
+            count += 1
+            last_id = max(last_id, note.id)
+        return count, last_id
+
+    pending: set[Future] = set()
+    with ThreadPoolExecutor(jobs) as executor:
+        for note in notes:
+            if len(pending) >= jobs * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            file = os.path.join(path, markdown_file_name(note))
+            pending.add(executor.submit(write_file, file, note_to_markdown(note)))
+            count += 1
+            last_id = max(last_id, note.id)
+        for future in pending:
+            future.result()
+    return count, last_id
+
+
+def write_file(path: str, text: str) -> None:
+    """Write a text file, replacing it if it exists"""
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)